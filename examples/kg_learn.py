@@ -1,9 +1,10 @@
 # Copyright (c) 2021 OpenKS Authors, DCD Research Lab, Zhejiang University. 
 # All Rights Reserved.
 
-import os, argparse
+import os, argparse, json
 from openks.loaders import loader_config, SourceType, FileType, GraphLoader
 from openks.models import OpenKSModel
+from openks.abstract import MTG
 from py2neo import Graph
 
 
@@ -22,6 +23,26 @@ def parse_args(args=None):
 	parser.add_argument('--split_ratio', default=0.05, type=float)
 	parser.add_argument('-de', '--double_entity_embedding', action='store_true')
 	parser.add_argument('-dr', '--double_relation_embedding', action='store_true')
+	parser.add_argument('--sparse_embedding', action='store_true', help='sparse entity embedding gradients with a row-wise optimizer')
+	parser.add_argument('--sparse_optimizer', default='sparse_adam', type=str, help='sparse_adam, adagrad or sgd')
+	parser.add_argument('--neg_chunk_size', default=0, type=int, help='positives per chunk sharing one negative set, 0 gives every positive its own negatives')
+	parser.add_argument('--num_processes', default=1, type=int, help='Hogwild training processes sharing the model on CPU')
+	parser.add_argument('--num_partitions', default=1, type=int, help='entity partitions kept on disk for out-of-core training, 1 keeps the whole table in memory')
+	parser.add_argument('--relation_batches', action='store_true', help='batches of a single relation, applies TransH/TransR projections once per batch')
+	parser.add_argument('--num_workers', default=None, type=int, help='data loading worker processes shared by both corruption modes, defaults to cpu_num // 2')
+	parser.add_argument('--train_file', default=None, type=str, help='binary (n, 3) int64 triple file (raw or .npy) streamed from disk as training triples instead of the graph triples')
+	parser.add_argument('--stream_block_rows', default=1 << 20, type=int, help='triples read from train_file at a time')
+	parser.add_argument('--shuffle_buffer_rows', default=1 << 22, type=int, help='triples shuffled together when streaming train_file')
+	parser.add_argument('--async_checkpoint', action='store_true', help='write checkpoints from a background thread, training only waits for an in-memory snapshot')
+	parser.add_argument('--keep_checkpoints', default=3, type=int, help='checkpoints kept with --async_checkpoint')
+	parser.add_argument('--delta_checkpoint', action='store_true', help='with --async_checkpoint, store only the rows changed since the previous checkpoint')
+	parser.add_argument('--autotune', action='store_true', help='run timed trials over batch_size, negative_sample_size, num_workers and num_threads instead of training, the best ones are written to <save_path>/autotune.json')
+	parser.add_argument('--autotune_space', default=None, type=str, help='JSON search space of --autotune, e.g. {"batch_size": [512, 1024], "num_threads": [4, 8]}')
+	parser.add_argument('--memory_budget_mb', default=None, type=float, help='peak memory allowed to an --autotune configuration')
+	parser.add_argument('--args_file', default=None, type=str, help='JSON args merged into the configuration, e.g. the autotune.json written by --autotune')
+	parser.add_argument('--prefetch_batches', default=None, type=int, help='ready training batches kept ahead of the trainer, defaults to 2 per worker')
+	parser.add_argument('--profile', nargs='?', const=True, default=None, help='time the data, forward, backward, optimizer, eval and checkpoint phases of every step and write profile.json and the Chrome trace trace.json to the given directory, save_path without one')
+	parser.add_argument('--snapshot', default=None, type=str, help='binary graph snapshot to load, written after parsing if it does not exist yet')
 
 	return parser.parse_args(args)
 
@@ -35,6 +56,7 @@ loader_config.file_type = FileType.OPENKS
 # loader_config.source_type = SourceType.NEO4J
 # graph_db = Graph(host='127.0.0.1', http_port=7474, user='neo4j', password='123456')
 # loader_config.graph_db = graph_db
+# loader_config.page_size = 100000
 # loader_config.source_uris = 'openks/data/company-kg'
 # dataset_name = 'FB15k-237'
 dataset_name = args_from_parse.dataset
@@ -42,8 +64,13 @@ loader_config.source_uris = 'openks/data/'+dataset_name
 # loader_config.source_uris = 'openks/data/medical-kg'
 loader_config.data_name = 'my-data-set'
 # 图谱数据结构载入
-graph_loader = GraphLoader(loader_config)
-graph = graph_loader.graph
+if args_from_parse.snapshot and os.path.exists(args_from_parse.snapshot):
+	graph = MTG.load_snapshot(args_from_parse.snapshot)
+else:
+	graph_loader = GraphLoader(loader_config)
+	graph = graph_loader.graph
+	if args_from_parse.snapshot:
+		graph.save_snapshot(args_from_parse.snapshot)
 graph.info_display()
 ''' 图谱表示学习模型训练 '''
 # 列出已加载模型
@@ -64,6 +91,7 @@ args = {
 	'gamma': 24.0,
 	'epsilon': 2.0,
 	'negative_sample_size': 256,
+	'negative_sampling': 'uniform',  # uniform, degree or type
 	'negative_adversarial_sampling': True,
 	'adversarial_temperature': 1.0,
 	'cpu_num': 10,
@@ -91,6 +119,36 @@ args['double_relation_embedding'] = args_from_parse.double_relation_embedding
 args['random_split'] = args_from_parse.random_split
 args['split_ratio'] = args_from_parse.split_ratio
 args['test_batch_size'] = args_from_parse.test_batch_size
+args['sparse_embedding'] = args_from_parse.sparse_embedding
+args['sparse_optimizer'] = args_from_parse.sparse_optimizer
+args['neg_chunk_size'] = args_from_parse.neg_chunk_size
+args['num_processes'] = args_from_parse.num_processes
+args['num_partitions'] = args_from_parse.num_partitions
+args['relation_batches'] = args_from_parse.relation_batches
+if args_from_parse.train_file:
+	args['train_file'] = args_from_parse.train_file
+	args['stream_block_rows'] = args_from_parse.stream_block_rows
+	args['shuffle_buffer_rows'] = args_from_parse.shuffle_buffer_rows
+args['async_checkpoint'] = args_from_parse.async_checkpoint
+args['keep_checkpoints'] = args_from_parse.keep_checkpoints
+args['delta_checkpoint'] = args_from_parse.delta_checkpoint
+if args_from_parse.num_workers is not None:
+	args['num_workers'] = args_from_parse.num_workers
+if args_from_parse.prefetch_batches is not None:
+	args['prefetch_batches'] = args_from_parse.prefetch_batches
+args['autotune'] = args_from_parse.autotune
+if args_from_parse.profile:
+	args['profile'] = args_from_parse.profile
+if args_from_parse.autotune_space:
+	args['autotune_space'] = json.loads(args_from_parse.autotune_space)
+if args_from_parse.memory_budget_mb:
+	args['memory_budget_mb'] = args_from_parse.memory_budget_mb
+if args_from_parse.args_file:
+	with open(args_from_parse.args_file) as f:
+		tuned = json.load(f)
+	args.update(tuned.get('best', tuned))
+# number of entities scored at once during evaluation, bounds memory to test_batch_size * eval_chunk_size * hidden_dim
+args['eval_chunk_size'] = 2048
 if not os.path.exists(args['save_path']):
 	os.makedirs(args['save_path'])
 print("根据配置，使用 {} 框架，{} 执行器训练 {} 模型。".format(platform, executor, model))
@@ -5,4 +5,8 @@
 init
 """
 from .mmd import *
-from .mtg import *
\ No newline at end of file
+from .mtg import *
+from .columnar import *
+from .snapshot import *
+from .graph_index import *
+from .triple_stream import *
\ No newline at end of file
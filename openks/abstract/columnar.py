@@ -0,0 +1,260 @@
+# Copyright (c) 2021 OpenKS Authors, DCD Research Lab, Zhejiang University.
+# All Rights Reserved.
+
+"""
+Array-backed columns and lazy tuple views used by the columnar storage modes of MMD and MTG
+"""
+from collections.abc import Sequence
+from typing import List, Tuple
+import numpy as np
+
+
+def encode_strings(values, vocab: List = None) -> Tuple[np.ndarray, List]:
+	"""
+	dictionary-encode an iterable of strings into int32 codes
+	codes follow the order of the given vocab, unseen strings are appended to it
+	"""
+	vocab = list(vocab) if vocab else []
+	index = {item: i for i, item in enumerate(vocab)}
+	codes = []
+	for value in values:
+		code = index.get(value)
+		if code is None:
+			code = len(vocab)
+			index[value] = code
+			vocab.append(value)
+		codes.append(code)
+	return np.array(codes, dtype=np.int32), vocab
+
+
+class StringColumn(object):
+	"""
+	A column of variable-length strings packed into one utf-8 byte buffer.
+	offsets: int64 array of length n+1, row i is data[offsets[i]:offsets[i+1]]
+	nulls: optional bool array of length n marking missing values
+	"""
+	def __init__(self, offsets: np.ndarray, data: np.ndarray, nulls: np.ndarray = None) -> None:
+		self.offsets = offsets
+		self.data = data
+		self.nulls = nulls
+
+	@classmethod
+	def from_list(cls, values) -> 'StringColumn':
+		encoded = []
+		nulls = []
+		for value in values:
+			nulls.append(value is None)
+			encoded.append(b'' if value is None else str(value).encode('utf-8'))
+		offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+		np.cumsum([len(item) for item in encoded], out=offsets[1:])
+		data = np.frombuffer(b''.join(encoded), dtype=np.uint8)
+		nulls = np.array(nulls, dtype=bool)
+		return cls(offsets, data, nulls if nulls.any() else None)
+
+	@classmethod
+	def concat(cls, columns: List['StringColumn']) -> 'StringColumn':
+		""" join columns end to end into one column """
+		if len(columns) == 1:
+			return columns[0]
+		offsets = [np.zeros(1, dtype=np.int64)]
+		base = 0
+		for col in columns:
+			offsets.append(col.offsets[1:] - col.offsets[0] + base)
+			base += int(col.offsets[-1] - col.offsets[0])
+		data = np.concatenate([col.data[col.offsets[0]:col.offsets[-1]] for col in columns] or [np.zeros(0, dtype=np.uint8)])
+		nulls = None
+		if any(col.nulls is not None for col in columns):
+			nulls = np.concatenate([col.nulls if col.nulls is not None else np.zeros(len(col), dtype=bool) for col in columns])
+		return cls(np.concatenate(offsets), data, nulls)
+
+	def __len__(self) -> int:
+		return len(self.offsets) - 1
+
+	def __getitem__(self, index):
+		if isinstance(index, slice):
+			return [self[i] for i in range(*index.indices(len(self)))]
+		if index < 0:
+			index += len(self)
+		if not 0 <= index < len(self):
+			raise IndexError('StringColumn index out of range')
+		if self.nulls is not None and self.nulls[index]:
+			return None
+		return bytes(self.data[self.offsets[index]:self.offsets[index+1]]).decode('utf-8')
+
+	def __iter__(self):
+		for i in range(len(self)):
+			yield self[i]
+
+	def tolist(self) -> List:
+		return list(self)
+
+
+class EntityView(Sequence):
+	"""
+	Read-only legacy view over columnar entities, yields ( <entity_id>, <entity_type>, (<entity_attr1>, ...) ) tuples on access
+	"""
+	def __init__(self, graph) -> None:
+		self._graph = graph
+
+	def __len__(self) -> int:
+		return len(self._graph.entity_ids)
+
+	def __getitem__(self, index):
+		if isinstance(index, slice):
+			return [self[i] for i in range(*index.indices(len(self)))]
+		graph = self._graph
+		attrs = tuple(col[index] for col in graph.entity_attrs)
+		while attrs and attrs[-1] is None:
+			attrs = attrs[:-1]
+		return (int(graph.entity_ids[index]), graph.entity_type_vocab[graph.entity_types[index]], attrs)
+
+
+class TripleView(Sequence):
+	"""
+	Read-only legacy view over columnar triples, yields ( ( <head_id>, <relation_type>, <tail_id> ), (<relation_attr1>, ...) ) tuples on access
+	"""
+	def __init__(self, graph) -> None:
+		self._graph = graph
+
+	def __len__(self) -> int:
+		return len(self._graph.triple_ids)
+
+	def __getitem__(self, index):
+		if isinstance(index, slice):
+			return [self[i] for i in range(*index.indices(len(self)))]
+		graph = self._graph
+		head, rel, tail = graph.triple_ids[index]
+		attrs = tuple(col[index] for col in graph.triple_attrs)
+		while attrs and attrs[-1] is None:
+			attrs = attrs[:-1]
+		return ((int(head), graph.relation_vocab[rel], int(tail)), attrs)
+
+
+def rows_to_string_columns(rows, start: int) -> List[StringColumn]:
+	""" pack the fields of each row from position start onwards into StringColumns, short rows get nulls """
+	width = max([len(row) for row in rows] or [start]) - start
+	return [StringColumn.from_list(row[start+i] if start+i < len(row) else None for row in rows) for i in range(width)]
+
+
+def concat_string_columns(chunks: List[List[StringColumn]], lengths: List[int]) -> List[StringColumn]:
+	""" join per-chunk attribute columns, chunks narrower than the widest one are padded with null columns """
+	width = max([len(columns) for columns in chunks] or [0])
+	res = []
+	for i in range(width):
+		parts = []
+		for columns, length in zip(chunks, lengths):
+			if i < len(columns):
+				parts.append(columns[i])
+			else:
+				parts.append(StringColumn(np.zeros(length + 1, dtype=np.int64), np.zeros(0, dtype=np.uint8), np.ones(length, dtype=bool)))
+		res.append(StringColumn.concat(parts))
+	return res
+
+
+class ColumnTable(object):
+	"""
+	A row-addressable table stored column by column, suited to wide and sparse records.
+	Each column keeps the sorted int64 row numbers and the values of its present cells only,
+	missing cells are reported through null masks and read back as None.
+	"""
+	def __init__(self, headers: List, column_rows: List[np.ndarray], column_values: List[List], num_rows: int) -> None:
+		self.headers = list(headers)
+		self.column_rows = column_rows
+		self.column_values = column_values
+		self.num_rows = num_rows
+
+	@classmethod
+	def concat(cls, tables: List['ColumnTable']) -> 'ColumnTable':
+		""" append tables row-wise, columns are matched by header and new headers keep first-seen order """
+		registry = {}
+		column_rows = []
+		column_values = []
+		base = 0
+		for table in tables:
+			for head, rows, values in zip(table.headers, table.column_rows, table.column_values):
+				if head not in registry:
+					registry[head] = len(registry)
+					column_rows.append([])
+					column_values.append([])
+				column_rows[registry[head]].append(rows + base)
+				column_values[registry[head]].extend(values)
+			base += table.num_rows
+		column_rows = [np.concatenate(rows) if rows else np.zeros(0, dtype=np.int64) for rows in column_rows]
+		return cls(list(registry.keys()), column_rows, column_values, base)
+
+	def __len__(self) -> int:
+		return self.num_rows
+
+	def null_mask(self, index: int) -> np.ndarray:
+		""" bool array over rows, True where column index has no value """
+		mask = np.ones(self.num_rows, dtype=bool)
+		mask[self.column_rows[index]] = False
+		return mask
+
+	def column(self, index: int) -> List:
+		""" dense values of column index with None for missing cells """
+		res = [None] * self.num_rows
+		for row, value in zip(self.column_rows[index].tolist(), self.column_values[index]):
+			res[row] = value
+		return res
+
+	def __getitem__(self, row: int) -> Tuple:
+		if row < 0:
+			row += self.num_rows
+		if not 0 <= row < self.num_rows:
+			raise IndexError('ColumnTable index out of range')
+		res = []
+		for rows, values in zip(self.column_rows, self.column_values):
+			pos = int(np.searchsorted(rows, row))
+			res.append(values[pos] if pos < len(rows) and rows[pos] == row else None)
+		return tuple(res)
+
+	def rows(self):
+		""" iterate row tuples with None for missing cells """
+		positions = [0] * len(self.headers)
+		column_rows = [rows.tolist() for rows in self.column_rows]
+		for row in range(self.num_rows):
+			res = []
+			for i, rows in enumerate(column_rows):
+				pos = positions[i]
+				if pos < len(rows) and rows[pos] == row:
+					res.append(self.column_values[i][pos])
+					positions[i] = pos + 1
+				else:
+					res.append(None)
+			yield tuple(res)
+
+	def __iter__(self):
+		return self.rows()
+
+	def head(self):
+		return self[0] if self.num_rows else None
+
+
+class ColumnTableBuilder(object):
+	""" single-pass builder of a ColumnTable from dict records, keeping a registry from key to column index """
+	def __init__(self) -> None:
+		self.registry = {}
+		self.column_rows = []
+		self.column_values = []
+		self.num_rows = 0
+
+	def add(self, record: dict) -> None:
+		for key, value in record.items():
+			index = self.registry.get(key)
+			if index is None:
+				index = len(self.registry)
+				self.registry[key] = index
+				self.column_rows.append([])
+				self.column_values.append([])
+			self.column_rows[index].append(self.num_rows)
+			self.column_values[index].append(value)
+		self.num_rows += 1
+
+	def build(self) -> ColumnTable:
+		return ColumnTable(
+			list(self.registry.keys()),
+			[np.array(rows, dtype=np.int64) for rows in self.column_rows],
+			self.column_values,
+			self.num_rows
+		)
@@ -0,0 +1,46 @@
+# Copyright (c) 2021 OpenKS Authors, DCD Research Lab, Zhejiang University.
+# All Rights Reserved.
+
+"""
+Compressed sparse row lookup structures backing the cached adjacency indexes of MTG
+"""
+import numpy as np
+
+
+class CSRIndex(object):
+	"""
+	Groups positions 0..n-1 of an int64 key array by key.
+	keys: sorted distinct keys, indptr: group boundaries into order, order: positions sorted by key (stable)
+	"""
+	def __init__(self, keys: np.ndarray) -> None:
+		keys = np.asarray(keys, dtype=np.int64)
+		self.order = np.argsort(keys, kind='stable')
+		self.keys, starts = np.unique(keys[self.order], return_index=True)
+		self.indptr = np.append(starts, len(keys)).astype(np.int64)
+
+	def lookup(self, key: int) -> np.ndarray:
+		""" positions holding key, in their original order """
+		i = int(np.searchsorted(self.keys, key))
+		if i >= len(self.keys) or self.keys[i] != key:
+			return self.order[:0]
+		return self.order[self.indptr[i]:self.indptr[i+1]]
+
+	def degree(self, key: int) -> int:
+		i = int(np.searchsorted(self.keys, key))
+		if i >= len(self.keys) or self.keys[i] != key:
+			return 0
+		return int(self.indptr[i+1] - self.indptr[i])
+
+
+class PairCSRIndex(CSRIndex):
+	""" CSRIndex over (group, key) pairs, used to partition edges by relation """
+	def __init__(self, groups: np.ndarray, keys: np.ndarray) -> None:
+		keys = np.asarray(keys, dtype=np.int64)
+		self.offset = int(keys.min()) if len(keys) else 0
+		self.span = int(keys.max()) - self.offset + 1 if len(keys) else 1
+		super(PairCSRIndex, self).__init__(np.asarray(groups, dtype=np.int64) * self.span + (keys - self.offset))
+
+	def lookup_pair(self, group: int, key: int) -> np.ndarray:
+		if not 0 <= key - self.offset < self.span:
+			return self.order[:0]
+		return self.lookup(group * self.span + key - self.offset)
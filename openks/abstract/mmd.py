@@ -4,7 +4,57 @@
 """
 Abstract dataset format MDD for Multi-modal Distributed Dataset
 """
-from typing import List
+from typing import List, Callable, Iterator
+from itertools import islice
+
+
+class ChunkedRows(object):
+	"""
+	A re-iterable dataset body for streaming loading. Each pass re-opens its source through open_rows
+	and yields lists of at most chunk_size rows, so memory is bounded by the chunk size rather than the file size.
+	"""
+	def __init__(self, open_rows: Callable[[], Iterator], chunk_size: int = 10000) -> None:
+		self._open_rows = open_rows
+		self.chunk_size = chunk_size
+
+	def __iter__(self):
+		rows = self._open_rows()
+		try:
+			while True:
+				chunk = list(islice(rows, self.chunk_size))
+				if not chunk:
+					break
+				yield chunk
+		finally:
+			if hasattr(rows, 'close'):
+				rows.close()
+
+	def rows(self):
+		""" iterate single rows across all chunks """
+		for chunk in self:
+			for row in chunk:
+				yield row
+
+	def head(self):
+		""" first row of the body or None if it is empty """
+		for row in self.rows():
+			return row
+		return None
+
+
+def iter_rows(body):
+	""" iterate rows of a dataset body, whether it is a materialized sequence or a lazy body exposing rows() """
+	if hasattr(body, 'rows'):
+		return body.rows()
+	return iter(body)
+
+
+def iter_chunks(body):
+	""" iterate a dataset body as lists of rows, a materialized sequence is a single chunk """
+	if isinstance(body, ChunkedRows):
+		return iter(body)
+	return iter([body])
+
 
 class MMD(object):
 	"""
@@ -53,5 +103,5 @@ class MMD(object):
 		print("字段名：" + str(self.headers))
 		print("数据示例：")
 		for data in self.bodies:
-			print(data[0])
+			print(data.head() if hasattr(data, 'head') else data[0])
 		print("-----------------------------------------------")
@@ -5,7 +5,11 @@
 Abstract dataset format MTG for Multi-type Knowledge Graph
 """
 from typing import List, Dict, Any
+import numpy as np
 from .mmd import MMD
+from .columnar import StringColumn, EntityView, TripleView, encode_strings
+from .snapshot import write_snapshot, read_snapshot
+from .graph_index import CSRIndex, PairCSRIndex
 
 class MTG(MMD):
 	"""
@@ -49,6 +53,14 @@ class MTG(MMD):
 	2. Be able to get entity IDs or triplets conviently for graph only learning.
 	3. Using schema structure to store concepts and attributes with complex information such as hierarchy for entity types and head/tail for relation types.
 	4. Supporting multiple and muti-typed attributes for both entities and relations, supporting relation directions for more complex KG.
+
+	columnar storage mode (see set_columns and to_columnar):
+	entity_ids: int64 array, entity_types: int32 codes into entity_type_vocab, entity_attrs: one StringColumn per attribute position
+	triple_ids: (n, 3) int64 array of (head, relation code, tail), relation codes index relation_vocab, triple_attrs: one StringColumn per attribute position
+	entities and triples then return lazy read-only views yielding the tuple formats above
+
+	adjacency lookups (out_edges, in_edges, neighbors, get_entity, get_concept) are served by indexes built on first use
+	and dropped whenever schema, entities or triples are set, call invalidate_indexes after editing the lists in place
 	"""
 	def __init__(
 		self,
@@ -62,6 +74,9 @@ class MTG(MMD):
 		self._schema = schema
 		self._entities = entities
 		self._triples = triples
+		self._entity_columns = None
+		self._triple_columns = None
+		self._indexes = {}
 
 	@property
 	def name(self):
@@ -78,22 +93,256 @@ class MTG(MMD):
 	@schema.setter
 	def schema(self, schema):
 		self._schema = schema
+		self.invalidate_indexes()
 
 	@property
 	def entities(self):
+		if self._entity_columns is not None:
+			return EntityView(self)
 		return self._entities
 	
 	@entities.setter
 	def entities(self, entities):
 		self._entities = entities
+		self._entity_columns = None
+		self.invalidate_indexes()
 
 	@property
 	def triples(self):
+		if self._triple_columns is not None:
+			return TripleView(self)
 		return self._triples
 	
 	@triples.setter
 	def triples(self, triples):
 		self._triples = triples
+		self._triple_columns = None
+		self.invalidate_indexes()
+
+	@property
+	def is_columnar(self):
+		return self._entity_columns is not None and self._triple_columns is not None
+
+	@property
+	def entity_ids(self):
+		return self._entity_columns['ids']
+
+	@property
+	def entity_types(self):
+		return self._entity_columns['types']
+
+	@property
+	def entity_type_vocab(self):
+		return self._entity_columns['vocab']
+
+	@property
+	def entity_attrs(self):
+		return self._entity_columns['attrs']
+
+	@property
+	def triple_ids(self):
+		return self._triple_columns['ids']
+
+	@property
+	def heads(self):
+		return self._triple_columns['ids'][:, 0]
+
+	@property
+	def relations(self):
+		return self._triple_columns['ids'][:, 1]
+
+	@property
+	def tails(self):
+		return self._triple_columns['ids'][:, 2]
+
+	@property
+	def relation_vocab(self):
+		return self._triple_columns['vocab']
+
+	@property
+	def triple_attrs(self):
+		return self._triple_columns['attrs']
+
+	def set_columns(
+		self,
+		entity_ids: np.ndarray,
+		entity_types: np.ndarray,
+		entity_type_vocab: List,
+		triple_ids: np.ndarray,
+		relation_vocab: List,
+		entity_attrs: List = [],
+		triple_attrs: List = []
+		) -> None:
+		""" switch to columnar storage, legacy entity and triple lists are dropped """
+		self._entities = []
+		self._triples = []
+		self._entity_columns = {
+			'ids': entity_ids,
+			'types': entity_types,
+			'vocab': list(entity_type_vocab),
+			'attrs': list(entity_attrs)
+		}
+		self._triple_columns = {
+			'ids': triple_ids.reshape(-1, 3),
+			'vocab': list(relation_vocab),
+			'attrs': list(triple_attrs)
+		}
+		self.invalidate_indexes()
+
+	def to_columnar(self) -> None:
+		""" convert legacy tuple lists into columnar storage in place """
+		if self.is_columnar:
+			return None
+		entities = self.entities
+		triples = self.triples
+		entity_ids = np.array([item[0] for item in entities], dtype=np.int64)
+		entity_types, entity_type_vocab = encode_strings(item[1] for item in entities)
+		entity_width = max([len(item[2]) for item in entities] or [0])
+		entity_attrs = [StringColumn.from_list(item[2][i] if i < len(item[2]) else None for item in entities) for i in range(entity_width)]
+		rel_codes, relation_vocab = encode_strings((item[0][1] for item in triples), vocab=self.relation_to_id().keys())
+		triple_ids = np.empty((len(triples), 3), dtype=np.int64)
+		triple_ids[:, 0] = [item[0][0] for item in triples]
+		triple_ids[:, 1] = rel_codes
+		triple_ids[:, 2] = [item[0][2] for item in triples]
+		triple_width = max([len(item[1]) for item in triples] or [0])
+		triple_attrs = [StringColumn.from_list(item[1][i] if i < len(item[1]) else None for item in triples) for i in range(triple_width)]
+		self.set_columns(entity_ids, entity_types, entity_type_vocab, triple_ids, relation_vocab, entity_attrs, triple_attrs)
+
+	def get_triple_array(self) -> np.ndarray:
+		"""
+		(n, 3) int64 array of (head, relation id, tail) with relation ids following relation_to_id.
+		In columnar mode the stored array is returned without copying when its relation codes already match.
+		"""
+		rel2id = self.relation_to_id()
+		if not self.is_columnar:
+			return np.array([(triple[0][0], rel2id[triple[0][1]], triple[0][2]) for triple in self.triples], dtype=np.int64).reshape(-1, 3)
+		vocab = self.relation_vocab
+		if vocab == list(rel2id.keys()):
+			return self.triple_ids
+		lookup = np.array([rel2id[rel] for rel in vocab], dtype=np.int64)
+		triple_ids = self.triple_ids.copy()
+		triple_ids[:, 1] = lookup[triple_ids[:, 1]]
+		return triple_ids
+
+	def invalidate_indexes(self) -> None:
+		""" drop cached lookup indexes, they are rebuilt on next use """
+		self._indexes = {}
+
+	def _cached(self, key, build):
+		if key not in self._indexes:
+			self._indexes[key] = build()
+		return self._indexes[key]
+
+	def _edges(self, column: int, entity_id: int, relation: str = None) -> np.ndarray:
+		triples = self._cached('triple_array', self.get_triple_array)
+		if relation is None:
+			index = self._cached(('csr', column), lambda: CSRIndex(triples[:, column]))
+			return index.lookup(entity_id)
+		rel_id = self._cached('relation_ids', self.relation_to_id).get(relation)
+		if rel_id is None:
+			return np.zeros(0, dtype=np.int64)
+		index = self._cached(('relation_csr', column), lambda: PairCSRIndex(triples[:, 1], triples[:, column]))
+		return index.lookup_pair(rel_id, entity_id)
+
+	def out_edges(self, entity_id: int, relation: str = None) -> np.ndarray:
+		""" positions in triples of the edges whose head is entity_id, optionally of one relation type only """
+		return self._edges(0, entity_id, relation)
+
+	def in_edges(self, entity_id: int, relation: str = None) -> np.ndarray:
+		""" positions in triples of the edges whose tail is entity_id, optionally of one relation type only """
+		return self._edges(2, entity_id, relation)
+
+	def neighbors(self, entity_id: int, relation: str = None, direction: str = 'out') -> np.ndarray:
+		""" ids of entities linked to entity_id, direction is 'out' for tails of out-edges or 'in' for heads of in-edges """
+		triples = self._cached('triple_array', self.get_triple_array)
+		if direction == 'out':
+			return triples[self.out_edges(entity_id, relation), 2]
+		elif direction == 'in':
+			return triples[self.in_edges(entity_id, relation), 0]
+		else:
+			raise ValueError('direction %s not supported' % direction)
+
+	def entity_row(self, entity_id: int):
+		""" position of entity_id in entities or None """
+		def build():
+			ids = self.entity_ids if self._entity_columns is not None else np.array([item[0] for item in self.entities], dtype=np.int64)
+			order = np.argsort(ids, kind='stable')
+			return ids[order], order
+		sorted_ids, order = self._cached('entity_rows', build)
+		i = int(np.searchsorted(sorted_ids, entity_id))
+		if i >= len(sorted_ids) or sorted_ids[i] != entity_id:
+			return None
+		return int(order[i])
+
+	def get_entity(self, entity_id: int):
+		""" entity tuple of entity_id or None """
+		row = self.entity_row(entity_id)
+		return None if row is None else self.entities[row]
+
+	def get_concept(self, concept: str, concept_type: str = None):
+		""" schema entry of a concept, optionally restricted to 'entity' or 'relation' entries """
+		def build():
+			res = {}
+			for item in self.schema:
+				res.setdefault((item['concept'], item['type']), item)
+				res.setdefault((item['concept'], None), item)
+			return res
+		return self._cached('concepts', build).get((concept, concept_type))
+
+	def save_snapshot(self, path: str) -> None:
+		"""
+		write the graph into one binary snapshot file that load_snapshot can memory-map,
+		a graph in legacy tuple storage is written through a columnar copy and keeps its storage
+		"""
+		graph = self
+		if not self.is_columnar:
+			graph = MTG(name=self.name, schema=self.schema, entities=self.entities, triples=self.triples)
+			graph.to_columnar()
+		arrays = {
+			'entity_ids': graph.entity_ids,
+			'entity_types': graph.entity_types,
+			'triple_ids': graph.triple_ids
+		}
+		for prefix, columns in [('entity_attr', graph.entity_attrs), ('triple_attr', graph.triple_attrs)]:
+			for i, col in enumerate(columns):
+				arrays['%s_%d_offsets' % (prefix, i)] = col.offsets
+				arrays['%s_%d_data' % (prefix, i)] = col.data
+				if col.nulls is not None:
+					arrays['%s_%d_nulls' % (prefix, i)] = col.nulls
+		meta = {
+			'name': self.name,
+			'schema': self.schema,
+			'entity_type_vocab': graph.entity_type_vocab,
+			'relation_vocab': graph.relation_vocab,
+			'entity_attr_num': len(graph.entity_attrs),
+			'triple_attr_num': len(graph.triple_attrs)
+		}
+		write_snapshot(path, meta, arrays)
+
+	@classmethod
+	def load_snapshot(cls, path: str) -> 'MTG':
+		""" open a snapshot written by save_snapshot, arrays stay memory-mapped and read-only """
+		meta, arrays = read_snapshot(path)
+		columns = {}
+		for prefix in ['entity_attr', 'triple_attr']:
+			columns[prefix] = [
+				StringColumn(
+					arrays['%s_%d_offsets' % (prefix, i)],
+					arrays['%s_%d_data' % (prefix, i)],
+					arrays.get('%s_%d_nulls' % (prefix, i))
+				) for i in range(meta[prefix + '_num'])
+			]
+		graph = cls(name=meta['name'], schema=meta['schema'])
+		graph.set_columns(
+			arrays['entity_ids'],
+			arrays['entity_types'],
+			meta['entity_type_vocab'],
+			arrays['triple_ids'],
+			meta['relation_vocab'],
+			columns['entity_attr'],
+			columns['triple_attr']
+		)
+		return graph
 
 	def hierarchy_construct(self):
 		res = []
@@ -0,0 +1,79 @@
+# Copyright (c) 2021 OpenKS Authors, DCD Research Lab, Zhejiang University.
+# All Rights Reserved.
+
+"""
+Versioned single-file binary layout for array data, readable with np.memmap
+
+layout:
+	magic (8 bytes) | version (uint32) | header length (uint64) | JSON header | aligned array blocks
+the JSON header keeps user metadata and, for each array, its dtype, shape and byte offset in the file
+"""
+import json
+import os
+import struct
+from typing import Dict, Tuple
+import numpy as np
+
+SNAPSHOT_MAGIC = b'OPENKSSN'
+SNAPSHOT_VERSION = 1
+_ALIGN = 64
+_PREFIX = struct.Struct('<8sIQ')
+
+
+def _aligned(offset: int) -> int:
+	return (offset + _ALIGN - 1) // _ALIGN * _ALIGN
+
+
+def write_snapshot(path: str, meta: Dict, arrays: Dict[str, np.ndarray]) -> None:
+	""" write metadata and named arrays to path, the file is replaced atomically """
+	arrays = {key: np.ascontiguousarray(value) for key, value in arrays.items()}
+	# offsets depend on the header size, so lay out against a header with final-width numbers
+	layout = {key: {'dtype': value.dtype.str, 'shape': list(value.shape), 'offset': 0} for key, value in arrays.items()}
+	header = json.dumps({'meta': meta, 'arrays': layout}).encode('utf-8')
+	while True:
+		offset = _aligned(_PREFIX.size + len(header))
+		for key, value in arrays.items():
+			layout[key]['offset'] = offset
+			offset = _aligned(offset + value.nbytes)
+		new_header = json.dumps({'meta': meta, 'arrays': layout}).encode('utf-8')
+		if len(new_header) == len(header):
+			header = new_header
+			break
+		header = new_header
+
+	tmp_path = path + '.tmp'
+	with open(tmp_path, 'wb') as f:
+		f.write(_PREFIX.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, len(header)))
+		f.write(header)
+		for key, value in arrays.items():
+			f.write(b'\0' * (layout[key]['offset'] - f.tell()))
+			f.write(value.tobytes())
+		f.flush()
+		os.fsync(f.fileno())
+	os.replace(tmp_path, path)
+
+
+def read_snapshot(path: str, mmap_mode: str = 'r') -> Tuple[Dict, Dict[str, np.ndarray]]:
+	"""
+	open a snapshot written by write_snapshot, arrays are returned as np.memmap views of the file
+	so processes opening the same snapshot share its pages through the OS page cache
+	"""
+	with open(path, 'rb') as f:
+		prefix = f.read(_PREFIX.size)
+		if len(prefix) < _PREFIX.size:
+			raise IOError("{} is not an OpenKS snapshot.".format(path))
+		magic, version, header_size = _PREFIX.unpack(prefix)
+		if magic != SNAPSHOT_MAGIC:
+			raise IOError("{} is not an OpenKS snapshot.".format(path))
+		if version != SNAPSHOT_VERSION:
+			raise IOError("Snapshot version {} of {} is not supported, expected version {}.".format(version, path, SNAPSHOT_VERSION))
+		header = json.loads(f.read(header_size).decode('utf-8'))
+	arrays = {}
+	for key, desc in header['arrays'].items():
+		dtype = np.dtype(desc['dtype'])
+		shape = tuple(desc['shape'])
+		if int(np.prod(shape)) == 0:
+			arrays[key] = np.empty(shape, dtype=dtype)
+		else:
+			arrays[key] = np.memmap(path, dtype=dtype, mode=mmap_mode, offset=desc['offset'], shape=shape)
+	return header['meta'], arrays
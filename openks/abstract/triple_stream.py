@@ -0,0 +1,99 @@
+# Copyright (c) 2021 OpenKS Authors, DCD Research Lab, Zhejiang University.
+# All Rights Reserved.
+
+"""
+Shuffled streaming of (head, relation, tail) id triples from on-disk files, with memory independent of the number of triples
+"""
+import os
+from typing import Iterator, List
+import numpy as np
+
+
+def open_triple_file(path: str) -> np.ndarray:
+	""" (n, 3) int64 read-only memmap of a .npy triple array or of a raw int64 file as written by write_triple_file """
+	if path.endswith('.npy'):
+		triples = np.load(path, mmap_mode='r')
+	else:
+		triples = np.memmap(path, dtype=np.int64, mode='r')
+	if triples.dtype != np.int64 or triples.size % 3:
+		raise ValueError('Triple file %s does not hold int64 (head, relation, tail) rows' % path)
+	return triples.reshape(-1, 3)
+
+
+def write_triple_file(path: str, blocks) -> int:
+	"""
+	append (k, 3) id triple blocks (an array or an iterable of arrays) to a raw int64 file, replaced atomically,
+	returns the number of triples written
+	"""
+	if isinstance(blocks, np.ndarray):
+		blocks = [blocks]
+	rows = 0
+	tmp_path = path + '.tmp'
+	with open(tmp_path, 'wb') as f:
+		for block in blocks:
+			block = np.ascontiguousarray(block, dtype=np.int64).reshape(-1, 3)
+			f.write(block.tobytes())
+			rows += len(block)
+		f.flush()
+		os.fsync(f.fileno())
+	os.replace(tmp_path, path)
+	return rows
+
+
+class TripleStream(object):
+	"""
+	Passes over the triples of an on-disk file (path) or of an (n, 3) array / memmap in random order with bounded memory.
+	The triples are cut into blocks of block_rows read sequentially, the order of the blocks is shuffled every pass
+	and rows go through a shuffle buffer of buffer_rows, so at most block_rows + buffer_rows triples are in memory.
+	Several readers (e.g. DataLoader workers) split the blocks between them with worker / num_workers.
+	"""
+	def __init__(self, source, block_rows: int = 1 << 20, buffer_rows: int = 1 << 22) -> None:
+		self.path = source if isinstance(source, str) else None
+		self._triples = None if self.path else np.asarray(source).reshape(-1, 3)
+		self.block_rows = block_rows
+		self.buffer_rows = buffer_rows
+		self.num_triples = len(self.triples)
+
+	@property
+	def triples(self) -> np.ndarray:
+		if self._triples is None:
+			self._triples = open_triple_file(self.path)
+		return self._triples
+
+	def __getstate__(self):
+		# file backed streams are reopened in every process instead of being pickled
+		state = self.__dict__.copy()
+		if self.path:
+			state['_triples'] = None
+		return state
+
+	def __len__(self) -> int:
+		return self.num_triples
+
+	def blocks(self, worker: int = 0, num_workers: int = 1) -> List[int]:
+		""" start rows of the blocks read by worker """
+		return list(range(worker * self.block_rows, self.num_triples, num_workers * self.block_rows))
+
+	def shuffled(self, rng: np.random.RandomState, worker: int = 0, num_workers: int = 1) -> Iterator[np.ndarray]:
+		""" one pass over the blocks of worker, yields shuffled (k, 3) arrays """
+		buffer = np.zeros((0, 3), dtype=np.int64)
+		for start in rng.permutation(self.blocks(worker, num_workers)):
+			block = np.array(self.triples[start:start+self.block_rows], dtype=np.int64)
+			buffer = np.concatenate([buffer, block])
+			if len(buffer) > self.buffer_rows:
+				buffer = buffer[rng.permutation(len(buffer))]
+				yield buffer[self.buffer_rows:]
+				buffer = buffer[:self.buffer_rows]
+		yield buffer[rng.permutation(len(buffer))]
+
+	def batches(self, batch_size: int, rng: np.random.RandomState, worker: int = 0, num_workers: int = 1) -> Iterator[np.ndarray]:
+		""" one shuffled pass of worker cut into (batch_size, 3) arrays, the last one may be shorter """
+		rest = np.zeros((0, 3), dtype=np.int64)
+		for rows in self.shuffled(rng, worker, num_workers):
+			rows = np.concatenate([rest, rows]) if len(rest) else rows
+			end = len(rows) - len(rows) % batch_size
+			for start in range(0, end, batch_size):
+				yield rows[start:start+batch_size]
+			rest = rows[end:]
+		if len(rest):
+			yield rest
@@ -47,31 +47,20 @@ class AnswerFetcher(object):
 
 		entity_id = entity_info['id']
 		entity_type = entity_info['type']
-		source_rel_col_index = 0
-		target_rel_col_index = 0
-		for item in graph.schema:
-			if item['type'] == 'relation' and item['concept'] == relation_type:
-				if item['members'].index(entity_type) == 0:
-					source_rel_col_index = 0
-					target_rel_col_index = 2
-				else:
-					source_rel_col_index = 2
-					target_rel_col_index = 0
-
-		target_ids = []
-		for rel in graph.triples:
-			if rel[0][1] == relation_type:
-				if rel[0][source_rel_col_index] == entity_id:
-					target_ids.append(rel[0][target_rel_col_index])
-
-		target_items = []
-		for ent in graph.entities:
-			if ent[1] == target_type:
-				for tar_id in target_ids:
-					if ent[0] == tar_id:
-						target_items.append(ent)
-		target_props = [item['properties'] for item in graph.schema if item['type'] == 'entity' and item['concept'] == target_type]
-		target_cols = [item['name'] for item in target_props[0]]
+		direction = 'out'
+		rel_schema = graph.get_concept(relation_type, 'relation')
+		if rel_schema is not None and rel_schema['members'].index(entity_type) != 0:
+			direction = 'in'
+
+		# adjacency index lookup, cost follows the entity degree instead of the triple count
+		target_ids = graph.neighbors(entity_id, relation_type, direction)
+
+		# keep the entity order and multiplicity of the targets
+		target_rows = sorted([row for row in [graph.entity_row(tar_id) for tar_id in target_ids.tolist()] if row is not None])
+		target_items = [graph.entities[row] for row in target_rows]
+		target_items = [ent for ent in target_items if ent[1] == target_type]
+		target_props = graph.get_concept(target_type, 'entity')['properties']
+		target_cols = [item['name'] for item in target_props]
 		res = []
 		for item in target_items:
 			tmp = {}
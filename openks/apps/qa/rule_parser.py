@@ -27,7 +27,7 @@ class RuleParserCom(QuestionParser):
 	def entity_extract(self) -> None:
 		entities = []
 		entity_type = 'company'
-		props = [item['properties'] for item in self.graph.schema if item['concept'] == entity_type][0]
+		props = self.graph.get_concept(entity_type)['properties']
 		index_alter_names = props.index({"name": "alter_names","range": "list"})
 		index_name = props.index({"name": "name","range": "str"})
 		index_id = 0
@@ -4,4 +4,5 @@
 """
 init
 """
-from .register import *
\ No newline at end of file
+from .register import *
+from .profiler import *
@@ -0,0 +1,212 @@
+# Copyright (c) 2021 OpenKS Authors, DCD Research Lab, Zhejiang University.
+# All Rights Reserved.
+
+"""
+Per-phase profiling of training loops: phase timings per step, peak resident memory, JSON aggregates and Chrome traces
+"""
+import os
+import json
+import time
+import logging
+import sys
+import threading
+from typing import Dict, Iterable, Optional
+
+__all__ = ['PhaseProfiler', 'profile_dir', 'current_rss', 'peak_rss']
+
+logger = logging.getLogger(__name__)
+
+_PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+
+def current_rss() -> int:
+	""" resident bytes of this process, 0 without /proc """
+	try:
+		with open('/proc/self/statm') as f:
+			return int(f.read().split()[1]) * _PAGE_SIZE
+	except (IOError, IndexError, ValueError):
+		return 0
+
+
+def peak_rss() -> int:
+	""" peak resident bytes of this process as tracked by the kernel, 0 where the resource module is not available """
+	try:
+		import resource
+	except ImportError:
+		return 0
+	# ru_maxrss is in kilobytes on linux and in bytes on macOS
+	peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+	return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def profile_dir(args: Dict) -> Optional[str]:
+	"""
+	directory of the profile of a run from its 'profile' arg: None when unset, the directory itself when a path
+	and the run's save_path (or the directory of model_dir) when True
+	"""
+	option = args.get('profile')
+	if not option:
+		return None
+	if isinstance(option, str):
+		return option
+	path = args.get('save_path') or args.get('model_dir') or '.'
+	if os.path.splitext(path)[1] and not os.path.isdir(path):
+		path = os.path.dirname(path) or '.'
+	return path
+
+
+class _NullPhase(object):
+	def __enter__(self) -> None:
+		return None
+
+	def __exit__(self, *exc) -> None:
+		return None
+
+
+_NULL_PHASE = _NullPhase()
+
+
+class _Phase(object):
+	def __init__(self, profiler: 'PhaseProfiler', name: str) -> None:
+		self.profiler = profiler
+		self.name = name
+		self.start = 0.0
+
+	def __enter__(self) -> None:
+		if self.profiler.synchronize is not None:
+			self.profiler.synchronize()
+		self.start = time.perf_counter()
+
+	def __exit__(self, *exc) -> None:
+		if self.profiler.synchronize is not None:
+			self.profiler.synchronize()
+		self.profiler.record(self.name, self.start, time.perf_counter())
+
+
+class PhaseProfiler(object):
+	"""
+	Times the phases of a training loop (e.g. 'data', 'forward', 'backward', 'optimizer', 'eval', 'checkpoint').
+	Phases are timed with `with profiler.phase(name):` and step() closes a step, recording the step span and the
+	resident memory at its end. export() writes profile.json with per-phase aggregates and peak memory and trace.json,
+	a Chrome trace (chrome://tracing, Perfetto) of the phases, steps and memory; at most max_events events are traced,
+	aggregates cover everything.
+	A profiler created with path None is disabled: phase() returns a shared no-op context and nothing is recorded.
+	synchronize (e.g. torch.cuda.synchronize) is called around phases so asynchronous device work is timed
+	in the phase that launched it.
+	"""
+	def __init__(self, path: Optional[str] = None, synchronize=None, max_events: int = 1 << 20) -> None:
+		self.path = path
+		self.enabled = path is not None
+		self.synchronize = synchronize
+		self.max_events = max_events
+		self.origin = time.perf_counter()
+		self.step_start = None
+		self.steps = 0
+		self.stats = {}
+		self.events = []
+		self.dropped = 0
+		self.peak = 0
+		self.lock = threading.Lock()
+
+	def phase(self, name: str):
+		if not self.enabled:
+			return _NULL_PHASE
+		return _Phase(self, name)
+
+	def iterate(self, iterable: Iterable, name: str = 'data'):
+		""" iterable with the time of fetching every item recorded as phase name """
+		if not self.enabled:
+			return iterable
+		return self._iterate(iter(iterable), name)
+
+	def _iterate(self, iterator, name: str):
+		while True:
+			start = time.perf_counter()
+			try:
+				item = next(iterator)
+			except StopIteration:
+				return
+			self.record(name, start, time.perf_counter())
+			yield item
+
+	def record(self, name: str, start: float, end: float, args: Dict = None) -> None:
+		""" account a span of phase name from start to end (perf_counter seconds) """
+		duration = end - start
+		with self.lock:
+			if self.step_start is None:
+				self.step_start = start
+			stat = self.stats.get(name)
+			if stat is None:
+				stat = self.stats[name] = [0, 0.0, 0.0]
+			stat[0] += 1
+			stat[1] += duration
+			stat[2] = max(stat[2], duration)
+			if len(self.events) < self.max_events:
+				self.events.append((name, start, duration, threading.get_ident(), args))
+			else:
+				self.dropped += 1
+
+	def step(self) -> None:
+		""" end the current step, the next one starts now """
+		if not self.enabled:
+			return
+		end = time.perf_counter()
+		rss = current_rss()
+		self.peak = max(self.peak, rss)
+		self.steps += 1
+		self.record('step', self.step_start if self.step_start is not None else end, end, {'step': self.steps})
+		self.step_start = end
+		if len(self.events) < self.max_events:
+			self.events.append(('rss', end, None, None, {'bytes': rss}))
+
+	def summary(self) -> Dict:
+		""" per-phase count, total / mean / max seconds and share of the step time, steps and peak resident bytes """
+		step_total = self.stats['step'][1] if 'step' in self.stats else 0.0
+		phases = {}
+		for name, (count, total, longest) in self.stats.items():
+			phases[name] = {
+				'count': count,
+				'total': total,
+				'mean': total / count,
+				'max': longest,
+				'share': total / step_total if step_total and name != 'step' else None
+			}
+		return {
+			'steps': self.steps,
+			'wall_time': time.perf_counter() - self.origin,
+			'peak_rss': max(self.peak, peak_rss()),
+			'phases': phases,
+			'dropped_events': self.dropped
+		}
+
+	def trace(self) -> Dict:
+		""" Chrome trace event format of the recorded spans, timestamps in microseconds from the profiler creation """
+		pid = os.getpid()
+		events = []
+		for name, start, duration, tid, args in self.events:
+			ts = (start - self.origin) * 1e6
+			if duration is None:
+				events.append({'name': name, 'ph': 'C', 'ts': ts, 'pid': pid, 'args': args})
+			else:
+				event = {'name': name, 'ph': 'X', 'ts': ts, 'dur': duration * 1e6, 'pid': pid, 'tid': tid}
+				if args:
+					event['args'] = args
+				events.append(event)
+		return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+	def export(self, path: Optional[str] = None) -> Optional[Dict]:
+		""" write profile.json and trace.json to path (the profiler path by default), returns the summary """
+		if not self.enabled:
+			return None
+		path = path or self.path
+		if not os.path.exists(path):
+			os.makedirs(path)
+		summary = self.summary()
+		with open(os.path.join(path, 'profile.json'), 'w') as f:
+			json.dump(summary, f, indent=2)
+		with open(os.path.join(path, 'trace.json'), 'w') as f:
+			json.dump(self.trace(), f)
+		for name, stat in sorted(summary['phases'].items(), key=lambda item: -item[1]['total']):
+			logger.info('Profile %s: %d x %.3f ms, %.2f s total' % (name, stat['count'], stat['mean'] * 1e3, stat['total']))
+		logger.info('Profile peak RSS %.1f MB, written to %s' % (summary['peak_rss'] / 2 ** 20, path))
+		return summary
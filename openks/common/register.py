@@ -5,6 +5,7 @@
 Any base class inherits this Register class gives its subclasses ability to be registered in a named registry with decoration
 """
 from collections import defaultdict
+import importlib
 import logging
 from typing import Dict, List
 
@@ -26,12 +27,14 @@ class Register(object):
 	"""
 
 	_registry: Dict = defaultdict(dict)
+	# platform -> {name: module path}, modules listed here are imported on first lookup only
+	_manifest: Dict = defaultdict(dict)
 
 	@classmethod
 	def register(cls: 'Register', name: str, platform: str):
 		def register_module(module: object):
 			if platform in cls._registry and name in cls._registry[platform]:
-				logger.error("Name conflicts. {} has already been registered as {}.".format(registry[platform][name].__name__, name))
+				logger.error("Name conflicts. {} has already been registered as {}.".format(cls._registry[platform][name].__name__, name))
 				raise Exception
 			else:
 				if platform not in cls._registry:
@@ -42,19 +45,35 @@ class Register(object):
 				return module
 		return register_module
 
+	@classmethod
+	def declare(cls: 'Register', manifest: Dict[str, Dict[str, str]]) -> None:
+		""" add {platform: {name: module path}} entries resolved lazily by get_module """
+		for platform, modules in manifest.items():
+			cls._manifest[platform].update(modules)
+
 	@classmethod
 	def get_module(cls: 'Register', platform: str, name: str) -> object:
-		if platform in cls._registry:
-			if name in cls._registry[platform]:
+		if name in cls._registry.get(platform, {}):
+			return cls._registry[platform][name]
+		module_path = cls._manifest.get(platform, {}).get(name)
+		if module_path is not None:
+			try:
+				importlib.import_module(module_path)
+			except ImportError as e:
+				logger.error("Module {} of platform {} could not be imported from {}: {}".format(name, platform, module_path, e))
+				raise
+			if name in cls._registry.get(platform, {}):
 				return cls._registry[platform][name]
-		else:
-			logger.error("Module not found. {} is not a registered name in platform {}.".format(name, platform))
+		logger.error("Module not found. {} is not a registered name in platform {}.".format(name, platform))
 
 	@classmethod
 	def list_modules(cls: 'Register') -> List[str]:
+		""" print registered and declared module names, declared platforms are not imported """
 		print("已注册模型：")
-		for plat in cls._registry:
+		platforms = list(cls._manifest.keys()) + [plat for plat in cls._registry if plat not in cls._manifest]
+		for plat in platforms:
+			names = list(cls._manifest.get(plat, {}).keys())
+			names += [name for name in cls._registry.get(plat, {}) if name not in names]
 			print("框架类型：" + plat)
-			print("模型名称：" + str(list(cls._registry[plat].keys())))
+			print("模型名称：" + str(names))
 		print("-----------------------------------------------")
-
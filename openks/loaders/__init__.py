@@ -6,6 +6,8 @@ init
 """
 from .loader import *
 from .graph_loader import *
+from .parallel_parser import *
+from .parse_cache import *
 
 from .graph_loader_notkg import *
 
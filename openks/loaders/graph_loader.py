@@ -5,12 +5,19 @@
 Loader for generating knowledge graph data format MTG
 """
 import os
+import re
+import csv
 import json
+from typing import Dict
 from zipfile import ZipFile
 import logging
+import numpy as np
 from py2neo import Graph,Node
-from .loader import Loader, LoaderConfig, SourceType, FileType
+from .loader import Loader, LoaderConfig, SourceType, FileType, cypher_name
+from .parallel_parser import EntityColumns, TripleColumns
 from ..abstract.mtg import MTG
+from ..abstract.mmd import iter_rows, iter_chunks
+from ..abstract.columnar import encode_strings, rows_to_string_columns, concat_string_columns, ColumnTable
 import pdb
 
 logger = logging.getLogger(__name__)
@@ -22,14 +29,39 @@ class GraphLoader(Loader):
 	"""
 	Specific loader for generating MTG format from MMD
 	"""
+	_cache_dataset = False
+
 	def __init__(
 		self, 
 		config: LoaderConfig, 
 		graph_name: str = ''
 		) -> None:
+		self.graph_name = graph_name if graph_name else config.data_name
+		# only the graph is cached, a hit skips both parsing steps and the MMD is read again only when asked for
+		cache = config.parse_cache()
+		key = cache.key('graph', config.source_uris, dict(config.cache_options(), graph_name=self.graph_name)) if cache else None
+		cached = cache.get(key) if cache else None
+		if cached is not None:
+			self.config = config
+			self._dataset = None
+			self.graph = cached
+			return None
 		super(GraphLoader, self).__init__(config)
 		self.graph = self._load_data()
-		self.graph.name = graph_name if graph_name else config.data_name
+		self.graph.name = self.graph_name
+		if cache:
+			cache.put(key, self.graph)
+
+	@property
+	def dataset(self):
+		if self._dataset is None:
+			self._dataset = self._read_data()
+			self._dataset.name = self.config.data_name
+		return self._dataset
+
+	@dataset.setter
+	def dataset(self, dataset):
+		self._dataset = dataset
 
 	def _load_data(self) -> MTG:
 		""" 
@@ -108,129 +140,8 @@ class GraphLoader(Loader):
 			raise NotImplementedError
 
 		elif self.config.file_type == FileType.OPENBASE:
-			# schema from OpenBase
-			headers = self.dataset.headers[0]
-			bodies = self.dataset.bodies[0]
-			# entity concepts
-			ent_type_col = [head for head in headers if head.startswith('@type_')]
-			ent_type_col.sort()
-			ent_type_index = [headers.index(col) for col in ent_type_col]
-			for body in bodies:
-				for i in range(len(ent_type_index)):
-					if i+1 < len(ent_type_index):
-						parent = 'openks/'+ self.graph_name +'/class/' + body[ent_type_index[i+1]]
-					else:
-						parent = None
-					concept = {
-						'id': 'openks/'+ self.graph_name +'/class/' + body[ent_type_index[i]], 
-						'name': body[ent_type_index[i]], 
-						'type': 'entity', 
-						'parent': parent
-					}
-					if concept not in schema['concepts']:
-						schema['concepts'].append(concept)
-			# relation concepts
-			rel_types = ['_'.join(head.split('_')[:-2]) for head in headers if head.endswith('_@refer')]
-			rel_types = list(set(rel_types))
-			for rel_type in rel_types:
-				from_type = ''
-				to_type = ''
-				rel_index = headers.index(rel_type + '_0_@refer')
-				id_index = headers.index('@id')
-				type_index = headers.index('@type_0')
-				for body in bodies:
-					if body[rel_index]:
-						from_type = 'openks/'+ self.graph_name +'/class/' + body[type_index]
-						for item in bodies:
-							if item[id_index] == body[rel_index]:
-								to_type = 'openks/'+ self.graph_name +'/class/' + item[type_index]
-								break
-						break
-				concept = {
-					'id': 'http://openbase/'+ self.graph_name +'/class/' + rel_type, 
-					'name': rel_type, 
-					'type': 'relation', 
-					'axiom': ((from_type, to_type),)
-				}
-				if concept not in schema['concepts']:
-					schema['concepts'].append(concept)
-			# attributes 
-			tmp = [head.split('_@refer')[0] for head in headers if head.endswith('_@refer')]
-			for head in headers:
-				flag = True
-				for item in tmp:
-					if head.startswith(item):
-						attr_id = '_'.join(head.split('_')[:-2]) + '_' + head.split('_')[-1]
-						attribute = {
-							'id': 'openks/attribute/' + attr_id, 
-							'name': attr_id, 
-							'type': 'relation', 
-							'concept': 'http://openbase/'+ self.graph_name +'/class/' + '_'.join(item.split('_')[:-1]),
-							'value': 'any'
-						}
-						flag = False
-						if attribute not in schema['attributes']:
-							schema['attributes'].append(attribute)
-						break
-					else:
-						continue
-				
-				if flag:
-					attribute = {
-						'id': 'openks/attribute/' + head, 
-						'name': head, 
-						'type': 'entity', 
-						'concept': None,
-						'value': 'any'
-					}
-					if attribute not in schema['attributes']:
-						schema['attributes'].append(attribute)
-
-
-			# entity from OpenBase
-			ent_index = [headers.index(ent_attr) for ent_attr in [item['name'] for item in schema['attributes'] if item['type'] == 'entity']]
-			ent_tmp = {}
-			count = 0
-			for index in ent_index:
-				ent_tmp[headers[index]] = count
-				count += 1
-			for body in bodies:
-				if body[ent_type_index[0]] in [item['name'] for item in schema['concepts']]:
-					if body[ent_type_index[0]] not in entities:
-						entities[body[ent_type_index[0]]] = {'pointer': ent_tmp, 'instances': []}
-					row = []
-					for index in ent_index:
-						row.append(body[index])
-					entities[body[ent_type_index[0]]]['instances'].append(tuple(row))
-
-			# relation from OpenBase
-			rel_tmp = {}
-			for head in headers:
-				for item in rel_types:
-					if head.startswith(item):
-						if item not in rel_tmp:
-							rel_tmp[item] = {}
-						for rel_attr in schema['attributes']:
-							if rel_attr['concept'] == 'http://openbase/'+ self.graph_name +'/class/' + item:
-								if rel_attr['name'].split('_')[-1] == head.split('_')[-1]:
-									if rel_attr['name'] not in rel_tmp[item]:
-										rel_tmp[item][rel_attr['name']] = []
-									rel_tmp[item][rel_attr['name']].append(headers.index(head))
-			for body in bodies:
-				for rel_type in rel_tmp.keys():
-					if rel_type not in relations:
-						relations[rel_type] = {'pointer': {'appID': 0}, 'instances': []}
-					for i in range(len(list(rel_tmp[rel_type].values())[0])):
-						rel_item = [body[headers.index('appID')]]
-						count = 1
-						for k in rel_tmp[rel_type].keys():
-							relations[rel_type]['pointer'][k] = count
-							count += 1
-							rel_item.append(body[rel_tmp[rel_type][k][i]])
-						for item in rel_item[1:]:
-							if item:
-								relations[rel_type]['instances'].append(tuple(rel_item))
-								break
+			# schema, entities and relations from OpenBase
+			schema, entities, relations = self._load_openbase(self.dataset.headers[0], self.dataset.bodies[0])
 
 		elif self.config.file_type == FileType.OPENKS:
 			schema = []
@@ -239,12 +150,22 @@ class GraphLoader(Loader):
 			if os.path.exists(self.config.source_uris + '/schema.json'):
 				with open(self.config.source_uris + '/schema.json', 'r') as f:
 					schema = json.load(f)
-				for entity in self.dataset.bodies[0]:
+				# bodies parsed into columns by worker processes are converted to tuples below unless columnar is set,
+				# so num_workers does not change the storage of the graph
+				if isinstance(self.dataset.bodies[0], EntityColumns) and self.config.columnar:
+					mtg.schema = schema
+					self._set_parsed_columns(mtg, self.dataset.bodies[0], self.dataset.bodies[1])
+					return mtg
+				if self.config.columnar:
+					mtg.schema = schema
+					self._load_columns(mtg, iter_chunks(self.dataset.bodies[0]), iter_chunks(self.dataset.bodies[1]))
+					return mtg
+				for entity in iter_rows(self.dataset.bodies[0]):
 					if len(entity) == 2:
 						entities.append((int(entity[0]), entity[1], tuple([])))
 					else:
 						entities.append((int(entity[0]), entity[1], tuple(entity[2:])))
-				for relation in self.dataset.bodies[1]:
+				for relation in iter_rows(self.dataset.bodies[1]):
 					if len(relation) == 3:
 						relations.append(((int(relation[0]), relation[1], int(relation[2])), tuple([])))
 					else:
@@ -259,7 +180,202 @@ class GraphLoader(Loader):
 		mtg.triples = relations
 		return mtg
 
-	def graph2neo(self, graph: MTG, graph_db, clean=True):
+	def _load_openbase(self, headers, bodies):
+		"""
+		build schema, entities and relations from flattened OpenBase records.
+		Lookups go through hash indexes (header to column, @id to row, concept and attribute id sets)
+		and records are read column-wise, so conversion is linear in the number of records.
+		"""
+		schema = {'concepts': [], 'attributes': []}
+		entities = {}
+		relations = {}
+		class_prefix = 'openks/' + self.graph_name + '/class/'
+		rel_prefix = 'http://openbase/' + self.graph_name + '/class/'
+
+		header_index = {}
+		for index, head in enumerate(headers):
+			header_index.setdefault(head, index)
+		num_rows = len(bodies)
+		columns = {}
+		if not isinstance(bodies, ColumnTable):
+			columns = dict(enumerate(zip(*bodies))) if bodies else {index: () for index in range(len(headers))}
+
+		def column_at(index):
+			if index not in columns:
+				columns[index] = bodies.column(index)
+			return columns[index]
+
+		def column(name):
+			return column_at(header_index[name])
+
+		# entity concepts
+		ent_type_col = [head for head in headers if head.startswith('@type_')]
+		ent_type_col.sort()
+		type_columns = [column(col) for col in ent_type_col]
+		concept_ids = set()
+		for row in range(num_rows):
+			for i in range(len(type_columns)):
+				parent = class_prefix + type_columns[i+1][row] if i+1 < len(type_columns) else None
+				concept = {
+					'id': class_prefix + type_columns[i][row], 
+					'name': type_columns[i][row], 
+					'type': 'entity', 
+					'parent': parent
+				}
+				key = (concept['id'], parent)
+				if key not in concept_ids:
+					concept_ids.add(key)
+					schema['concepts'].append(concept)
+
+		# relation concepts, the target type is resolved through an @id to row index
+		rel_types = list(dict.fromkeys(['_'.join(head.split('_')[:-2]) for head in headers if head.endswith('_@refer')]))
+		id_to_row = {}
+		for row, item_id in enumerate(column('@id')):
+			id_to_row.setdefault(item_id, row)
+		type_column = column('@type_0')
+		for rel_type in rel_types:
+			from_type = ''
+			to_type = ''
+			refer_column = column(rel_type + '_0_@refer')
+			row = next((row for row, value in enumerate(refer_column) if value), None)
+			if row is not None:
+				from_type = class_prefix + type_column[row]
+				target_row = id_to_row.get(refer_column[row])
+				if target_row is not None:
+					to_type = class_prefix + type_column[target_row]
+			concept = {
+				'id': rel_prefix + rel_type, 
+				'name': rel_type, 
+				'type': 'relation', 
+				'axiom': ((from_type, to_type),)
+			}
+			if (concept['id'], None) not in concept_ids:
+				concept_ids.add((concept['id'], None))
+				schema['concepts'].append(concept)
+
+		# attributes 
+		attribute_ids = set()
+		refers = [head.split('_@refer')[0] for head in headers if head.endswith('_@refer')]
+		for head in headers:
+			item = next((item for item in refers if head.startswith(item)), None)
+			if item is not None:
+				attr_id = '_'.join(head.split('_')[:-2]) + '_' + head.split('_')[-1]
+				attribute = {
+					'id': 'openks/attribute/' + attr_id, 
+					'name': attr_id, 
+					'type': 'relation', 
+					'concept': rel_prefix + '_'.join(item.split('_')[:-1]),
+					'value': 'any'
+				}
+			else:
+				attribute = {
+					'id': 'openks/attribute/' + head, 
+					'name': head, 
+					'type': 'entity', 
+					'concept': None,
+					'value': 'any'
+				}
+			key = (attribute['id'], attribute['type'], attribute['concept'])
+			if key not in attribute_ids:
+				attribute_ids.add(key)
+				schema['attributes'].append(attribute)
+
+		# entity from OpenBase
+		ent_names = [item['name'] for item in schema['attributes'] if item['type'] == 'entity']
+		ent_tmp = {}
+		for count, name in enumerate(ent_names):
+			ent_tmp[name] = count
+		ent_columns = [column(name) for name in ent_names]
+		concept_names = set(item['name'] for item in schema['concepts'])
+		main_type_column = type_columns[0] if type_columns else [None] * num_rows
+		for row in range(num_rows):
+			ent_type = main_type_column[row]
+			if ent_type in concept_names:
+				if ent_type not in entities:
+					entities[ent_type] = {'pointer': ent_tmp, 'instances': []}
+				entities[ent_type]['instances'].append(tuple([col[row] for col in ent_columns]))
+
+		# relation from OpenBase
+		attrs_by_concept = {}
+		for rel_attr in schema['attributes']:
+			attrs_by_concept.setdefault(rel_attr['concept'], []).append(rel_attr['name'])
+		rel_tmp = {}
+		for head in headers:
+			for item in rel_types:
+				if head.startswith(item):
+					if item not in rel_tmp:
+						rel_tmp[item] = {}
+					for name in attrs_by_concept.get(rel_prefix + item, []):
+						if name.split('_')[-1] == head.split('_')[-1]:
+							if name not in rel_tmp[item]:
+								rel_tmp[item][name] = []
+							rel_tmp[item][name].append(header_index[head])
+		rel_columns = {}
+		for rel_type, attrs in rel_tmp.items():
+			pointer = {'appID': 0}
+			for count, name in enumerate(attrs.keys()):
+				pointer[name] = count + 1
+			# one group of columns per repeated reference of the relation type
+			groups = [[column_at(indexes[i]) for indexes in attrs.values()] for i in range(len(list(attrs.values())[0]))]
+			rel_columns[rel_type] = groups
+			if num_rows:
+				relations[rel_type] = {'pointer': pointer, 'instances': []}
+		app_column = column('appID') if rel_columns else None
+		for row in range(num_rows):
+			for rel_type, groups in rel_columns.items():
+				instances = relations[rel_type]['instances']
+				for group in groups:
+					values = [col[row] for col in group]
+					if any(values):
+						instances.append(tuple([app_column[row]] + values))
+		return schema, entities, relations
+
+	@staticmethod
+	def _load_columns(graph: MTG, entity_chunks, triple_chunks) -> None:
+		""" fill MTG columns directly from chunks of OPENKS entity and triple rows without building tuples """
+		ids = []
+		types = []
+		attrs = []
+		entity_type_vocab = []
+		for rows in entity_chunks:
+			ids.append(np.fromiter((int(row[0]) for row in rows), dtype=np.int64, count=len(rows)))
+			codes, entity_type_vocab = encode_strings((row[1] for row in rows), vocab=entity_type_vocab)
+			types.append(codes)
+			attrs.append(rows_to_string_columns(rows, 2))
+		entity_ids = np.concatenate(ids or [np.zeros(0, dtype=np.int64)])
+		entity_types = np.concatenate(types or [np.zeros(0, dtype=np.int32)])
+		entity_attrs = concat_string_columns(attrs, [len(item) for item in ids])
+
+		ids = []
+		attrs = []
+		relation_vocab = list(graph.relation_to_id().keys())
+		for rows in triple_chunks:
+			chunk = np.empty((len(rows), 3), dtype=np.int64)
+			chunk[:, 0] = np.fromiter((int(row[0]) for row in rows), dtype=np.int64, count=len(rows))
+			chunk[:, 1], relation_vocab = encode_strings((row[1] for row in rows), vocab=relation_vocab)
+			chunk[:, 2] = np.fromiter((int(row[2]) for row in rows), dtype=np.int64, count=len(rows))
+			ids.append(chunk)
+			attrs.append(rows_to_string_columns(rows, 3))
+		triple_ids = np.concatenate(ids or [np.zeros((0, 3), dtype=np.int64)])
+		triple_attrs = concat_string_columns(attrs, [len(item) for item in ids])
+		graph.set_columns(entity_ids, entity_types, entity_type_vocab, triple_ids, relation_vocab, entity_attrs, triple_attrs)
+
+	@staticmethod
+	def _set_parsed_columns(graph: MTG, entities: EntityColumns, triples: TripleColumns) -> None:
+		""" adopt arrays from the parallel parser, relation codes are remapped to follow the schema order """
+		lookup, relation_vocab = encode_strings(triples.vocab, vocab=graph.relation_to_id().keys())
+		if len(triples.ids):
+			# remapped in place, the parsed body keeps sharing the array and vocab with the graph
+			triples.ids[:, 1] = lookup[triples.ids[:, 1]]
+		triples.vocab = relation_vocab
+		graph.set_columns(entities.ids, entities.types, entities.vocab, triples.ids, relation_vocab, entities.attrs, triples.attrs)
+
+	def graph2neo(self, graph: MTG, graph_db, clean=True, bulk=False, batch_size=10000):
+		""" 
+		import MTG into neo4j. With bulk, nodes and edges are grouped by label and relation type 
+		and sent as parameterized UNWIND batches of batch_size rows, each batch in its own explicit transaction """
+		if bulk:
+			return self.bulk2neo(graph, graph_db, clean=clean, batch_size=batch_size)
 		create = True
 		if len(graph_db.nodes) > 0:
 			if clean:
@@ -272,8 +388,8 @@ class GraphLoader(Loader):
 			# create neo4j nodes
 			count = 0
 			for item in graph.entities:
-				props = [struct['properties'] for struct in graph.schema if struct['type'] == 'entity' and struct['concept'] == item[1]]
-				prop_names = [prop['name'] for prop in props[0]]
+				props = graph.get_concept(item[1], 'entity')['properties']
+				prop_names = [prop['name'] for prop in props]
 				prop_names.append('gid')
 				prop_values = list(item[2])
 				prop_values.append(item[0])
@@ -292,10 +408,10 @@ class GraphLoader(Loader):
 				q = item[0][2]
 				rel_type = item[0][1]
 				rel_name = item[1][0] if item[1] else rel_type
-				for struct in graph.schema:
-					if struct['concept'] == item[0][1] and struct['type'] == 'relation':
-						start_node = struct['members'][0]
-						end_node = struct['members'][1]
+				struct = graph.get_concept(item[0][1], 'relation')
+				if struct is not None:
+					start_node = struct['members'][0]
+					end_node = struct['members'][1]
 				query = "match(p:%s),(q:%s) where p.gid=%d and q.gid=%d create (p)-[rel:%s{name:'%s'}]->(q)" % (start_node, end_node, p, q, rel_type, rel_name)
 				try:
 					graph_db.run(query)
@@ -305,3 +421,97 @@ class GraphLoader(Loader):
 				except Exception as e:
 					print(e)
 		return None
+
+	@staticmethod
+	def _group_graph(graph: MTG):
+		"""
+		group entity rows by label and edge rows by (relation type, head label, tail label),
+		triples of relation types without a schema entry have no endpoint labels and are skipped
+		"""
+		nodes = {}
+		prop_names = {}
+		for item in graph.entities:
+			if item[1] not in prop_names:
+				prop_names[item[1]] = [prop['name'] for prop in graph.get_concept(item[1], 'entity')['properties']]
+			props = dict(zip(prop_names[item[1]], item[2]))
+			props['gid'] = item[0]
+			nodes.setdefault(item[1], []).append(props)
+		edges = {}
+		skipped = {}
+		for item in graph.triples:
+			rel_type = item[0][1]
+			struct = graph.get_concept(rel_type, 'relation')
+			members = struct.get('members') if struct is not None else None
+			if not members or len(members) < 2 or not members[0] or not members[1]:
+				skipped[rel_type] = skipped.get(rel_type, 0) + 1
+				continue
+			key = (rel_type, members[0], members[1])
+			edges.setdefault(key, []).append({'h': item[0][0], 't': item[0][2], 'name': item[1][0] if item[1] else rel_type})
+		for rel_type, count in skipped.items():
+			logger.warning("Skipped %d triples of relation type %s, it has no head and tail labels in the schema" % (count, rel_type))
+		return nodes, edges
+
+	@staticmethod
+	def _run_batches(graph_db, query, rows, batch_size):
+		for start in range(0, len(rows), batch_size):
+			tx = graph_db.begin()
+			tx.run(query, {'rows': rows[start:start+batch_size]})
+			tx.commit()
+
+	@staticmethod
+	def bulk2neo(graph: MTG, graph_db, clean=True, batch_size=10000):
+		"""
+		bulk import of graph2neo, only run() and begin() of graph_db and run() / commit() of its transactions are used,
+		so a recording stand-in can take the place of a py2neo Graph
+		"""
+		if clean:
+			graph_db.run("MATCH (n) CALL { WITH n DETACH DELETE n } IN TRANSACTIONS OF %d ROWS" % batch_size)
+			logger.info("Cleaned all nodes and relations in graph.")
+		elif graph_db.run("MATCH (n) RETURN count(n) > 0").evaluate():
+			logger.info("Graph contains nodes and edges and no new nodes will be imported.")
+			return None
+		nodes, edges = GraphLoader._group_graph(graph)
+		for label, rows in nodes.items():
+			try:
+				graph_db.run("CREATE INDEX IF NOT EXISTS FOR (n:%s) ON (n.gid)" % cypher_name(label))
+			except Exception as e:
+				logger.warning("Index on gid for label {} was not created: {}".format(label, e))
+			GraphLoader._run_batches(graph_db, "UNWIND $rows AS row CREATE (n:%s) SET n = row" % cypher_name(label), rows, batch_size)
+			logger.info("Imported %d nodes with label %s" % (len(rows), label))
+		for (rel_type, start_node, end_node), rows in edges.items():
+			query = "UNWIND $rows AS row MATCH (p:%s {gid: row.h}), (q:%s {gid: row.t}) CREATE (p)-[rel:%s {name: row.name}]->(q)" % (cypher_name(start_node), cypher_name(end_node), cypher_name(rel_type))
+			GraphLoader._run_batches(graph_db, query, rows, batch_size)
+			logger.info("Imported %d edges of relation type %s" % (len(rows), rel_type))
+
+	def export_neo4j_csv(self, graph: MTG, out_dir: str) -> Dict:
+		"""
+		write node and relationship CSV files for neo4j-admin import, one file per label and per relation type.
+		Returns the file lists, to be passed as --nodes and --relationships with --id-type=INTEGER.
+		"""
+		if not os.path.exists(out_dir):
+			os.makedirs(out_dir)
+		nodes, edges = self._group_graph(graph)
+		res = {'nodes': [], 'relationships': []}
+		for index, (label, rows) in enumerate(nodes.items()):
+			prop_names = [prop['name'] for prop in graph.get_concept(label, 'entity')['properties']]
+			path = os.path.join(out_dir, 'nodes_%d_%s.csv' % (index, file_safe_name(label)))
+			with open(path, 'w', newline='', encoding='utf-8') as f:
+				writer = csv.writer(f)
+				writer.writerow(['gid:ID(%s)' % label] + prop_names + [':LABEL'])
+				for row in rows:
+					writer.writerow([row['gid']] + [row.get(name) for name in prop_names] + [label])
+			res['nodes'].append(path)
+		for index, ((rel_type, start_node, end_node), rows) in enumerate(edges.items()):
+			path = os.path.join(out_dir, 'relationships_%d_%s.csv' % (index, file_safe_name(rel_type)))
+			with open(path, 'w', newline='', encoding='utf-8') as f:
+				writer = csv.writer(f)
+				writer.writerow([':START_ID(%s)' % start_node, ':END_ID(%s)' % end_node, 'name', ':TYPE'])
+				for row in rows:
+					writer.writerow([row['h'], row['t'], row['name'], rel_type])
+			res['relationships'].append(path)
+		logger.info("Exported neo4j-admin import files to {}".format(out_dir))
+		return res
+
+
+def file_safe_name(name: str) -> str:
+	return re.sub(r'[^0-9A-Za-z_.-]', '_', str(name)).strip('_')[:64]
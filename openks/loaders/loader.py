@@ -12,7 +12,14 @@ from io import TextIOWrapper
 import json
 import logging
 import os
-from ..abstract.mmd import MMD
+from functools import partial
+from itertools import islice
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import numpy as np
+from ..abstract.mmd import MMD, ChunkedRows
+from ..abstract.columnar import ColumnTable, ColumnTableBuilder, StringColumn
+from .parallel_parser import parse_entities, parse_triples, newline_aligned_ranges, EntityColumns, TripleColumns
+from .parse_cache import ParseCache
 
 logger = logging.getLogger(__name__)
 
@@ -47,6 +54,59 @@ def flatten_json(y):
 	return out
 
 
+def csv_rows(uri: str, member: str = None):
+	""" generate csv body rows of a local file or of a member inside a zip file, skipping the header line """
+	if member:
+		with ZipFile(uri) as zf:
+			with zf.open(member, 'r') as infile:
+				csv_reader = csv.reader(TextIOWrapper(infile, 'utf-8'))
+				next(csv_reader, None)
+				for row in csv_reader:
+					yield row
+	else:
+		with open(uri, newline='', encoding='utf-8') as infile:
+			csv_reader = csv.reader(infile)
+			next(csv_reader, None)
+			for row in csv_reader:
+				yield row
+
+
+def split_rows(path: str, delimiter: str):
+	""" generate stripped field tuples from a delimited text file line by line """
+	with open(path, 'r') as load_f:
+		for line in load_f:
+			yield tuple([item.strip() for item in line.split(delimiter)])
+
+
+def read_openbase_range(path: str, start: int = 0, end: int = None) -> ColumnTable:
+	""" stream flattened OpenBase JSON lines of a byte range into a ColumnTable in a single pass """
+	builder = ColumnTableBuilder()
+	with open(path, 'rb') as load_f:
+		load_f.seek(start)
+		while end is None or load_f.tell() < end:
+			line = load_f.readline()
+			if not line:
+				break
+			if line.strip():
+				builder.add(flatten_json(json.loads(line.decode('utf-8'))))
+	return builder.build()
+
+
+def read_openbase(path: str, num_workers: int = 1) -> ColumnTable:
+	""" read an OpenBase JSON lines file, byte ranges aligned to line ends are read in parallel when num_workers > 1 """
+	if num_workers <= 1:
+		return read_openbase_range(path)
+	ranges = newline_aligned_ranges(path, num_workers)
+	with ProcessPoolExecutor(max_workers=num_workers) as pool:
+		tables = list(pool.map(read_openbase_range, [path] * len(ranges), *zip(*ranges))) if ranges else []
+	return ColumnTable.concat(tables)
+
+
+def cypher_name(name: str) -> str:
+	""" quote a label or relation type for use in a Cypher query """
+	return '`' + str(name).replace('`', '``') + '`'
+
+
 class LoaderConfig(object):
 	"""
 	The config object to load data from various sources
@@ -57,7 +117,15 @@ class LoaderConfig(object):
 		file_type: FileType = FileType.CSV,
 		source_uris: List = [], 
 		data_name: str = '',
-		graph_db = None
+		graph_db = None,
+		columnar: bool = False,
+		streaming: bool = False,
+		chunk_size: int = 10000,
+		num_workers: int = 1,
+		page_size: int = 0,
+		use_cache: bool = False,
+		cache_dir: str = os.path.join(os.path.expanduser('~'), '.cache', 'openks', 'loaders'),
+		cache_size: int = 4 * 1024 ** 3
 		) -> None:
 		self._source_type = source_type
 		self._file_type = file_type
@@ -65,6 +133,20 @@ class LoaderConfig(object):
 		self._source_uri = source_uris
 		self._data_name = data_name
 		self._graph_db = graph_db
+		# build MTG with array-backed columns instead of tuple lists
+		self._columnar = columnar
+		# keep bodies as re-iterable chunked generators instead of lists
+		self._streaming = streaming
+		self._chunk_size = chunk_size
+		# processes used to parse OPENKS entities and triples files into arrays
+		self._num_workers = num_workers
+		# records converted into arrays at a time when streaming from neo4j, 0 reads everything in one pass
+		self._page_size = page_size
+		# opt-in reuse of parse results of unchanged local files, least recently used entries are evicted beyond cache_size bytes.
+		# Entries are pickles and loading one runs arbitrary code, cache_dir must only be writable by trusted users
+		self._use_cache = use_cache
+		self._cache_dir = cache_dir
+		self._cache_size = cache_size
 
 	@property
 	def source_type(self):
@@ -106,16 +188,108 @@ class LoaderConfig(object):
 	def graph_db(self, graph_db: str):
 		self._graph_db = graph_db
 
+	@property
+	def columnar(self):
+		return self._columnar
+	
+	@columnar.setter
+	def columnar(self, columnar: bool):
+		self._columnar = columnar
+
+	@property
+	def streaming(self):
+		return self._streaming
+	
+	@streaming.setter
+	def streaming(self, streaming: bool):
+		self._streaming = streaming
+
+	@property
+	def chunk_size(self):
+		return self._chunk_size
+	
+	@chunk_size.setter
+	def chunk_size(self, chunk_size: int):
+		self._chunk_size = chunk_size
+
+	@property
+	def num_workers(self):
+		return self._num_workers
+	
+	@num_workers.setter
+	def num_workers(self, num_workers: int):
+		self._num_workers = num_workers
+
+	@property
+	def page_size(self):
+		return self._page_size
+	
+	@page_size.setter
+	def page_size(self, page_size: int):
+		self._page_size = page_size
+
+	@property
+	def use_cache(self):
+		return self._use_cache
+	
+	@use_cache.setter
+	def use_cache(self, use_cache: bool):
+		self._use_cache = use_cache
+
+	@property
+	def cache_dir(self):
+		return self._cache_dir
+	
+	@cache_dir.setter
+	def cache_dir(self, cache_dir: str):
+		self._cache_dir = cache_dir
+
+	@property
+	def cache_size(self):
+		return self._cache_size
+	
+	@cache_size.setter
+	def cache_size(self, cache_size: int):
+		self._cache_size = cache_size
+
+	def cache_options(self) -> dict:
+		""" options that change the parse result and so take part in cache keys """
+		return {
+			'source_type': self.source_type.value,
+			'file_type': self.file_type.value,
+			'data_name': self.data_name,
+			'columnar': self.columnar,
+			'streaming': self.streaming,
+			'chunk_size': self.chunk_size,
+			'num_workers': self.num_workers
+		}
+
+	def parse_cache(self):
+		""" ParseCache for this config, or None when caching does not apply """
+		# streaming bodies are not parsed up front and other sources have no file identity to key on
+		if not self.use_cache or self.streaming or self.source_type != SourceType.LOCAL_FILE:
+			return None
+		return ParseCache(self.cache_dir, self.cache_size)
+
 
 loader_config = LoaderConfig()
 mmd = MMD()
 
 class Loader(object):
 	""" basic loader from multiple data sources """
+	# subclasses caching a derived result as a whole turn this off
+	_cache_dataset = True
 
 	def __init__(self, config: loader_config) -> None:
 		self.config = config
-		self.dataset = self._read_data()
+		cache = config.parse_cache() if self._cache_dataset else None
+		key = cache.key('dataset', config.source_uris, config.cache_options()) if cache else None
+		self.dataset = cache.get(key) if cache else None
+		if self.dataset is None:
+			self.dataset = self._read_data()
+			self.dataset.name = config.data_name
+			if cache:
+				cache.put(key, self.dataset)
 		self.dataset.name = config.data_name
 
 	def _read_data(self) -> MMD:
@@ -133,25 +307,34 @@ class Loader(object):
 
 	def _read_files(self) -> MMD:
 		""" Currently support csv file format from local
-		    support *.csv and *labels.csv files either in a zip file or directly in a folder """
+		    support *.csv and *labels.csv files either in a zip file or directly in a folder
+		    with config.streaming, csv, OPENKS graph and text bodies are ChunkedRows read incrementally on each pass """
 		headers = []
 		bodies = []
+		streaming = self.config.streaming
+		chunk_size = self.config.chunk_size
 		if self.config.file_type == FileType.CSV:
 			if self.config.source_uris.endswith('.zip'):
 				with ZipFile(self.config.source_uris) as zf:
 					for item in zf.namelist():
 						if item.endswith('.csv'):
-							# with zf.open(item, 'r') as infile:
-							csv_reader = csv.reader(TextIOWrapper(zf.open(item, 'r'), 'utf-8'))
-							headers.append(next(csv_reader))
-							# need to find a more efficient way, the csv reader is a generator that can only be used once
-							bodies.append(list(csv_reader))
+							with zf.open(item, 'r') as infile:
+								csv_reader = csv.reader(TextIOWrapper(infile, 'utf-8'))
+								headers.append(next(csv_reader))
+								if streaming:
+									bodies.append(ChunkedRows(partial(csv_rows, self.config.source_uris, item), chunk_size))
+								else:
+									bodies.append(list(csv_reader))
 			elif self.config.source_uris.endswith('.csv'):
 				for uri in self.config.source_uris:
 					if uri.endswith('.csv'):
-						csv_reader = csv.reader(open(uri, newline='', encoding='utf-8'))
-						headers.append(next(csv_reader))
-						bodies.append(list(csv_reader))
+						with open(uri, newline='', encoding='utf-8') as infile:
+							csv_reader = csv.reader(infile)
+							headers.append(next(csv_reader))
+							if streaming:
+								bodies.append(ChunkedRows(partial(csv_rows, uri), chunk_size))
+							else:
+								bodies.append(list(csv_reader))
 		elif self.config.file_type == FileType.CNSCHEMA:
 			header = ['@id', 'label_@language', 'label_@value']
 			body = []
@@ -172,40 +355,35 @@ class Loader(object):
 			headers.append(tuple(header))
 			bodies.append(body)
 		elif self.config.file_type == FileType.OPENBASE:
-			header = []
-			body = []
-			with open(self.config.source_uris, 'r') as load_f:
-				for line in load_f:
-					row = []
-					flat_line = flatten_json(json.loads(line))
-					for key in flat_line:
-						if key not in header:
-							header.append(key)
-					for h in header:
-						if h in flat_line:
-							row.append(flat_line[h])
-						else:
-							row.append(None)
-					body.append(row)
-			for item in body:
-				if len(item) < len(header):
-					item.extend([None for i in range(len(header) - len(item))])
-			headers.append(tuple(header))
-			bodies.append(tuple([tuple(item) for item in body]))
+			# column-wise body, missing values of sparse records are kept as null masks rather than padding
+			body = read_openbase(self.config.source_uris, self.config.num_workers)
+			headers.append(tuple(body.headers))
+			bodies.append(body)
 		elif self.config.file_type == FileType.OPENKS:
 			# knowledge graph dataset loading 
 			if os.path.exists(self.config.source_uris + '/entities') and os.path.exists(self.config.source_uris + '/triples'):
 				headers = [['entities'], ['triples']]
-				for file in ['entities', 'triples']:
-					tmp = []
-					with open(self.config.source_uris + '/' + file, 'r') as load_f:
-						for line in load_f:
-							tmp.append(tuple([item.strip() for item in line.split('\t')]))
-						bodies.append(tuple(tmp))
+				if self.config.num_workers > 1 and not streaming:
+					# parse byte ranges of both files in a process pool straight into arrays
+					bodies.append(parse_entities(self.config.source_uris + '/entities', self.config.num_workers))
+					bodies.append(parse_triples(self.config.source_uris + '/triples', self.config.num_workers))
+				else:
+					for file in ['entities', 'triples']:
+						if streaming:
+							bodies.append(ChunkedRows(partial(split_rows, self.config.source_uris + '/' + file, '\t'), chunk_size))
+							continue
+						tmp = []
+						with open(self.config.source_uris + '/' + file, 'r') as load_f:
+							for line in load_f:
+								tmp.append(tuple([item.strip() for item in line.split('\t')]))
+							bodies.append(tuple(tmp))
 			# general text dataset loading
 			elif os.path.exists(self.config.source_uris + '/train') and os.path.exists(self.config.source_uris + '/valid'):
 				headers = [['train'], ['valid']]
 				for file in ['train', 'valid']:
+					if streaming:
+						bodies.append(ChunkedRows(partial(split_rows, self.config.source_uris + '/' + file, '@@'), chunk_size))
+						continue
 					tmp = []
 					with open(self.config.source_uris + '/' + file, 'r') as load_f:
 						for line in load_f:
@@ -224,6 +402,8 @@ class Loader(object):
 		headers = []
 		bodies = []
 		logger.info('Loading data from GraphDB...')
+		if self.config.file_type == FileType.OPENKS and self.config.page_size > 0:
+			return self._read_neo4j_paged(graph_db)
 		if self.config.file_type == FileType.OPENKS:
 			headers = [['entities'], ['triples']]
 			entities = []
@@ -251,6 +431,88 @@ class Loader(object):
 		mmd.bodies = bodies
 		return mmd
 
+	@staticmethod
+	def _read_chunks(graph_db, query: str, chunk_size: int):
+		""" run a projection query once and yield its records chunk_size at a time as they are streamed from the server """
+		records = iter(graph_db.run(query))
+		while True:
+			chunk = list(islice(records, chunk_size))
+			if not chunk:
+				break
+			yield chunk
+
+	def _read_neo4j_paged(self, graph_db) -> MMD:
+		"""
+		read entities and triples with one streamed projection query per label and relation type, read concurrently.
+		Records go into id arrays page_size at a time, so only one page of records per label is held at a time.
+		"""
+		page_size = self.config.page_size
+		labels = list(graph_db.schema.node_labels)
+		rel_types = list(graph_db.schema.relationship_types)
+
+		def read_label(code):
+			query = "MATCH (n:%s) RETURN n.gid AS gid, n.name AS name" % cypher_name(labels[code])
+			ids = []
+			names = []
+			dropped = 0
+			for page in self._read_chunks(graph_db, query, page_size):
+				# entities without gid cannot be mapped to entity ids
+				rows = len(page)
+				page = [row for row in page if row['gid'] is not None]
+				dropped += rows - len(page)
+				ids.append(np.fromiter((row['gid'] for row in page), dtype=np.int64, count=len(page)))
+				names.append(StringColumn.from_list(row['name'] for row in page))
+			if dropped:
+				logger.warning('Dropped %d entities of label %s without gid' % (dropped, labels[code]))
+			logger.info('Loaded entity label: ' + labels[code])
+			return ids, names
+
+		def read_relation(code):
+			query = "MATCH (a)-[r:%s]->(b) RETURN a.gid AS head, b.gid AS tail, r.name AS name" % cypher_name(rel_types[code])
+			ids = []
+			names = []
+			dropped = 0
+			for page in self._read_chunks(graph_db, query, page_size):
+				# relationships with an endpoint without gid cannot be mapped to entity ids
+				rows = len(page)
+				page = [row for row in page if row['head'] is not None and row['tail'] is not None]
+				dropped += rows - len(page)
+				chunk = np.empty((len(page), 3), dtype=np.int64)
+				chunk[:, 0] = np.fromiter((row['head'] for row in page), dtype=np.int64, count=len(page))
+				chunk[:, 1] = code
+				chunk[:, 2] = np.fromiter((row['tail'] for row in page), dtype=np.int64, count=len(page))
+				ids.append(chunk)
+				names.append(StringColumn.from_list(row['name'] for row in page))
+			if dropped:
+				logger.warning('Dropped %d relationships of type %s with an endpoint without gid' % (dropped, rel_types[code]))
+			logger.info('Loaded relation type: ' + rel_types[code])
+			return ids, names
+
+		with ThreadPoolExecutor(max_workers=max(1, self.config.num_workers)) as pool:
+			label_parts = list(pool.map(read_label, range(len(labels))))
+			rel_parts = list(pool.map(read_relation, range(len(rel_types))))
+
+		entity_ids = [ids for part in label_parts for ids in part[0]]
+		entity_types = [np.full(len(ids), code, dtype=np.int32) for code, part in enumerate(label_parts) for ids in part[0]]
+		entity_names = [names for part in label_parts for names in part[1]]
+		triple_ids = [ids for part in rel_parts for ids in part[0]]
+		triple_names = [names for part in rel_parts for names in part[1]]
+		entities = EntityColumns(
+			np.concatenate(entity_ids or [np.zeros(0, dtype=np.int64)]),
+			np.concatenate(entity_types or [np.zeros(0, dtype=np.int32)]),
+			labels,
+			[StringColumn.concat(entity_names)] if entity_names else []
+		)
+		triples = TripleColumns(
+			np.concatenate(triple_ids or [np.zeros((0, 3), dtype=np.int64)]),
+			rel_types,
+			[StringColumn.concat(triple_names)] if triple_names else []
+		)
+		mmd.name = self.config.data_name
+		mmd.headers = [['entities'], ['triples']]
+		mmd.bodies = [entities, triples]
+		return mmd
+
 	def _read_hdfs(self):
 		""" Access HDFS with delimiter """
 		raise NotImplementedError()
@@ -0,0 +1,137 @@
+# Copyright (c) 2021 OpenKS Authors, DCD Research Lab, Zhejiang University.
+# All Rights Reserved.
+
+"""
+Multi-process parsing of OPENKS entities and triples files into NumPy columns.
+Each file is cut into byte ranges aligned to line ends, ranges are parsed in a process pool and joined in file order.
+"""
+import os
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Tuple
+import numpy as np
+from ..abstract.columnar import encode_strings, rows_to_string_columns, concat_string_columns
+
+logger = logging.getLogger(__name__)
+
+
+class EntityColumns(object):
+	""" parsed entities file: int64 ids, int32 type codes into vocab and attribute StringColumns """
+	def __init__(self, ids: np.ndarray, types: np.ndarray, vocab: List, attrs: List) -> None:
+		self.ids = ids
+		self.types = types
+		self.vocab = vocab
+		self.attrs = attrs
+
+	def __len__(self) -> int:
+		return len(self.ids)
+
+	def rows(self):
+		""" iterate rows in the string tuple format of a materialized entities body """
+		for i in range(len(self)):
+			attrs = [col[i] for col in self.attrs]
+			yield tuple([str(self.ids[i]), self.vocab[self.types[i]]] + [item for item in attrs if item is not None])
+
+	def head(self):
+		return next(self.rows(), None)
+
+
+class TripleColumns(object):
+	""" parsed triples file: (n, 3) int64 array of (head, relation code, tail), relation vocab and attribute StringColumns """
+	def __init__(self, ids: np.ndarray, vocab: List, attrs: List) -> None:
+		self.ids = ids
+		self.vocab = vocab
+		self.attrs = attrs
+
+	def __len__(self) -> int:
+		return len(self.ids)
+
+	def rows(self):
+		""" iterate rows in the string tuple format of a materialized triples body """
+		for i in range(len(self)):
+			attrs = [col[i] for col in self.attrs]
+			head, rel, tail = self.ids[i]
+			yield tuple([str(head), self.vocab[rel], str(tail)] + [item for item in attrs if item is not None])
+
+	def head(self):
+		return next(self.rows(), None)
+
+
+def newline_aligned_ranges(path: str, num_parts: int) -> List[Tuple[int, int]]:
+	""" split a file into at most num_parts byte ranges, every range except the last ends right after a newline """
+	size = os.path.getsize(path)
+	bounds = [0]
+	with open(path, 'rb') as f:
+		for i in range(1, num_parts):
+			pos = max(size * i // num_parts, bounds[-1])
+			if pos >= size:
+				break
+			f.seek(pos)
+			f.readline()
+			pos = f.tell()
+			if pos >= size:
+				break
+			if pos > bounds[-1]:
+				bounds.append(pos)
+	bounds.append(size)
+	return [(bounds[i], bounds[i+1]) for i in range(len(bounds) - 1) if bounds[i+1] > bounds[i]]
+
+
+def _read_range(path: str, start: int, end: int) -> List[Tuple]:
+	with open(path, 'rb') as f:
+		f.seek(start)
+		lines = f.read(end - start).decode('utf-8').split('\n')
+	return [tuple([item.strip() for item in line.split('\t')]) for line in lines if line.strip()]
+
+
+def _parse_entity_range(path: str, start: int, end: int):
+	rows = _read_range(path, start, end)
+	ids = np.fromiter((int(row[0]) for row in rows), dtype=np.int64, count=len(rows))
+	types, vocab = encode_strings(row[1] for row in rows)
+	return ids, types, vocab, rows_to_string_columns(rows, 2)
+
+
+def _parse_triple_range(path: str, start: int, end: int):
+	rows = _read_range(path, start, end)
+	ids = np.empty((len(rows), 3), dtype=np.int64)
+	ids[:, 0] = np.fromiter((int(row[0]) for row in rows), dtype=np.int64, count=len(rows))
+	ids[:, 1], vocab = encode_strings(row[1] for row in rows)
+	ids[:, 2] = np.fromiter((int(row[2]) for row in rows), dtype=np.int64, count=len(rows))
+	return ids, vocab, rows_to_string_columns(rows, 3)
+
+
+def _merge_codes(codes: List[np.ndarray], vocabs: List[List]) -> Tuple[np.ndarray, List]:
+	""" remap per-range dictionary codes onto one global vocab in range order """
+	res = []
+	vocab = []
+	for local_codes, local_vocab in zip(codes, vocabs):
+		lookup, vocab = encode_strings(local_vocab, vocab=vocab)
+		res.append(lookup[local_codes] if len(local_codes) else local_codes)
+	return np.concatenate(res or [np.zeros(0, dtype=np.int32)]).astype(np.int32), vocab
+
+
+def parse_entities(path: str, num_workers: int) -> EntityColumns:
+	""" parse an OPENKS entities file with num_workers processes """
+	ranges = newline_aligned_ranges(path, num_workers)
+	with ProcessPoolExecutor(max_workers=num_workers) as pool:
+		parts = list(pool.map(_parse_entity_range, [path] * len(ranges), *zip(*ranges))) if ranges else []
+	ids = np.concatenate([part[0] for part in parts] or [np.zeros(0, dtype=np.int64)])
+	types, vocab = _merge_codes([part[1] for part in parts], [part[2] for part in parts])
+	attrs = concat_string_columns([part[3] for part in parts], [len(part[0]) for part in parts])
+	logger.info("Parsed {} entities from {} in {} ranges.".format(len(ids), path, len(ranges)))
+	return EntityColumns(ids, types, vocab, attrs)
+
+
+def parse_triples(path: str, num_workers: int) -> TripleColumns:
+	""" parse an OPENKS triples file with num_workers processes """
+	ranges = newline_aligned_ranges(path, num_workers)
+	with ProcessPoolExecutor(max_workers=num_workers) as pool:
+		parts = list(pool.map(_parse_triple_range, [path] * len(ranges), *zip(*ranges))) if ranges else []
+	ids = np.concatenate([part[0] for part in parts] or [np.zeros((0, 3), dtype=np.int64)])
+	if len(ids):
+		ids[:, 1], vocab = _merge_codes([part[0][:, 1] for part in parts], [part[1] for part in parts])
+	else:
+		vocab = []
+	attrs = concat_string_columns([part[2] for part in parts], [len(part[0]) for part in parts])
+	logger.info("Parsed {} triples from {} in {} ranges.".format(len(ids), path, len(ranges)))
+	return TripleColumns(ids, vocab, attrs)
@@ -0,0 +1,149 @@
+# Copyright (c) 2021 OpenKS Authors, DCD Research Lab, Zhejiang University.
+# All Rights Reserved.
+
+"""
+On-disk cache of parsed MMD/MTG results, keyed by the content identity of the source files and the loader options
+"""
+import os
+import json
+import pickle
+import hashlib
+import logging
+from typing import Any, List
+
+logger = logging.getLogger(__name__)
+
+CACHE_FORMAT_VERSION = 1
+
+# modules whose code decides the parse result, a change to any of them invalidates the cached results
+PARSER_MODULES = [
+	'loaders/loader.py', 'loaders/graph_loader.py', 'loaders/parallel_parser.py',
+	'abstract/mmd.py', 'abstract/mtg.py', 'abstract/columnar.py'
+]
+
+_parser_digest = None
+
+
+def parser_digest() -> str:
+	""" digest of the package version and the source of the parser modules """
+	global _parser_digest
+	if _parser_digest is None:
+		from .. import __version__
+		root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+		digest = hashlib.sha256(__version__.encode('utf-8'))
+		for name in PARSER_MODULES:
+			path = os.path.join(root, name)
+			if os.path.exists(path):
+				with open(path, 'rb') as f:
+					digest.update(f.read())
+		_parser_digest = digest.hexdigest()
+	return _parser_digest
+
+
+def source_files(source_uris) -> List[str]:
+	""" local files behind source_uris, directories are walked recursively """
+	uris = source_uris if isinstance(source_uris, (list, tuple)) else [source_uris]
+	files = []
+	for uri in uris:
+		if os.path.isdir(uri):
+			for root, dirs, names in os.walk(uri):
+				dirs.sort()
+				files.extend(os.path.join(root, name) for name in sorted(names))
+		elif os.path.exists(uri):
+			files.append(uri)
+	return files
+
+
+class _LimitedWriter(object):
+	""" file wrapper failing once more than limit bytes are written, so oversized results stop early """
+	def __init__(self, f, limit: int) -> None:
+		self.f = f
+		self.limit = limit
+		self.size = 0
+
+	def write(self, data) -> int:
+		self.size += len(data)
+		if self.size > self.limit:
+			raise OverflowError(self.size)
+		return self.f.write(data)
+
+
+class ParseCache(object):
+	"""
+	Pickled parse results stored as <key>.pkl files in cache_dir.
+	Entries are touched on every hit and the least recently used ones are evicted once the directory exceeds max_bytes.
+	Unpickling an entry executes code from the file, cache_dir has to be trusted like the package itself.
+	"""
+	def __init__(self, cache_dir: str, max_bytes: int) -> None:
+		self.cache_dir = cache_dir
+		self.max_bytes = max_bytes
+
+	def key(self, kind: str, source_uris, options: dict) -> str:
+		""" digest of the result kind, source file paths, sizes and mtimes, the loader options and the parser code """
+		files = []
+		for path in source_files(source_uris):
+			stat = os.stat(path)
+			files.append([os.path.abspath(path), stat.st_size, stat.st_mtime_ns])
+		content = {'version': CACHE_FORMAT_VERSION, 'parser': parser_digest(), 'kind': kind, 'files': files, 'options': options}
+		return hashlib.sha256(json.dumps(content, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+	def _path(self, key: str) -> str:
+		return os.path.join(self.cache_dir, key + '.pkl')
+
+	def get(self, key: str) -> Any:
+		""" cached object for key or None """
+		path = self._path(key)
+		if not os.path.exists(path):
+			return None
+		try:
+			with open(path, 'rb') as f:
+				res = pickle.load(f)
+			os.utime(path)
+			logger.info("Loaded parsed data from cache {}".format(path))
+			return res
+		except Exception as e:
+			logger.warn("Cache entry {} could not be read and is ignored: {}".format(path, e))
+			return None
+
+	def put(self, key: str, value: Any) -> None:
+		path = self._path(key)
+		try:
+			if not os.path.exists(self.cache_dir):
+				os.makedirs(self.cache_dir)
+			# pickled straight into a temporary file, the result is never held a second time as bytes
+			tmp_path = path + '.tmp'
+			try:
+				with open(tmp_path, 'wb') as f:
+					pickle.dump(value, _LimitedWriter(f, self.max_bytes), protocol=pickle.HIGHEST_PROTOCOL)
+			except OverflowError:
+				os.remove(tmp_path)
+				logger.info("Parsed data exceeds the cache size limit of {} bytes and is not cached.".format(self.max_bytes))
+				return None
+			os.replace(tmp_path, path)
+			self.evict()
+		except Exception as e:
+			if os.path.exists(path + '.tmp'):
+				os.remove(path + '.tmp')
+			logger.warning("Parsed data could not be cached to {}: {}".format(path, e))
+
+	def evict(self) -> None:
+		""" remove least recently used entries until the cache fits into max_bytes """
+		entries = []
+		for name in os.listdir(self.cache_dir):
+			if name.endswith('.pkl'):
+				stat = os.stat(os.path.join(self.cache_dir, name))
+				entries.append((stat.st_mtime, stat.st_size, name))
+		entries.sort()
+		total = sum(item[1] for item in entries)
+		for mtime, size, name in entries:
+			if total <= self.max_bytes:
+				break
+			os.remove(os.path.join(self.cache_dir, name))
+			total -= size
+			logger.info("Evicted cache entry {}".format(name))
+
+	def clear(self) -> None:
+		if os.path.exists(self.cache_dir):
+			for name in os.listdir(self.cache_dir):
+				if name.endswith('.pkl'):
+					os.remove(os.path.join(self.cache_dir, name))
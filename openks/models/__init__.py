@@ -3,9 +3,8 @@
 
 """
 init
+platform packages (paddle, pytorch, tensorflow, mllib) are not imported here,
+OpenKSModel.get_module imports them on first lookup through the manifest
 """
 from .model import *
-from .paddle import *
-from .pytorch import *
-from .tensorflow import *
-from .mllib import *
+from .manifest import *
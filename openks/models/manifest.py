@@ -0,0 +1,95 @@
+# Copyright (c) 2021 OpenKS Authors, DCD Research Lab, Zhejiang University. 
+# All Rights Reserved.
+
+"""
+Declarative manifest of the models shipped with openks, platform -> {registered name: module path}.
+OpenKSModel.get_module imports the module of a name on first lookup, so only the frameworks actually used get loaded.
+Add an entry here when registering a new model, `python -m openks.models.manifest` checks the manifest
+against the names registered by a full import of openks.models.
+"""
+import sys
+import pkgutil
+import importlib
+from typing import Dict, List
+from .model import OpenKSModel
+
+MODEL_MANIFEST = {
+	'PyTorch': {
+		'KGLearn': 'openks.models.pytorch.kg_learn',
+		'KGLearn_GCN': 'openks.models.pytorch.kg_learn',
+		'KGLearn-dist': 'openks.models.pytorch.kg_learn_dist',
+		'KELearn': 'openks.models.pytorch.ke_learn',
+		'TransE': 'openks.models.pytorch.kg_modules.TransE',
+		'TransH': 'openks.models.pytorch.kg_modules.TransH',
+		'TransR': 'openks.models.pytorch.kg_modules.TransR',
+		'RotatE': 'openks.models.pytorch.kg_modules.RotatE',
+		'DyE': 'openks.models.pytorch.kg_modules.DyE',
+		'GCN': 'openks.models.pytorch.kg_modules.gcn_torch',
+		'LinkPreiction': 'openks.models.pytorch.kg_modules.tasks',
+		'NodeMatching': 'openks.models.pytorch.kg_modules.tasks',
+		'NodedClassifier': 'openks.models.pytorch.kg_modules.tasks',
+		'RelationPrediction': 'openks.models.pytorch.kg_modules.tasks',
+		'UnsupervisedGCN': 'openks.models.pytorch.kg_modules.gcn',
+		'GraphEncoder': 'openks.models.pytorch.kg_modules.graph_encoder',
+		'entity-extract': 'openks.models.pytorch.ke_modules.entity_extract',
+		'question-embedding': 'openks.models.pytorch.ke_modules.question_embedding',
+	},
+	'Paddle': {
+		'KGLearn': 'openks.models.paddle.kg_learn',
+		'KELearn': 'openks.models.paddle.ke_learn',
+		'TransE': 'openks.models.paddle.kg_modules.TransE',
+		'TransR': 'openks.models.paddle.kg_modules.TransR',
+		'GCN': 'openks.models.paddle.kg_modules.GCN',
+		'entity-extract': 'openks.models.paddle.ke_modules.entity_extract',
+	},
+	'TensorFlow': {
+		'KELearn': 'openks.models.tensorflow.ke_learn',
+		'recommendation': 'openks.models.tensorflow.rec_learn',
+		'industry-entity-extract': 'openks.models.tensorflow.ke_modules.industry_entity_extract',
+		'GCNRec': 'openks.models.tensorflow.rec_modules.gcn_rec',
+	},
+	'MLLib': {
+		'KELearn': 'openks.models.mllib.ke_learn',
+		'keyphrase-rake': 'openks.models.mllib.ke_modules.keyphrase_extract',
+		'keyphrase-rake-topic': 'openks.models.mllib.ke_modules.keyphrase_extract',
+	},
+}
+
+OpenKSModel.declare(MODEL_MANIFEST)
+
+
+def manifest_diff() -> Dict[str, List]:
+	"""
+	import every module under openks.models and compare the names their register decorators added with MODEL_MANIFEST:
+	registered names missing from the manifest, declared names nothing registered, names declared with another module,
+	and the modules that could not be imported (e.g. their framework is not installed), whose names are not compared
+	"""
+	package = importlib.import_module('openks.models')
+	failed = set()
+	names = [info.name for info in pkgutil.walk_packages(package.__path__, package.__name__ + '.', onerror=failed.add)]
+	# declared modules below a package that failed to import are not reached by the walk
+	for name in names + sorted(set(path for modules in MODEL_MANIFEST.values() for path in modules.values())):
+		try:
+			importlib.import_module(name)
+		except Exception:
+			failed.add(name)
+	registered = {}
+	for platform, modules in OpenKSModel._registry.items():
+		for name, module in modules.items():
+			if module.__module__.startswith(package.__name__ + '.'):
+				registered[(platform, name)] = module.__module__
+	declared = {(platform, name): path for platform, modules in MODEL_MANIFEST.items() for name, path in modules.items()}
+	return {
+		'undeclared': sorted(key for key in registered if key not in declared),
+		'unregistered': sorted(key for key, path in declared.items() if key not in registered and path not in failed),
+		'wrong_module': sorted(key for key in registered if key in declared and declared[key] != registered[key]),
+		'not_imported': sorted(failed)
+	}
+
+
+if __name__ == '__main__':
+	diff = manifest_diff()
+	for kind, items in diff.items():
+		for item in items:
+			print('%s: %s' % (kind, item))
+	sys.exit(1 if diff['undeclared'] or diff['unregistered'] or diff['wrong_module'] else 0)
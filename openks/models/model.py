@@ -5,18 +5,23 @@
 An abstract class for openks models to be trained with Paddle
 """
 import logging
+import importlib
 from typing import Tuple, List, Any
-import torch
-import torch.nn as nn
-from torch.utils import data
-import paddle.fluid as fluid
-from paddle.fluid import Variable
 from ..common.register import Register
 from ..abstract.mtg import MTG
 from ..abstract.mmd import MMD
 
 logger = logging.getLogger(__name__)
 
+# base classes that need a deep learning framework are imported on first access
+_FRAMEWORK_BASES = {'TorchModel': '.torch_model', 'TorchDataset': '.torch_model'}
+
+
+def __getattr__(name: str) -> Any:
+	if name in _FRAMEWORK_BASES:
+		return getattr(importlib.import_module(_FRAMEWORK_BASES[name], __package__), name)
+	raise AttributeError("module {} has no attribute {}".format(__name__, name))
+
 
 class PaddleModel(Register):
 	def __init__(self, **kwargs):
@@ -43,54 +48,6 @@ class PaddleModel(Register):
 
 
 
-class TorchModel(nn.Module, Register):
-	def __init__(self, **kwargs):
-		super(TorchModel, self).__init__()
-
-	def forward(self, *args):
-		return NotImplemented
-
-	def loss(self, *args):
-		return NotImplemented
-
-	def predict(self, *args):
-		return NotImplemented
-
-	def _algorithm(self, *args):
-		return NotImplemented
-
-	# getter and setter for Ray distributed training
-	def get_weights(self):
-		return {k: v.cpu() for k, v in self.state_dict().items()}
-
-	def set_weights(self, weights):
-		self.load_state_dict(weights)
-
-	def get_gradients(self):
-		grads = []
-		for p in self.parameters():
-			grad = None if p.grad is None else p.grad.data.cpu().numpy()
-			grads.append(grad)
-		return grads
-
-	def set_gradients(self, gradients):
-		for g, p in zip(gradients, self.parameters()):
-			if g is not None:
-				p.grad = torch.from_numpy(g)
-
-
-class TorchDataset(data.Dataset):
-	def __init__(self, samples):
-		self.samples = samples
-
-	def __len__(self):
-		return len(self.samples)
-
-	def __getitem__(self, index):
-		item = self.samples[index]
-		return item
-
-
 class TFModel(Register):
 	def __init__(self, **kwargs):
 		return NotImplemented
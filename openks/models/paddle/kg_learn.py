@@ -8,6 +8,8 @@ import paddle.fluid as fluid
 import numpy as np
 from sklearn.model_selection import train_test_split
 from ..model import KGLearnModel
+from ...abstract.triple_stream import TripleStream
+from ...common.profiler import PhaseProfiler, profile_dir
 from ...distributed.openKS_distributed import KSDistributedFactory
 from ...distributed.openKS_distributed.base import RoleMaker
 from ...distributed.openKS_strategy.cpu import CPUStrategy, SyncModeConfig
@@ -25,6 +27,10 @@ class KGLearnPaddle(KGLearnModel):
 
 	def triples_reader(self, ratio=0.01):
 		"""read from triple data files to id triples"""
+		if self.graph.is_columnar:
+			# the id array held by MTG is fed to the split as is
+			train_triples, test_triples = train_test_split(self.graph.get_triple_array(), test_size=ratio)
+			return train_triples, test_triples, test_triples
 		rel2id = self.graph.relation_to_id()
 		train_triples, test_triples = train_test_split(self.graph.triples, test_size=ratio)
 		train_triples = [(triple[0][0], rel2id[triple[0][1]], triple[0][2]) for triple in train_triples]
@@ -32,16 +38,10 @@ class KGLearnPaddle(KGLearnModel):
 		return np.array(train_triples), np.array(test_triples), np.array(test_triples)
 
 	def triples_generator(self, train_triples, batch_size):
-		train_triple_positive_batches = []
-		n = len(train_triples)
-		rand_idx = np.random.permutation(n)
-		n_triple = len(rand_idx)
-		start = 0
-		while start < n_triple:
-			end = min(start + batch_size, n_triple)
-			train_triple_positive = train_triples[rand_idx[start:end]]
-			start = end
-			train_triple_positive_batches.append(train_triple_positive)
+		"""
+		batch generator over an array of training triples or a TripleStream of on-disk ones,
+		batches are cut from a fresh permutation (or stream pass) on every call of the returned loader
+		"""
 
 		def triple_constructor(train_triple_positive):
 			""" training triples generator """
@@ -58,7 +58,12 @@ class KGLearnPaddle(KGLearnModel):
 			return train_triple_positive, train_triple_negative
 
 		def triple_loader():
-			for batch_data in train_triple_positive_batches:
+			if isinstance(train_triples, TripleStream):
+				batches = train_triples.batches(batch_size, np.random)
+			else:
+				rand_idx = np.random.permutation(len(train_triples))
+				batches = (train_triples[rand_idx[start:start+batch_size]] for start in range(0, len(rand_idx), batch_size))
+			for batch_data in batches:
 				yield triple_constructor(batch_data)
 		
 		return triple_loader
@@ -103,6 +108,13 @@ class KGLearnPaddle(KGLearnModel):
 		dist_algorithm = None
 
 		train_triples, valid_triples, test_triples = self.triples_reader(ratio=0.01)
+		if self.args.get('train_file'):
+			# train on the triples of the on-disk file, the graph triples only provide the evaluation split
+			train_triples = TripleStream(
+				self.args['train_file'],
+				block_rows=self.args.get('stream_block_rows', 1 << 20),
+				buffer_rows=self.args.get('shuffle_buffer_rows', 1 << 22)
+			)
 
 		device = fluid.cuda_places() if self.args['gpu'] else fluid.cpu_places()
 
@@ -137,29 +149,37 @@ class KGLearnPaddle(KGLearnModel):
 		exe.run(model.startup_program)
 		exe.run(fluid.default_startup_program())
 
+		# the executor runs forward, backward and optimizer ops as one program, timed together as 'compute'
+		profiler = PhaseProfiler(profile_dir(self.args))
 		best_score = 0.0
 		for epoch in range(1, self.args['epoch'] + 1):
 			print("Starting epoch: ", epoch)
 			loss = 0
 			# train in a batch
-			for batch_feed_dict in train_loader():
-				batch_fetch = exe.run(program, fetch_list=model.train_fetch_vars, feed=batch_feed_dict)
+			for batch_feed_dict in profiler.iterate(train_loader()):
+				with profiler.phase('compute'):
+					batch_fetch = exe.run(program, fetch_list=model.train_fetch_vars, feed=batch_feed_dict)
 				loss += batch_fetch[0]
+				profiler.step()
 			print("Loss: " + str(loss))
 
 			# evaluation periodically
 			if epoch % self.args['eval_freq'] == 0:
 				print("Starting validation...")
-				_, _, hits_at_10, _ = self.evaluate(exe, model.test_program, valid_triples, model.test_feed_list, model.test_fetch_vars)
+				with profiler.phase('eval'):
+					_, _, hits_at_10, _ = self.evaluate(exe, model.test_program, valid_triples, model.test_feed_list, model.test_fetch_vars)
 				score = hits_at_10
 				print("HIT@10: " + str(score))
 				if score > best_score:
 					best_score = score
-					fluid.io.save_params(exe, dirname=self.args['model_dir'], main_program=model.train_program)
+					with profiler.phase('checkpoint'):
+						fluid.io.save_params(exe, dirname=self.args['model_dir'], main_program=model.train_program)
 		if dist:
 			dist_algorithm.stop_worker()
 
 		# load saved model and test
 		fluid.io.load_params(exe, dirname=self.args['model_dir'], main_program=model.train_program)
-		scores = self.evaluate(exe, program, test_triples, model.test_feed_list, model.test_fetch_vars)
+		with profiler.phase('eval'):
+			scores = self.evaluate(exe, program, test_triples, model.test_feed_list, model.test_fetch_vars)
 		print("Test scores: ", scores)
+		profiler.export()
@@ -9,6 +9,7 @@ from .ke_learn import *
 from .kg_modules import *
 from .ke_modules import *
 from .kg_learn_dist import *
-from .gen_modules import *
-from .kg_learn_dist import *
 from .dataloader import *
+from .evaluator import *
+from .partition import *
+from .checkpoint import *
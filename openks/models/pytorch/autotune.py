@@ -0,0 +1,84 @@
+# Copyright (c) 2021 OpenKS Authors, DCD Research Lab, Zhejiang University.
+# All Rights Reserved.
+
+"""
+Helpers of the throughput autotuning mode of the KG embedding trainers: search grids and resident memory sampling
+"""
+import os
+import resource
+import itertools
+import threading
+from typing import Dict, List
+
+_PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+
+def search_grid(space: Dict[str, List]) -> List[Dict]:
+	""" all combinations of the values of space, one dict per configuration """
+	keys = list(space.keys())
+	return [dict(zip(keys, values)) for values in itertools.product(*[space[key] for key in keys])]
+
+
+def _statm(pid) -> List[int]:
+	with open('/proc/%s/statm' % pid) as f:
+		return [int(value) for value in f.read().split()]
+
+
+def _children(pid: int) -> List[int]:
+	children = []
+	for name in os.listdir('/proc'):
+		if not name.isdigit():
+			continue
+		try:
+			with open('/proc/%s/stat' % name) as f:
+				# the command name may contain spaces, fields after it are space separated
+				fields = f.read().rsplit(')', 1)[1].split()
+		except (IOError, IndexError):
+			continue
+		if int(fields[1]) == pid:
+			children.append(int(name))
+	return children
+
+
+def process_rss() -> int:
+	"""
+	resident bytes of this process plus the private resident bytes of its child processes (DataLoader workers),
+	pages workers share with the parent after fork are counted once; without /proc the peak RSS of this process
+	"""
+	if not os.path.exists('/proc/self/statm'):
+		return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+	total = _statm('self')[1]
+	for child in _children(os.getpid()):
+		try:
+			size, resident, shared = _statm(child)[:3]
+		except (IOError, ValueError):
+			continue
+		total += resident - shared
+	return total * _PAGE_SIZE
+
+
+class RSSMonitor(object):
+	""" context manager sampling process_rss from a background thread every interval seconds, peak holds the maximum """
+	def __init__(self, interval: float = 0.05) -> None:
+		self.interval = interval
+		self.peak = 0
+		self._stop = threading.Event()
+		self._thread = None
+
+	def _sample(self) -> None:
+		while True:
+			self.peak = max(self.peak, process_rss())
+			if self._stop.wait(self.interval):
+				break
+
+	def __enter__(self) -> 'RSSMonitor':
+		self.peak = process_rss()
+		self._stop.clear()
+		self._thread = threading.Thread(target=self._sample, daemon=True)
+		self._thread.start()
+		return self
+
+	def __exit__(self, *exc) -> None:
+		self._stop.set()
+		self._thread.join()
+		self.peak = max(self.peak, process_rss())
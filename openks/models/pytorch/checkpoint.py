@@ -0,0 +1,197 @@
+# Copyright (c) 2021 OpenKS Authors, DCD Research Lab, Zhejiang University.
+# All Rights Reserved.
+
+"""
+Background checkpoint writing, the trainer only pays for an in-memory snapshot of the state
+"""
+import os
+import re
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Tuple
+import numpy as np
+import torch
+
+logger = logging.getLogger(__name__)
+
+
+class TensorSlot(object):
+	""" placeholder of a tensor inside a snapshot skeleton, key is the path of the tensor in the checkpoint object """
+	def __init__(self, key: Tuple) -> None:
+		self.key = key
+
+
+def split_tensors(obj, tensors: Dict, memo: Dict, key: Tuple = (), buffers: Dict = None):
+	"""
+	skeleton of obj (nested dicts / lists / tuples) with every tensor replaced by a TensorSlot,
+	the tensors are copied to cpu into tensors, a tensor met twice (memo by id) is copied once;
+	buffers maps keys to cpu tensors of a former snapshot that are overwritten instead of allocating new ones
+	"""
+	if isinstance(obj, torch.Tensor):
+		if id(obj) not in memo:
+			buffer = buffers.get(key) if buffers else None
+			if buffer is not None and buffer.shape == obj.shape and buffer.dtype == obj.dtype:
+				memo[id(obj)] = (key, buffer.copy_(obj.detach()))
+			else:
+				memo[id(obj)] = (key, obj.detach().to('cpu', copy=True))
+			tensors[key] = memo[id(obj)][1]
+		return TensorSlot(memo[id(obj)][0])
+	if isinstance(obj, dict):
+		return type(obj)((name, split_tensors(value, tensors, memo, key + (name,), buffers)) for name, value in obj.items())
+	if isinstance(obj, (list, tuple)):
+		return type(obj)(split_tensors(value, tensors, memo, key + (i,), buffers) for i, value in enumerate(obj))
+	return obj
+
+
+def fill_tensors(skeleton, tensors: Dict):
+	""" inverse of split_tensors """
+	if isinstance(skeleton, TensorSlot):
+		return tensors[skeleton.key]
+	if isinstance(skeleton, dict):
+		return type(skeleton)((name, fill_tensors(value, tensors)) for name, value in skeleton.items())
+	if isinstance(skeleton, (list, tuple)):
+		return type(skeleton)(fill_tensors(value, tensors) for value in skeleton)
+	return skeleton
+
+
+def _write_atomic(path: str, write) -> None:
+	""" write(file) into a temporary file, fsync it and rename it over path, then fsync the directory """
+	tmp_path = path + '.tmp'
+	with open(tmp_path, 'wb') as f:
+		write(f)
+		f.flush()
+		os.fsync(f.fileno())
+	os.replace(tmp_path, path)
+	try:
+		fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+		try:
+			os.fsync(fd)
+		finally:
+			os.close(fd)
+	except OSError:
+		pass
+
+
+class CheckpointWriter(object):
+	"""
+	Writes checkpoints as checkpoint-<step>.pt files in path from a background thread.
+	save() waits for the previous write, copies the tensors of the checkpoint object to cpu on the calling thread
+	and returns, serialisation, fsync and the atomic rename happen in the background. Snapshots already on disk
+	lend their memory to the next one, so a snapshot is a plain copy into warm buffers.
+	The last keep_last checkpoints are kept.
+	With delta, tensors of two or more dimensions only store the rows changed since the previous checkpoint,
+	every full_every-th checkpoint is full and deltas are resolved against their chain of predecessors on load;
+	the previous snapshot is then kept in memory to find the changed rows.
+	arrays passed to save() are also written as <name>.npy in path, the latest state only.
+	"""
+	def __init__(self, path: str, keep_last: int = 3, delta: bool = False, full_every: int = 10) -> None:
+		self.path = path
+		self.keep_last = max(1, keep_last)
+		self.delta = delta
+		self.full_every = max(1, full_every)
+		self.executor = ThreadPoolExecutor(max_workers=1)
+		self.pending = None
+		self.previous = None
+		self.spare = None
+		self.chain = 0
+		self.bases = {}
+		if not os.path.exists(path):
+			os.makedirs(path)
+
+	def _file(self, step: int) -> str:
+		return os.path.join(self.path, 'checkpoint-%d.pt' % step)
+
+	def steps(self) -> List[int]:
+		""" steps of the checkpoints on disk, ascending """
+		steps = []
+		for name in os.listdir(self.path):
+			match = re.match(r'^checkpoint-(\d+)\.pt$', name)
+			if match:
+				steps.append(int(match.group(1)))
+		return sorted(steps)
+
+	def save(self, step: int, obj, arrays: Dict[str, torch.Tensor] = None) -> None:
+		self.wait()
+		buffers, self.spare = self.spare, None
+		tensors = {}
+		memo = {}
+		skeleton = split_tensors(obj, tensors, memo, buffers=buffers)
+		array_slots = split_tensors(arrays or {}, tensors, memo, buffers=buffers)
+		self.pending = self.executor.submit(self._write, step, skeleton, tensors, array_slots)
+
+	def _write(self, step: int, skeleton, tensors: Dict, array_slots: Dict) -> None:
+		record = {'step': step, 'skeleton': skeleton, 'base': None, 'tensors': tensors, 'deltas': {}}
+		if self.delta and self.previous is not None and self.chain < self.full_every - 1:
+			base_step, base_tensors = self.previous
+			record['base'] = base_step
+			record['tensors'] = {}
+			for key, value in tensors.items():
+				old = base_tensors.get(key)
+				if value.dim() >= 2 and old is not None and old.shape == value.shape and old.dtype == value.dtype:
+					rows = (value != old).reshape(value.shape[0], -1).any(dim=1).nonzero().squeeze(1)
+					record['deltas'][key] = (rows, value[rows])
+				else:
+					record['tensors'][key] = value
+			self.chain += 1
+		else:
+			self.chain = 0
+		_write_atomic(self._file(step), lambda f: torch.save(record, f))
+		for name, slot in array_slots.items():
+			_write_atomic(os.path.join(self.path, name + '.npy'), lambda f: np.save(f, tensors[slot.key].numpy()))
+		if self.delta:
+			# the previous snapshot stays as the base of the next delta, the one before it is free again
+			self.spare = self.previous[1] if self.previous is not None else None
+			self.previous = (step, tensors)
+		else:
+			self.spare = tensors
+		self.bases[step] = record['base']
+		self.prune()
+		logger.info('Checkpoint of step %d written to %s' % (step, self._file(step)))
+
+	def prune(self) -> None:
+		""" delete checkpoints older than the last keep_last ones unless a kept delta checkpoint depends on them """
+		steps = self.steps()
+		keep = set()
+		for step in steps[-self.keep_last:]:
+			while step is not None and step not in keep:
+				keep.add(step)
+				step = self.base_of(step)
+		for step in steps:
+			if step not in keep:
+				os.remove(self._file(step))
+
+	def base_of(self, step: int):
+		""" step of the checkpoint a delta checkpoint builds on, None for full ones """
+		if step not in self.bases:
+			# written by an earlier writer, the file is mapped instead of read to get at the field
+			self.bases[step] = torch.load(self._file(step), mmap=True, weights_only=False)['base']
+		return self.bases[step]
+
+	def load(self, step: int = None):
+		""" checkpoint object of step, the latest one by default """
+		self.wait()
+		steps = self.steps()
+		if not steps:
+			raise FileNotFoundError('No checkpoint in %s' % self.path)
+		record = torch.load(self._file(steps[-1] if step is None else step), weights_only=False)
+		return fill_tensors(record['skeleton'], self._tensors(record))
+
+	def _tensors(self, record: Dict) -> Dict:
+		if record['base'] is None:
+			return record['tensors']
+		tensors = dict(self._tensors(torch.load(self._file(record['base']), weights_only=False)))
+		for key, (rows, values) in record['deltas'].items():
+			tensors[key] = tensors[key].clone()
+			tensors[key][rows] = values
+		tensors.update(record['tensors'])
+		return tensors
+
+	def wait(self) -> None:
+		""" block until the pending write is on disk, re-raising its error """
+		if self.pending is not None:
+			pending, self.pending = self.pending, None
+			pending.result()
+
+	def close(self) -> None:
+		self.wait()
+		self.executor.shutdown(wait=True)
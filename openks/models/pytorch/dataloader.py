@@ -6,55 +6,136 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
+from itertools import zip_longest
+
 import numpy as np
 import torch
 
-from torch.utils.data import Dataset
+from torch.utils.data import Dataset, IterableDataset, Sampler, get_worker_info
+
+from ...abstract.graph_index import CSRIndex
+
+def shared_tensor(array):
+    '''
+    Tensor in shared memory holding a copy of array, DataLoader workers receive a handle to it instead of a pickled copy
+    '''
+    return torch.from_numpy(np.ascontiguousarray(array)).share_memory_()
+
+
+class TripleIndex(object):
+    '''
+    Read-only arrays over the training triples, built once and shared by the head-batch and tail-batch datasets,
+    the negative sampler and all DataLoader workers:
+    triples, subsampling weights, true tails of each (head, relation) and true heads of each (relation, tail) as CSR,
+    and the sorted packed (head, relation, tail) keys of all triples
+    '''
+    def __init__(self, triples, nentity, nrelation, start=4):
+        # packed keys are int64, larger id spaces would wrap around and make distinct triples collide
+        if int(nentity) * int(nentity) * int(nrelation) >= 2 ** 63:
+            raise ValueError('%d entities and %d relations overflow the int64 (head, relation, tail) keys of TripleIndex' % (nentity, nrelation))
+        triples = np.asarray(triples, dtype=np.int64).reshape(-1, 3)
+        head, relation, tail = triples[:, 0], triples[:, 1], triples[:, 2]
+        self.nentity = nentity
+        self.nrelation = nrelation
+        self.triples = shared_tensor(triples)
+
+        # frequencies of (head, relation) and (tail, -relation-1) start at `start`, same as count_frequency
+        _, hr_inverse, hr_count = np.unique(head * nrelation + relation, return_inverse=True, return_counts=True)
+        _, tr_inverse, tr_count = np.unique(tail * nrelation + relation, return_inverse=True, return_counts=True)
+        frequency = hr_count[hr_inverse] + tr_count[tr_inverse] + 2 * (start - 1)
+        self.subsampling_weight = shared_tensor(np.sqrt(1 / frequency).astype(np.float32))
+
+        tail_index = CSRIndex(head * nrelation + relation)
+        self.tail_keys = shared_tensor(tail_index.keys)
+        self.tail_indptr = shared_tensor(tail_index.indptr)
+        self.tail_values = shared_tensor(tail[tail_index.order])
+        head_index = CSRIndex(relation * nentity + tail)
+        self.head_keys = shared_tensor(head_index.keys)
+        self.head_indptr = shared_tensor(head_index.indptr)
+        self.head_values = shared_tensor(head[head_index.order])
+
+        self.true_keys = shared_tensor(np.unique(self.pack(head, relation, tail)))
+
+    def __len__(self):
+        return len(self.triples)
+
+    def pack(self, head, relation, tail):
+        return (head * self.nrelation + relation) * self.nentity + tail
+
+    @staticmethod
+    def _group(keys, indptr, values, key):
+        keys = keys.numpy()
+        i = int(np.searchsorted(keys, key))
+        if i >= len(keys) or keys[i] != key:
+            return values.numpy()[:0]
+        return values.numpy()[indptr[i]:indptr[i+1]]
+
+    def true_tail(self, head, relation):
+        return self._group(self.tail_keys, self.tail_indptr, self.tail_values, head * self.nrelation + relation)
+
+    def true_head(self, relation, tail):
+        return self._group(self.head_keys, self.head_indptr, self.head_values, relation * self.nentity + tail)
+
+    def contains(self, keys):
+        '''
+        Vectorised membership test of packed keys against the triples
+        '''
+        true_keys = self.true_keys.numpy()
+        if not len(true_keys):
+            return np.zeros(keys.shape, dtype=bool)
+        pos = np.minimum(np.searchsorted(true_keys, keys), len(true_keys) - 1)
+        return true_keys[pos] == keys
+
 
 class TrainDataset(Dataset):
-    def __init__(self, triples, nentity, nrelation, negative_sample_size, mode):
-        self.len = len(triples)
-        self.triples = triples
-        self.triple_set = set(triples)
+    def __init__(self, triples, nentity, nrelation, negative_sample_size, mode, batch_negatives=False, index=None):
+        '''
+        batch_negatives: leave negative sampling to NegativeSampler.collate_fn, items then carry None as negative sample
+        index: TripleIndex of triples, pass the same one to several datasets to build it only once
+        mode: corruption mode of the items, (position, mode) indexes as produced by BidirectionalBatchSampler override it
+        '''
+        self.index = index if index is not None else TripleIndex(triples, nentity, nrelation)
+        self.len = len(self.index)
         self.nentity = nentity
         self.nrelation = nrelation
         self.negative_sample_size = negative_sample_size
         self.mode = mode
-        self.count = self.count_frequency(triples)
-        self.true_head, self.true_tail = self.get_true_head_and_tail(self.triples)
+        self.batch_negatives = batch_negatives
         
     def __len__(self):
         return self.len
     
     def __getitem__(self, idx):
-        positive_sample = self.triples[idx]
+        mode = self.mode
+        if isinstance(idx, tuple):
+            idx, mode = idx
+        positive_sample = self.index.triples[idx]
+        subsampling_weight = self.index.subsampling_weight[idx:idx+1]
 
-        head, relation, tail = positive_sample
+        if self.batch_negatives:
+            return positive_sample, None, subsampling_weight, mode
 
-        subsampling_weight = self.count[(head, relation)] + self.count[(tail, -relation-1)]
-        subsampling_weight = torch.sqrt(1 / torch.Tensor([subsampling_weight]))
+        head, relation, tail = positive_sample.tolist()
         
         negative_sample_list = []
         negative_sample_size = 0
 
         while negative_sample_size < self.negative_sample_size:
             negative_sample = np.random.randint(self.nentity, size=self.negative_sample_size*2)
-            if self.mode == 'head-batch':
-                mask = np.in1d(
+            if mode == 'head-batch':
+                mask = np.isin(
                     negative_sample, 
-                    self.true_head[(relation, tail)], 
-                    assume_unique=True, 
+                    self.index.true_head(relation, tail), 
                     invert=True
                 )
-            elif self.mode == 'tail-batch':
-                mask = np.in1d(
+            elif mode == 'tail-batch':
+                mask = np.isin(
                     negative_sample, 
-                    self.true_tail[(head, relation)], 
-                    assume_unique=True, 
+                    self.index.true_tail(head, relation), 
                     invert=True
                 )
             else:
-                raise ValueError('Training batch mode %s not supported' % self.mode)
+                raise ValueError('Training batch mode %s not supported' % mode)
             negative_sample = negative_sample[mask]
             negative_sample_list.append(negative_sample)
             negative_sample_size += negative_sample.size
@@ -62,10 +143,8 @@ class TrainDataset(Dataset):
         negative_sample = np.concatenate(negative_sample_list)[:self.negative_sample_size]
 
         negative_sample = torch.LongTensor(negative_sample)
-
-        positive_sample = torch.LongTensor(positive_sample)
             
-        return positive_sample, negative_sample, subsampling_weight, self.mode
+        return positive_sample, negative_sample, subsampling_weight, mode
     
     @staticmethod
     def collate_fn(data):
@@ -119,7 +198,175 @@ class TrainDataset(Dataset):
 
         return true_head, true_tail
 
+
+
+class NegativeSampler(object):
+    '''
+    Draws the negative samples of a whole batch at once, use collate_fn as the DataLoader collate function.
+    Corrupted triples that are true training triples are found by binary search over the sorted packed
+    keys of the TripleIndex and only those entries are drawn again.
+    distribution: 'uniform', 'degree' (proportional to the entity degree in triples)
+    or 'type' (uniform over the entities sharing the type of the replaced entity, needs entity_types)
+    chunk_size: when set, every chunk_size consecutive positives share one row of negatives and the negative sample
+    has shape (num_chunks, negative_sample_size); shared negatives are not filtered against the true triples
+    index may be None when the triples are not held in memory (streaming training), negatives are then
+    drawn over nentity entities without filtering
+    '''
+    def __init__(self, index, negative_sample_size, distribution='uniform', entity_types=None, max_rounds=100, chunk_size=None, nentity=None):
+        self.index = index
+        self.chunk_size = chunk_size
+        self.nentity = index.nentity if index is not None else nentity
+        self.negative_sample_size = negative_sample_size
+        self.distribution = distribution
+        self.max_rounds = max_rounds
+        if distribution == 'degree':
+            if index is None:
+                raise ValueError('Degree-based negative sampling needs the TripleIndex of the training triples')
+            degree = np.bincount(index.triples.numpy()[:, [0, 2]].ravel(), minlength=self.nentity).astype(np.float64)
+            self.cdf = shared_tensor(np.cumsum(degree) / degree.sum())
+        elif distribution == 'type':
+            if entity_types is None:
+                raise ValueError('Type-constrained negative sampling needs entity_types')
+            entity_types = np.asarray(entity_types, dtype=np.int64)
+            type_index = CSRIndex(entity_types)
+            self.entity_types = shared_tensor(entity_types)
+            self.type_keys = shared_tensor(type_index.keys)
+            self.type_indptr = shared_tensor(type_index.indptr)
+            self.type_order = shared_tensor(type_index.order)
+        elif distribution != 'uniform':
+            raise ValueError('Negative sampling distribution %s not supported' % distribution)
+
+    def draw(self, replaced):
+        '''
+        One candidate entity for each entry of replaced, the array of entities being corrupted
+        '''
+        if self.distribution == 'uniform':
+            return np.random.randint(self.nentity, size=replaced.shape)
+        if self.distribution == 'degree':
+            candidates = np.searchsorted(self.cdf.numpy(), np.random.random_sample(replaced.shape), side='right')
+            return np.minimum(candidates, self.nentity - 1)
+        indptr = self.type_indptr.numpy()
+        group = np.searchsorted(self.type_keys.numpy(), self.entity_types.numpy()[replaced])
+        start = indptr[group]
+        count = indptr[group + 1] - start
+        return self.type_order.numpy()[start + (np.random.random_sample(replaced.shape) * count).astype(np.int64)]
+
+    def sample(self, positive_sample, mode):
+        '''
+        (batch, negative_sample_size) negative entities for a (batch, 3) array of positive triples,
+        (num_chunks, negative_sample_size) shared ones with chunk_size
+        '''
+        head, relation, tail = positive_sample[:, 0:1], positive_sample[:, 1:2], positive_sample[:, 2:3]
+        if mode == 'head-batch':
+            replaced = head
+        elif mode == 'tail-batch':
+            replaced = tail
+        else:
+            raise ValueError('Training batch mode %s not supported' % mode)
+        if self.chunk_size:
+            # the first positive of each chunk stands for the chunk, e.g. for its entity type
+            replaced = replaced[::self.chunk_size]
+            return self.draw(np.broadcast_to(replaced, (len(replaced), self.negative_sample_size)))
+        replaced = np.broadcast_to(replaced, (len(positive_sample), self.negative_sample_size))
+        negative_sample = self.draw(replaced)
+        if self.index is None:
+            return negative_sample
+        for _ in range(self.max_rounds):
+            if mode == 'head-batch':
+                collision = self.index.contains(self.index.pack(negative_sample, relation, tail))
+            else:
+                collision = self.index.contains(self.index.pack(head, relation, negative_sample))
+            if not collision.any():
+                break
+            negative_sample[collision] = self.draw(replaced[collision])
+        return negative_sample
+
+    def collate_fn(self, data):
+        positive_sample = torch.stack([_[0] for _ in data], dim=0)
+        subsample_weight = torch.cat([_[2] for _ in data], dim=0)
+        mode = data[0][3]
+        negative_sample = torch.from_numpy(self.sample(positive_sample.numpy(), mode))
+        return positive_sample, negative_sample, subsample_weight, mode
+
+
+
+class RelationBatchSampler(Sampler):
+    '''
+    Batch sampler whose batches hold dataset positions of a single relation, so relation-specific projections
+    (TransH, TransR) are gathered and applied once per batch.
+    Every epoch the positions of each relation are shuffled and cut into batches of at most batch_size,
+    then the order of all batches is shuffled.
+    positions: dataset position of each entry of relations, defaults to 0..len(relations)-1
+    '''
+    def __init__(self, relations, batch_size, positions=None):
+        self.index = CSRIndex(np.asarray(relations, dtype=np.int64))
+        self.batch_size = batch_size
+        self.positions = np.asarray(positions, dtype=np.int64) if positions is not None else None
+
+    def __len__(self):
+        counts = np.diff(self.index.indptr)
+        return int(((counts + self.batch_size - 1) // self.batch_size).sum())
+
+    def __iter__(self):
+        batches = []
+        for i in range(len(self.index.keys)):
+            positions = np.random.permutation(self.index.order[self.index.indptr[i]:self.index.indptr[i+1]])
+            batches.extend(positions[start:start+self.batch_size] for start in range(0, len(positions), self.batch_size))
+        for i in np.random.permutation(len(batches)):
+            batch = batches[i] if self.positions is None else self.positions[batches[i]]
+            yield batch.tolist()
+
     
+class BidirectionalBatchSampler(Sampler):
+    '''
+    Batches of (position, mode) dataset indexes covering both corruption modes, so a single DataLoader and
+    worker pool feeds the trainer. Every epoch walks the batches of batch_sampler once per mode,
+    alternating tail-batch and head-batch batches like BidirectionalOneShotIterator over two loaders.
+    '''
+    def __init__(self, batch_sampler):
+        self.batch_sampler = batch_sampler
+
+    def __len__(self):
+        return 2 * len(self.batch_sampler)
+
+    def __iter__(self):
+        for tail_batch, head_batch in zip_longest(self.batch_sampler, self.batch_sampler):
+            if tail_batch is not None:
+                yield [(i, 'tail-batch') for i in tail_batch]
+            if head_batch is not None:
+                yield [(i, 'head-batch') for i in head_batch]
+
+
+class StreamingTrainDataset(IterableDataset):
+    '''
+    Endless training batches read from a TripleStream, for training triples that stay on disk.
+    Every DataLoader worker streams its own share of the blocks pass after pass, batches alternate tail-batch and
+    head-batch and take their negatives from sampler; use it with batch_size=None as items are whole batches.
+    Triple frequencies are not counted over the stream, so subsampling weights are all 1.
+    '''
+    def __init__(self, stream, batch_size, sampler, seed=0):
+        self.stream = stream
+        self.batch_size = batch_size
+        self.sampler = sampler
+        self.seed = seed
+
+    def __iter__(self):
+        worker_info = get_worker_info()
+        worker, num_workers = (worker_info.id, worker_info.num_workers) if worker_info is not None else (0, 1)
+        rng = np.random.RandomState(self.seed + worker)
+        if not self.stream.blocks(worker, num_workers):
+            return
+        # the DataLoader takes batches from the workers in turn, so the k-th batch of a worker is batch
+        # k * num_workers + worker of the loader and its mode follows from that position
+        position = worker
+        while True:
+            for batch in self.stream.batches(self.batch_size, rng, worker, num_workers):
+                mode = 'tail-batch' if position % 2 == 0 else 'head-batch'
+                position += num_workers
+                negative_sample = self.sampler.sample(batch, mode)
+                yield torch.from_numpy(batch), torch.from_numpy(negative_sample), torch.ones(len(batch)), mode
+
+
 class TestDataset(Dataset):
     def __init__(self, triples, all_true_triples, nentity, nrelation, mode):
         self.len = len(triples)
@@ -0,0 +1,94 @@
+# Copyright (c) 2021 OpenKS Authors, DCD Research Lab, Zhejiang University.
+# All Rights Reserved.
+
+"""
+Filtered link prediction evaluation (MRR, MR, HITS@k) against all entities
+"""
+import logging
+from typing import Callable, Dict, Tuple
+import numpy as np
+import torch
+from ...abstract.graph_index import CSRIndex
+
+logger = logging.getLogger(__name__)
+
+
+class FilteredRankingEvaluator(object):
+	"""
+	Ranks the true head or tail of each query triple among all entities, skipping other known true triples.
+	Known tails of every (head, relation) and known heads of every (relation, tail) are kept as CSR indexes,
+	queries are scored batch by batch against chunks of entities, known answers are masked out with one scatter
+	and the rank is the number of entities scoring strictly higher than the positive plus one.
+	"""
+	def __init__(self, all_true_triples, nentity: int, nrelation: int, batch_size: int = 16, chunk_size: int = None, hits: Tuple = (1, 3, 10)) -> None:
+		triples = np.asarray(all_true_triples, dtype=np.int64).reshape(-1, 3)
+		self.nentity = nentity
+		self.nrelation = nrelation
+		self.batch_size = batch_size
+		self.chunk_size = chunk_size or nentity
+		self.hits = hits
+		self.true_tail = CSRIndex(triples[:, 0] * nrelation + triples[:, 1])
+		self.true_tail_values = triples[self.true_tail.order, 2]
+		self.true_head = CSRIndex(triples[:, 1] * nentity + triples[:, 2])
+		self.true_head_values = triples[self.true_head.order, 0]
+
+	def known_answers(self, queries: np.ndarray, mode: str) -> Tuple[np.ndarray, np.ndarray]:
+		""" (query row, entity) pairs of all known true heads ('head-batch') or tails ('tail-batch') of the queries """
+		if mode == 'head-batch':
+			index, values = self.true_head, self.true_head_values
+			keys = queries[:, 1] * self.nentity + queries[:, 2]
+		elif mode == 'tail-batch':
+			index, values = self.true_tail, self.true_tail_values
+			keys = queries[:, 0] * self.nrelation + queries[:, 1]
+		else:
+			raise ValueError('mode %s not supported' % mode)
+		if not len(index.keys):
+			return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+		pos = np.minimum(np.searchsorted(index.keys, keys), len(index.keys) - 1)
+		found = index.keys[pos] == keys
+		starts = np.where(found, index.indptr[pos], 0)
+		lengths = np.where(found, index.indptr[pos + 1] - index.indptr[pos], 0)
+		rows = np.repeat(np.arange(len(keys)), lengths)
+		flat = np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+		return rows, values[flat]
+
+	def score_all(self, score_fn: Callable, positive_sample: torch.Tensor, mode: str) -> torch.Tensor:
+		""" (batch, nentity) scores of replacing the head or tail of each positive sample by every entity """
+		batch_size = positive_sample.size(0)
+		scores = torch.empty(batch_size, self.nentity, device=positive_sample.device)
+		for start in range(0, self.nentity, self.chunk_size):
+			end = min(start + self.chunk_size, self.nentity)
+			candidates = torch.arange(start, end, device=positive_sample.device).repeat(batch_size, 1)
+			scores[:, start:end] = score_fn(positive_sample, candidates, mode)
+		return scores
+
+	def evaluate(self, score_fn: Callable, triples, device: torch.device = None, log_steps: int = None) -> Dict[str, float]:
+		"""
+		score_fn(positive_sample, candidates, mode) returns the (batch, num_candidates) scores of the candidates
+		taking the place of the head ('head-batch') or tail ('tail-batch') of each positive sample
+		"""
+		triples = np.asarray(triples, dtype=np.int64).reshape(-1, 3)
+		num_batches = (len(triples) + self.batch_size - 1) // self.batch_size
+		ranks = []
+		step = 0
+		with torch.no_grad():
+			for mode, target in (('head-batch', 0), ('tail-batch', 2)):
+				for start in range(0, len(triples), self.batch_size):
+					batch = triples[start:start+self.batch_size]
+					positive_sample = torch.from_numpy(batch).to(device)
+					scores = self.score_all(score_fn, positive_sample, mode)
+					positive_score = scores.gather(1, positive_sample[:, target].unsqueeze(1))
+					rows, cols = self.known_answers(batch, mode)
+					scores[torch.from_numpy(rows).to(device), torch.from_numpy(cols).to(device)] = float('-inf')
+					ranks.append((scores > positive_score).sum(dim=1) + 1)
+					if log_steps and step % log_steps == 0:
+						logger.info('Evaluating the model... (%d/%d)' % (step, 2 * num_batches))
+					step += 1
+		ranks = torch.cat(ranks).double() if ranks else torch.zeros(0, dtype=torch.float64)
+		metrics = {
+			'MRR': (1.0 / ranks).mean().item(),
+			'MR': ranks.mean().item(),
+		}
+		for k in self.hits:
+			metrics['HITS@%d' % k] = (ranks <= k).double().mean().item()
+		return metrics
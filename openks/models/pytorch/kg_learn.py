@@ -4,7 +4,11 @@
 import logging
 import argparse
 import os
+import time
+import traceback
+from queue import Empty
 import torch
+import torch.multiprocessing as mp
 import torch.nn as nn
 from torch.utils import data
 import torch.nn.functional as F
@@ -15,7 +19,13 @@ from sklearn.model_selection import train_test_split
 from ..model import KGLearnModel, TorchDataset
 from .kg_modules import NCESoftmaxLossNS
 
-from .dataloader import TrainDataset, TestDataset
+from .dataloader import TrainDataset, TestDataset, NegativeSampler, TripleIndex, RelationBatchSampler, BidirectionalBatchSampler, StreamingTrainDataset
+from .evaluator import FilteredRankingEvaluator
+from .checkpoint import CheckpointWriter
+from .autotune import RSSMonitor, search_grid
+from .partition import EntityPartitions, EdgeBuckets, PartitionSwapper, RowAdagrad, bucket_schedule
+from ...abstract.triple_stream import TripleStream
+from ...common.profiler import PhaseProfiler, profile_dir
 from .dataloader import BidirectionalOneShotIterator
 import json
 
@@ -55,6 +65,29 @@ class DataSet(TorchDataset):
 		head, relation, tail = self.triples[index]
 		return head, relation, tail
 
+class OptimizerGroup(object):
+	'''
+	Steps several optimizers over disjoint parameter sets as one, e.g. a sparse one for the entity table and a dense one for the rest
+	'''
+	def __init__(self, optimizers):
+		self.optimizers = optimizers
+
+	def zero_grad(self):
+		for opt in self.optimizers:
+			opt.zero_grad()
+
+	def step(self):
+		for opt in self.optimizers:
+			opt.step()
+
+	def state_dict(self):
+		return {'optimizers': [opt.state_dict() for opt in self.optimizers]}
+
+	def load_state_dict(self, state_dict):
+		for opt, state in zip(self.optimizers, state_dict['optimizers']):
+			opt.load_state_dict(state)
+
+
 @KGLearnModel.register("KGLearn", "PyTorch")
 class KGLearn_DyTorch(KGLearnModel):
 	def __init__(self, name='pytorch-default', graph=None, model=None, args=None):
@@ -62,6 +95,8 @@ class KGLearn_DyTorch(KGLearnModel):
 		self.graph = graph
 		self.args = args
 		self.model = model
+		# replaced by an enabled one by run() with the 'profile' arg
+		self.profiler = PhaseProfiler()
 
 	'''
 	def dy_train_test_split(self, triples, test_size):
@@ -74,6 +109,11 @@ class KGLearn_DyTorch(KGLearnModel):
 
 	def triples_reader(self, ratio=0.05):
 		"""read from triple data files to id triples"""
+		if self.graph.is_columnar:
+			# split the id array held by MTG directly and keep the (n, 3) arrays, no per-triple python objects
+			train_valid_triples, test_triples = train_test_split(self.graph.get_triple_array(), test_size=ratio, random_state=self.args['random_seed'])
+			train_triples, valid_triples = train_test_split(train_valid_triples, test_size=ratio, random_state=self.args['random_seed'])
+			return train_triples, valid_triples, test_triples
 		rel2id = self.graph.relation_to_id()
 		train_valid_triples, test_triples = train_test_split(self.graph.triples, test_size=ratio, random_state=self.args['random_seed'])
 		train_triples, valid_triples = train_test_split(train_valid_triples, test_size=ratio, random_state=self.args['random_seed'])
@@ -85,9 +125,17 @@ class KGLearn_DyTorch(KGLearnModel):
 	def triples_reader_v2(self):
 		"""read from triple data files to id triples"""
 		rel2id = self.graph.relation_to_id()
-		train_triples = self.graph.triples
-		train_triples = [(triple[0][0], rel2id[triple[0][1]], triple[0][2]) for triple in train_triples]
+		if self.graph.is_columnar:
+			train_triples = self.graph.get_triple_array()
+		else:
+			train_triples = self.graph.triples
+			train_triples = [(triple[0][0], rel2id[triple[0][1]], triple[0][2]) for triple in train_triples]
 
+		valid_triples, test_triples = self.valid_test_reader(rel2id)
+		return train_triples, valid_triples, test_triples
+
+	def valid_test_reader(self, rel2id):
+		"""read valid and test id triples from data_dir"""
 		with open(os.path.join(self.args['data_dir'], 'entities')) as fin:
 			entity2id = dict()
 			for line in fin:
@@ -99,12 +147,26 @@ class KGLearn_DyTorch(KGLearnModel):
 		test_triples = read_triple(os.path.join(self.args['data_dir'], 'test.txt'), entity2id, rel2id)
 		logging.info('#test: %d' % len(test_triples))
 
-		return train_triples, valid_triples, test_triples
+		return valid_triples, test_triples
+
+	def entity_type_codes(self, nentity):
+		"""type code of every entity id, used by type-constrained negative sampling"""
+		codes = np.zeros(nentity, dtype=np.int64)
+		if self.graph.is_columnar:
+			codes[self.graph.entity_ids] = self.graph.entity_types
+		else:
+			type2id = {}
+			for entity in self.graph.entities:
+				codes[entity[0]] = type2id.setdefault(entity[1], len(type2id))
+		return codes
 
 	def load_model(self, model, opt):
 		"""load model from local model file"""
 		# checkpoint = torch.load(model_path)
-		checkpoint = torch.load(os.path.join(self.args['save_path'], 'checkpoint'))
+		if self.args.get('async_checkpoint', False):
+			checkpoint = self.checkpoint_writer().load()
+		else:
+			checkpoint = torch.load(os.path.join(self.args['save_path'], 'checkpoint'))
 		model.load_state_dict(checkpoint['model_state_dict'])
 		opt.load_state_dict(checkpoint['optimizer_state_dict'])
 		init_step = checkpoint['step'] + 1
@@ -119,27 +181,51 @@ class KGLearn_DyTorch(KGLearnModel):
 	    Save the parameters of the model and the optimizer,
 	    as well as some other variables such as step and learning_rate
 	    '''
-		with open(os.path.join(self.args['save_path'], 'config.json'), 'w') as fjson:
-			json.dump(self.args, fjson)
+		with self.profiler.phase('checkpoint'):
+			with open(os.path.join(self.args['save_path'], 'config.json'), 'w') as fjson:
+				json.dump(self.args, fjson)
+
+			if self.args.get('async_checkpoint', False):
+				state_dict = model.state_dict()
+				self.checkpoint_writer().save(
+					save_variable_list['step'],
+					{**save_variable_list, 'model_state_dict': state_dict, 'optimizer_state_dict': optimizer.state_dict()},
+					arrays={'entity_embedding': state_dict['entity_embedding'], 'relation_embedding': state_dict['relation_embedding']}
+				)
+				return
+
+			torch.save({
+				**save_variable_list,
+				'model_state_dict': model.state_dict(),
+				'optimizer_state_dict': optimizer.state_dict()},
+				os.path.join(self.args['save_path'], 'checkpoint')
+			)
 
-		torch.save({
-			**save_variable_list,
-			'model_state_dict': model.state_dict(),
-			'optimizer_state_dict': optimizer.state_dict()},
-			os.path.join(self.args['save_path'], 'checkpoint')
-		)
+			entity_embedding = model.entity_embedding.detach().cpu().numpy()
+			np.save(
+				os.path.join(self.args['save_path'], 'entity_embedding'),
+				entity_embedding
+			)
 
-		entity_embedding = model.entity_embedding.detach().cpu().numpy()
-		np.save(
-			os.path.join(self.args['save_path'], 'entity_embedding'),
-			entity_embedding
-		)
+			relation_embedding = model.relation_embedding.detach().cpu().numpy()
+			np.save(
+				os.path.join(self.args['save_path'], 'relation_embedding'),
+				relation_embedding
+			)
 
-		relation_embedding = model.relation_embedding.detach().cpu().numpy()
-		np.save(
-			os.path.join(self.args['save_path'], 'relation_embedding'),
-			relation_embedding
-		)
+	def checkpoint_writer(self):
+		'''
+        Background writer of the 'async_checkpoint' mode, keeps the last 'keep_checkpoints' checkpoints in save_path,
+        with 'delta_checkpoint' only changed rows are stored between every 'full_checkpoint_every' full checkpoints
+        '''
+		if getattr(self, '_checkpoint_writer', None) is None:
+			self._checkpoint_writer = CheckpointWriter(
+				self.args['save_path'],
+				keep_last=self.args.get('keep_checkpoints', 3),
+				delta=self.args.get('delta_checkpoint', False),
+				full_every=self.args.get('full_checkpoint_every', 10)
+			)
+		return self._checkpoint_writer
 
 	def set_logger(self):
 		'''
@@ -164,17 +250,50 @@ class KGLearn_DyTorch(KGLearnModel):
 		self.set_logger()
 		device = torch.device('cuda') if self.args['gpu'] else torch.device('cpu')
 
-		if self.args['random_split']:
+		streaming = bool(self.args.get('train_file'))
+		if streaming:
+			# training triples stay on disk and are streamed, only valid and test triples are read into memory
+			# and filtered evaluation then skips known training triples only through them
+			train_triples = None
+			valid_triples, test_triples = self.valid_test_reader(self.graph.relation_to_id())
+			logging.warning('Training triples are streamed from %s and not filtered out in evaluation, '
+				'MRR, MR and HITS@ are only filtered by valid and test triples.' % self.args['train_file'])
+		elif self.args['random_split']:
 			train_triples, valid_triples, test_triples = self.triples_reader(ratio=self.args['split_ratio'])
 		else:
 			train_triples, valid_triples, test_triples = self.triples_reader_v2()
-		all_true_triples = train_triples + valid_triples + test_triples
+		# training triples may be an (n, 3) id array of a columnar graph, the known triples are joined as one array
+		all_true_triples = np.concatenate([
+			np.asarray(triples, dtype=np.int64).reshape(-1, 3)
+			for triples in (train_triples, valid_triples, test_triples) if triples is not None
+		])
 
 		nentity = self.graph.get_entity_num()
 		nrelation = self.graph.get_relation_num()
 
 		self.args['nentity'] = nentity
 		self.args['nrelation'] = nrelation
+		if self.args.get('neg_chunk_size') and not hasattr(self.model, 'score_shared'):
+			raise ValueError('Model %s does not support shared negative sampling, unset neg_chunk_size.' % self.args['model_name'])
+		if self.args.get('sparse_embedding', False) and self.args['regularization'] != 0.0:
+			raise ValueError('Regularization over the whole entity table needs dense gradients, disable sparse_embedding or set regularization to 0.')
+
+		if streaming and (self.args.get('num_partitions', 1) > 1 or self.args.get('num_processes', 1) > 1 or self.args.get('relation_batches', False)):
+			raise ValueError('Training from train_file does not support num_partitions, num_processes or relation_batches.')
+
+		if self.args.get('autotune', False):
+			if streaming:
+				raise ValueError('Autotuning runs its trials on in-memory training triples, unset train_file.')
+			return self.autotune(train_triples, nentity, nrelation, device)
+
+		# 'profile' (a directory, or True for save_path) times the phases of every step
+		self.profiler = PhaseProfiler(profile_dir(self.args), synchronize=torch.cuda.synchronize if self.args['gpu'] else None)
+
+		if self.args.get('num_partitions', 1) > 1:
+			return self.partitioned_run(train_triples, nentity, nrelation, device)
+
+		if self.args.get('num_threads'):
+			torch.set_num_threads(self.args['num_threads'])
 
 		torch.manual_seed(self.args['random_seed'])
 		model = self.model(
@@ -191,78 +310,86 @@ class KGLearn_DyTorch(KGLearnModel):
 
 		model = model.to(device)
 
-		train_dataloader_head = data.DataLoader(
-			TrainDataset(train_triples, nentity, nrelation, self.args['negative_sample_size'], 'head-batch'),
-			batch_size=self.args['batch_size'],
-			shuffle=True,
-			num_workers=max(1, self.args['cpu_num'] // 2),
-			collate_fn=TrainDataset.collate_fn
+		# frequency and true head/tail indexes are built once in shared memory and mapped by every worker
+		train_index = TripleIndex(train_triples, nentity, nrelation) if not streaming else None
+
+		# negatives of a batch are drawn together in the collate step, 'negative_sampling' picks the distribution
+		distribution = self.args.get('negative_sampling', 'uniform')
+		sampler = NegativeSampler(
+			train_index, self.args['negative_sample_size'],
+			distribution=distribution,
+			entity_types=self.entity_type_codes(nentity) if distribution == 'type' else None,
+			chunk_size=self.args.get('neg_chunk_size'),
+			nentity=nentity
 		)
 
-		train_dataloader_tail = data.DataLoader(
-			TrainDataset(train_triples, nentity, nrelation, self.args['negative_sample_size'], 'tail-batch'),
-			batch_size=self.args['batch_size'],
-			shuffle=True,
-			num_workers=max(1, self.args['cpu_num'] // 2),
-			collate_fn=TrainDataset.collate_fn
-		)
-
-		train_iterator = BidirectionalOneShotIterator(train_dataloader_head, train_dataloader_tail)
-
-		
-		current_learning_rate = self.args['learning_rate']
-
-		# initialize optimizer
-		optimizer_available = {
-			"adam": optim.Adam,
-			"sgd": optim.SGD,
-		}
-		opt = optimizer_available[self.args['optimizer']](model.parameters(), lr=current_learning_rate)
-
-		if self.args['warm_up_steps'] is None:
-			warm_up_steps = self.args['max_steps'] // 2
+		if self.args.get('num_processes', 1) > 1:
+			step, opt = self.hogwild_train(model, train_index, sampler, valid_triples, all_true_triples)
 		else:
-			warm_up_steps = self.args['warm_up_steps']
-
-		# start_epoch = 1
-		init_step = 1
-		step = init_step
-		best_score = 0.0
+			num_workers = self.args.get('num_workers', max(1, self.args['cpu_num'] // 2))
+			if streaming:
+				train_iterator = self.stream_dataloader(sampler, num_workers=num_workers)
+			else:
+				train_iterator = self.train_dataloader(
+					TrainDataset(train_triples, nentity, nrelation, self.args['negative_sample_size'], None, batch_negatives=True, index=train_index),
+					train_index.triples.numpy()[:, 1],
+					sampler,
+					num_workers=num_workers
+				)
 
-		# train iteratively
-		# for epoch in range(start_epoch, self.args['epoch'] + 1):
-		logging.info('learning_rate = %d' % current_learning_rate)
-		training_logs = []
-		for step in range(init_step, self.args['max_steps']+1):
-			log = self.train_step(model, opt, train_iterator, self.args)
-			training_logs.append(log)
-			if step >= warm_up_steps:
-				current_learning_rate = current_learning_rate / 10
-				logging.info('Change learning_rate to %f at step %d' % (current_learning_rate, step))
-				opt = optimizer_available[self.args['optimizer']](model.parameters(), lr=current_learning_rate)
-				warm_up_steps = warm_up_steps * 3
-
-			if step % self.args['log_steps'] == 0:
-				metrics = {}
-				for metric in training_logs[0].keys():
-					metrics[metric] = sum([log[metric] for log in training_logs]) / len(training_logs)
-				log_metrics('Training average', step, metrics)
-				training_logs = []
-
-			if step % self.args['eval_freq'] == 0:
-				logging.info('Evaluating on Valid Dataset...')
-				metrics = self.test_step(model, valid_triples, all_true_triples, self.args)
-				log_metrics('Valid', step, metrics)
-				score = metrics['HITS@10']
-				if score > best_score:
-					best_score = score
-					save_variable_list = {
-						'step': step,
-						'current_learning_rate': current_learning_rate,
-						'warm_up_steps': warm_up_steps,
-						'best_score': best_score
-					}
-					self.save_model(model, opt, save_variable_list)
+		
+			current_learning_rate = self.args['learning_rate']
+
+			# initialize optimizer
+			opt = self.build_optimizer(model, current_learning_rate)
+
+			if self.args['warm_up_steps'] is None:
+				warm_up_steps = self.args['max_steps'] // 2
+			else:
+				warm_up_steps = self.args['warm_up_steps']
+
+			# start_epoch = 1
+			init_step = 1
+			step = init_step
+			best_score = 0.0
+
+			# train iteratively
+			# for epoch in range(start_epoch, self.args['epoch'] + 1):
+			logging.info('learning_rate = %d' % current_learning_rate)
+			training_logs = []
+			for step in range(init_step, self.args['max_steps']+1):
+				log = self.train_step(model, opt, train_iterator, self.args)
+				training_logs.append(log)
+				if step >= warm_up_steps:
+					current_learning_rate = current_learning_rate / 10
+					logging.info('Change learning_rate to %f at step %d' % (current_learning_rate, step))
+					opt = self.build_optimizer(model, current_learning_rate)
+					warm_up_steps = warm_up_steps * 3
+
+				if step % self.args['log_steps'] == 0:
+					metrics = {}
+					for metric in training_logs[0].keys():
+						metrics[metric] = sum([log[metric] for log in training_logs]) / len(training_logs)
+					# share of the step spent waiting for input, close to 0 when the pipeline keeps up with the trainer
+					metrics['data_wait_ratio'] = metrics['data_wait'] / metrics['step_time']
+					log_metrics('Training average', step, metrics)
+					training_logs = []
+
+				if step % self.args['eval_freq'] == 0:
+					logging.info('Evaluating on Valid Dataset...')
+					metrics = self.test_step(model, valid_triples, all_true_triples, self.args)
+					log_metrics('Valid', step, metrics)
+					score = metrics['HITS@10']
+					if score > best_score:
+						best_score = score
+						save_variable_list = {
+							'step': step,
+							'current_learning_rate': current_learning_rate,
+							'warm_up_steps': warm_up_steps,
+							'best_score': best_score
+						}
+						self.save_model(model, opt, save_variable_list)
+				self.profiler.step()
 
 		# load saved model and test
 		self.load_model(model, opt)
@@ -278,70 +405,499 @@ class KGLearn_DyTorch(KGLearnModel):
 			metrics = self.test_step(model, test_triples, all_true_triples, self.args)
 			log_metrics('Test', step, metrics)
 
-		if self.args['evaluate_train']:
+		if self.args['evaluate_train'] and not streaming:
 			logging.info('Evaluating on Training Dataset...')
 			metrics = self.test_step(model, train_triples, all_true_triples, self.args)
 			log_metrics('Test', step, metrics)
 
+		if getattr(self, '_checkpoint_writer', None) is not None:
+			self._checkpoint_writer.close()
+			self._checkpoint_writer = None
 
-	def train_step(self, model, optimizer, train_iterator, args):
+		self.profiler.export()
+
+
+	def partitioned_run(self, train_triples, nentity, nrelation, device):
 		'''
-        A single train step. Apply back-propation and return the loss
+        Out-of-core training in the style of PyTorch-BigGraph for entity tables larger than memory.
+        Entities are split into num_partitions ranges stored under save_path/partitions, triples into the
+        (head partition, tail partition) buckets. Buckets are trained in an order that swaps one partition at a time,
+        with only their two partitions resident and the next one read in the background; negatives are drawn
+        from the partition of the replaced entity and the entity rows are stepped by row-wise Adagrad.
+        Training runs max_steps steps. Filtered evaluation needs the whole table and is skipped,
+        the trained entity embeddings are exported to save_path/entity_embedding.npy.
         '''
+		if self.args['regularization'] != 0.0:
+			raise ValueError('Regularization over the whole entity table is not available with num_partitions, set regularization to 0.')
 
-		model.train()
-
-		optimizer.zero_grad()
+		# the model only keeps the relation parameters, entity rows are swapped in per bucket
+		torch.manual_seed(self.args['random_seed'])
+		model = self.model(
+			num_entity=1,
+			num_relation=nrelation,
+			**self.args
+		).to(device)
+		dense_parameters = [param for param in model.parameters() if param is not model.entity_embedding]
+		optimizer_available = {
+			"adam": optim.Adam,
+			"sgd": optim.SGD,
+		}
+		dense_opt = optimizer_available[self.args['optimizer']](dense_parameters, lr=self.args['learning_rate'])
 
-		positive_sample, negative_sample, subsampling_weight, mode = next(train_iterator)
+		partitions = EntityPartitions(
+			os.path.join(self.args['save_path'], 'partitions'),
+			nentity, model.entity_dim, self.args['num_partitions'], model.uniform_range
+		)
+		buckets = EdgeBuckets(train_triples, partitions)
+		schedule = [bucket for bucket in bucket_schedule(self.args['num_partitions']) if len(buckets.bucket(*bucket))]
+		if not schedule:
+			# no bucket holds a triple, passes over the schedule would never advance step
+			raise ValueError('Partitioned training found no training triples in any edge bucket.')
+		swapper = PartitionSwapper(partitions)
+		logging.info('Training %d edge buckets over %d entity partitions of about %d entities' % (len(schedule), self.args['num_partitions'], partitions.size(0)))
 
-		if args['gpu']:
-			positive_sample = positive_sample.cuda()
-			negative_sample = negative_sample.cuda()
-			subsampling_weight = subsampling_weight.cuda()
+		step = 0
+		training_logs = []
+		try:
+			while step < self.args['max_steps']:
+				for k, (head_part, tail_part) in enumerate(schedule):
+					swapper.acquire({head_part, tail_part})
+					swapper.prefetch(set(schedule[(k + 1) % len(schedule)]) - {head_part, tail_part})
+
+					# head partition rows first, then the tail partition rows when it is a different one
+					parts = [head_part] if head_part == tail_part else [head_part, tail_part]
+					sizes = [partitions.size(part) for part in parts]
+					model.entity_embedding = nn.Parameter(torch.cat([swapper.resident[part][0] for part in parts]).to(device))
+					state = torch.cat([swapper.resident[part][1] for part in parts]).to(device)
+					opt = OptimizerGroup([RowAdagrad(model.entity_embedding, state, self.args['learning_rate']), dense_opt])
+
+					triples = buckets.bucket(head_part, tail_part).copy()
+					np.random.shuffle(triples)
+					tail_offset = sizes[0] if len(parts) > 1 else 0
+					triples[:, 0] -= partitions.bounds[head_part]
+					triples[:, 2] += tail_offset - partitions.bounds[tail_part]
+					batches = self.bucket_batches(triples, (0, sizes[0]), (tail_offset, tail_offset + sizes[-1]))
+
+					for batch in batches:
+						log = self.train_step(model, opt, iter([batch]), self.args)
+						training_logs.append(log)
+						step += 1
+						self.profiler.step()
+						if step % self.args['log_steps'] == 0:
+							metrics = {}
+							for metric in training_logs[0].keys():
+								metrics[metric] = sum([log[metric] for log in training_logs]) / len(training_logs)
+							log_metrics('Training average', step, metrics)
+							training_logs = []
+						if step >= self.args['max_steps']:
+							break
+
+					trained = model.entity_embedding.detach().cpu()
+					state = state.cpu()
+					for part, start, size in zip(parts, np.cumsum([0] + sizes[:-1]), sizes):
+						swapper.resident[part] = (trained[start:start+size], state[start:start+size])
+					if step >= self.args['max_steps']:
+						break
+		finally:
+			swapper.close()
+
+		model.entity_embedding = nn.Parameter(torch.zeros(1, model.entity_dim))
+		with open(os.path.join(self.args['save_path'], 'config.json'), 'w') as fjson:
+			json.dump(self.args, fjson)
+		torch.save({
+			'step': step,
+			'model_state_dict': {key: value for key, value in model.state_dict().items() if key != 'entity_embedding'}},
+			os.path.join(self.args['save_path'], 'checkpoint')
+		)
+		partitions.export(os.path.join(self.args['save_path'], 'entity_embedding.npy'))
+		np.save(
+			os.path.join(self.args['save_path'], 'relation_embedding'),
+			model.relation_embedding.detach().cpu().numpy()
+		)
+		logging.info('Partitioned training finished at step %d, embeddings saved to %s' % (step, self.args['save_path']))
+		self.profiler.export()
 
-		negative_score = self.forward(model, (positive_sample, negative_sample), mode=mode)
+	def bucket_batches(self, triples, head_range, tail_range):
+		'''
+        Training batches of one edge bucket in local entity ids, alternating head-batch and tail-batch,
+        negatives are drawn uniformly from the id range of the replaced side
+        '''
+		batch_size = self.args['batch_size']
+		for k, start in enumerate(range(0, len(triples), batch_size)):
+			positive_sample = torch.from_numpy(triples[start:start+batch_size])
+			mode = 'head-batch' if k % 2 == 0 else 'tail-batch'
+			low, high = head_range if mode == 'head-batch' else tail_range
+			num_negatives = (positive_sample.size(0) + self.args['neg_chunk_size'] - 1) // self.args['neg_chunk_size'] if self.args.get('neg_chunk_size') else positive_sample.size(0)
+			negative_sample = torch.randint(low, high, (num_negatives, self.args['negative_sample_size']))
+			yield positive_sample, negative_sample, torch.ones(positive_sample.size(0)), mode
+
+	def autotune(self, train_triples, nentity, nrelation, device):
+		'''
+        Short timed training trials over every configuration of 'autotune_space' (batch_size, negative_sample_size,
+        num_workers, num_threads) on the training triples. Configurations whose estimated or measured peak memory
+        exceeds 'memory_budget_mb' are rejected. Triples/sec and peak RSS of every trial are logged and written with
+        the fastest configuration to autotune.json in save_path, its 'best' entry can be merged into the run args.
+        '''
+		cpu_num = self.args['cpu_num']
+		space = {
+			'batch_size': sorted({max(1, self.args['batch_size'] // 2), self.args['batch_size'], self.args['batch_size'] * 2}),
+			'negative_sample_size': [self.args['negative_sample_size']],
+			'num_workers': sorted({0, 1, max(1, cpu_num // 2)}),
+			'num_threads': sorted({1, max(1, cpu_num // 2), cpu_num}),
+		}
+		space.update(self.args.get('autotune_space') or {})
+		budget = self.args.get('memory_budget_mb')
+		trial_steps = self.args.get('autotune_steps', 20)
+		warmup_steps = self.args.get('autotune_warmup_steps', 3)
+
+		train_index = TripleIndex(train_triples, nentity, nrelation)
+		relations = train_index.triples.numpy()[:, 1]
+		distribution = self.args.get('negative_sampling', 'uniform')
+		entity_types = self.entity_type_codes(nentity) if distribution == 'type' else None
+		base_args, base_threads = self.args, torch.get_num_threads()
+		trials = []
+		try:
+			for config in search_grid(space):
+				self.args = {**base_args, **config}
+				trial = dict(config)
+				trials.append(trial)
+				torch.set_num_threads(config['num_threads'])
+				torch.manual_seed(self.args['random_seed'])
+				model = self.model(num_entity=nentity, num_relation=nrelation, **self.args).to(device)
+
+				# parameters, optimizer state and gradients, plus the (batch, negatives, dim) activations of a step
+				param_bytes = sum(param.numel() * param.element_size() for param in model.parameters())
+				activation_bytes = config['batch_size'] * config['negative_sample_size'] * model.entity_dim * 4 * 4
+				trial['estimated_mb'] = (param_bytes * (4 if self.args['optimizer'] == 'adam' else 2) + activation_bytes) / 2 ** 20
+				if budget and trial['estimated_mb'] > budget:
+					trial['rejected'] = 'estimated memory over budget'
+					logging.info('Autotune %s: %s' % (config, trial['rejected']))
+					continue
+
+				sampler = NegativeSampler(
+					train_index, config['negative_sample_size'],
+					distribution=distribution,
+					entity_types=entity_types,
+					chunk_size=self.args.get('neg_chunk_size')
+				)
+				train_iterator = self.train_dataloader(
+					TrainDataset(None, nentity, nrelation, config['negative_sample_size'], None, batch_negatives=True, index=train_index),
+					relations,
+					sampler,
+					num_workers=config['num_workers']
+				)
+				opt = self.build_optimizer(model, self.args['learning_rate'])
+				with RSSMonitor() as monitor:
+					for _ in range(warmup_steps):
+						self.train_step(model, opt, train_iterator, self.args)
+					logs = []
+					start = time.perf_counter()
+					for _ in range(trial_steps):
+						logs.append(self.train_step(model, opt, train_iterator, self.args))
+					elapsed = time.perf_counter() - start
+				# closing the iterator releases the DataLoader and shuts its workers down
+				train_iterator.close()
+				del model, opt, sampler
+
+				trial['triples_per_sec'] = trial_steps * config['batch_size'] / elapsed
+				trial['peak_rss_mb'] = monitor.peak / 2 ** 20
+				trial['data_wait_ratio'] = sum(log['data_wait'] for log in logs) / sum(log['step_time'] for log in logs)
+				if budget and trial['peak_rss_mb'] > budget:
+					trial['rejected'] = 'peak RSS over budget'
+				logging.info('Autotune %s: %.1f triples/sec, peak RSS %.1f MB, data wait %.1f%%%s' % (
+					config, trial['triples_per_sec'], trial['peak_rss_mb'], 100 * trial['data_wait_ratio'],
+					', ' + trial['rejected'] if 'rejected' in trial else ''))
+		finally:
+			self.args = base_args
+			torch.set_num_threads(base_threads)
+
+		accepted = [trial for trial in trials if 'rejected' not in trial]
+		if not accepted:
+			raise ValueError('No autotune configuration fits into memory_budget_mb=%s' % budget)
+		best = max(accepted, key=lambda trial: trial['triples_per_sec'])
+		best_args = {key: best[key] for key in space}
+		with open(os.path.join(self.args['save_path'], 'autotune.json'), 'w') as fjson:
+			json.dump({'best': best_args, 'trials': trials}, fjson, indent=2)
+		logging.info('Autotune best configuration %s: %.1f triples/sec' % (best_args, best['triples_per_sec']))
+		return best_args
+
+	def hogwild_train(self, model, train_index, sampler, valid_triples, all_true_triples):
+		'''
+        Hogwild training on CPU: num_processes processes update the shared model parameters without locks,
+        each on a disjoint shard of the training triples with its own data order, negatives and optimizer state.
+        The parent collects the training logs and evaluates the shared model every eval_freq steps,
+        max_steps and eval_freq count the steps of all processes together.
+        '''
+		if self.args['gpu']:
+			raise ValueError('Hogwild training runs on CPU, set gpu to False or num_processes to 1.')
+		num_processes = self.args['num_processes']
+		model.share_memory()
+
+		ctx = mp.get_context('fork')
+		progress = ctx.Queue()
+		shards = np.array_split(np.random.RandomState(self.args['random_seed']).permutation(len(train_index)), num_processes)
+		processes = [
+			ctx.Process(target=self.hogwild_worker, args=(rank, model, train_index, sampler, shards[rank], progress))
+			for rank in range(num_processes)
+		]
+		for process in processes:
+			process.start()
+		logging.info('Started %d Hogwild training processes' % num_processes)
+
+		# the parent never steps this optimizer, it only gives the checkpoint its usual layout
+		opt = self.build_optimizer(model, self.args['learning_rate'])
+		step = 0
+		best_score = 0.0
+		finished = 0
+		training_logs = []
+		try:
+			while finished < num_processes:
+				try:
+					kind, payload = progress.get(timeout=5)
+				except Empty:
+					if any(process.exitcode not in (None, 0) for process in processes):
+						raise RuntimeError('A Hogwild training process exited unexpectedly.')
+					continue
+				if kind == 'error':
+					raise RuntimeError('A Hogwild training process failed:\n' + payload)
+				if kind == 'done':
+					finished += 1
+					continue
+
+				step += 1
+				training_logs.append(payload)
+				if step % self.args['log_steps'] == 0:
+					metrics = {}
+					for metric in training_logs[0].keys():
+						metrics[metric] = sum([log[metric] for log in training_logs]) / len(training_logs)
+					log_metrics('Training average', step, metrics)
+					training_logs = []
+
+				if step % self.args['eval_freq'] == 0:
+					logging.info('Evaluating on Valid Dataset...')
+					metrics = self.test_step(model, valid_triples, all_true_triples, self.args)
+					log_metrics('Valid', step, metrics)
+					score = metrics['HITS@10']
+					if score > best_score:
+						best_score = score
+						save_variable_list = {
+							'step': step,
+							'current_learning_rate': self.args['learning_rate'],
+							'warm_up_steps': self.args['warm_up_steps'],
+							'best_score': best_score
+						}
+						self.save_model(model, opt, save_variable_list)
+				self.profiler.step()
+		except BaseException:
+			for process in processes:
+				process.terminate()
+			raise
+		finally:
+			for process in processes:
+				process.join()
+		return step, opt
+
+	def hogwild_worker(self, rank, model, train_index, sampler, shard, progress):
+		'''
+        One Hogwild process: trains the shared model on its shard and reports every step's log to the parent
+        '''
+		try:
+			# steps of the workers are counted by the parent, their phases are not profiled
+			self.profiler = PhaseProfiler()
+			num_processes = self.args['num_processes']
+			torch.set_num_threads(max(1, self.args['cpu_num'] // num_processes))
+			torch.manual_seed(self.args['random_seed'] + rank)
+			np.random.seed(self.args['random_seed'] + rank)
+
+			train_iterator = self.train_dataloader(
+				TrainDataset(None, self.args['nentity'], self.args['nrelation'], self.args['negative_sample_size'], None, batch_negatives=True, index=train_index),
+				train_index.triples.numpy()[:, 1],
+				sampler,
+				positions=shard
+			)
 
-		if args['negative_adversarial_sampling']:
-			# In self-adversarial sampling, we do not apply back-propagation on the sampling weight
-			negative_score = (F.softmax(negative_score * args['adversarial_temperature'], dim=1).detach()
-							  * F.logsigmoid(-negative_score)).sum(dim=1)
+			current_learning_rate = self.args['learning_rate']
+			opt = self.build_optimizer(model, current_learning_rate)
+			warm_up_steps = self.args['warm_up_steps'] or self.args['max_steps'] // 2
+			warm_up_steps = max(1, warm_up_steps // num_processes)
+
+			for step in range(1, self.args['max_steps'] // num_processes + 1):
+				progress.put(('log', self.train_step(model, opt, train_iterator, self.args)))
+				if step >= warm_up_steps:
+					current_learning_rate = current_learning_rate / 10
+					opt = self.build_optimizer(model, current_learning_rate)
+					warm_up_steps = warm_up_steps * 3
+			progress.put(('done', None))
+		except Exception:
+			progress.put(('error', traceback.format_exc()))
+
+	def train_dataloader(self, dataset, relations, sampler, num_workers=0, positions=None):
+		'''
+        Endless iterator over shuffled training batches of both corruption modes with negatives from sampler,
+        drawn from the dataset items at positions (all items by default),
+        with 'relation_batches' every batch holds triples of a single relation (relations: relation id of each dataset item).
+        One DataLoader serves both modes, its workers persist across epochs and evaluation phases and keep
+        'prefetch_batches' ready batches in shared memory (pinned when training on gpu).
+        '''
+		if positions is None:
+			positions = np.arange(len(dataset))
+		if self.args.get('relation_batches', False):
+			batch_sampler = RelationBatchSampler(relations[positions], self.args['batch_size'], positions=positions)
 		else:
-			negative_score = F.logsigmoid(-negative_score).mean(dim=1)
+			batch_sampler = data.BatchSampler(data.SubsetRandomSampler(positions), self.args['batch_size'], drop_last=False)
+		dataloader = data.DataLoader(
+			dataset,
+			batch_sampler=BidirectionalBatchSampler(batch_sampler),
+			collate_fn=sampler.collate_fn,
+			**self.loader_options(num_workers)
+		)
+		return BidirectionalOneShotIterator.one_shot_iterator(dataloader)
 
-		positive_score = self.forward(model, positive_sample)
+	def stream_dataloader(self, sampler, num_workers=0):
+		'''
+        Endless iterator over training batches streamed from the triple file 'train_file' (raw int64 or .npy),
+        reading 'stream_block_rows' triples at a time and shuffling through 'shuffle_buffer_rows' triples,
+        served by the same persistent prefetching workers as train_dataloader
+        '''
+		stream = TripleStream(
+			self.args['train_file'],
+			block_rows=self.args.get('stream_block_rows', 1 << 20),
+			buffer_rows=self.args.get('shuffle_buffer_rows', 1 << 22)
+		)
+		if len(stream) == 0:
+			raise ValueError('No training triples in train_file %s.' % self.args['train_file'])
+		logging.info('#train: %d (streamed from %s)' % (len(stream), self.args['train_file']))
+		dataloader = data.DataLoader(
+			StreamingTrainDataset(stream, self.args['batch_size'], sampler, seed=self.args['random_seed']),
+			batch_size=None,
+			**self.loader_options(num_workers)
+		)
+		return BidirectionalOneShotIterator.one_shot_iterator(dataloader)
 
-		positive_score = F.logsigmoid(positive_score).squeeze(dim=1)
+	def loader_options(self, num_workers):
+		'''
+        DataLoader worker options: persistent workers holding 'prefetch_batches' ready batches in total, pinned on gpu
+        '''
+		prefetch_batches = self.args.get('prefetch_batches', 2 * max(1, num_workers))
+		return {
+			'num_workers': num_workers,
+			'pin_memory': bool(self.args['gpu']),
+			'persistent_workers': num_workers > 0,
+			'prefetch_factor': max(1, -(-prefetch_batches // num_workers)) if num_workers > 0 else None
+		}
 
-		if args['uni_weight']:
-			positive_sample_loss = - positive_score.mean()
-			negative_sample_loss = - negative_score.mean()
-		else:
-			positive_sample_loss = - (subsampling_weight * positive_score).sum() / subsampling_weight.sum()
-			negative_sample_loss = - (subsampling_weight * negative_score).sum() / subsampling_weight.sum()
+	def build_optimizer(self, model, learning_rate):
+		'''
+        With 'sparse_embedding' the entity table gets sparse row gradients and its own row-wise optimizer,
+        the remaining parameters keep the dense one
+        '''
+		optimizer_available = {
+			"adam": optim.Adam,
+			"sgd": optim.SGD,
+		}
+		if not self.args.get('sparse_embedding', False):
+			return optimizer_available[self.args['optimizer']](model.parameters(), lr=learning_rate)
 
-		loss = (positive_sample_loss + negative_sample_loss) / 2
+		sparse_optimizer_available = {
+			"sparse_adam": optim.SparseAdam,
+			"adagrad": optim.Adagrad,
+			"sgd": optim.SGD,
+		}
+		optimizers = [sparse_optimizer_available[self.args.get('sparse_optimizer', 'sparse_adam')]([model.entity_embedding], lr=learning_rate)]
+		dense_parameters = [param for param in model.parameters() if param is not model.entity_embedding]
+		if dense_parameters:
+			optimizers.append(optimizer_available[self.args['optimizer']](dense_parameters, lr=learning_rate))
+		return OptimizerGroup(optimizers)
 
-		if args['regularization'] != 0.0:
-			# Use L3 regularization for ComplEx and DistMult
-			regularization = args.regularization * (
-					model.entity_embedding.norm(p=3) ** 3 +
-					model.relation_embedding.norm(p=3).norm(p=3) ** 3
-			)
-			loss = loss + regularization
-			regularization_log = {'regularization': regularization.item()}
-		else:
-			regularization_log = {}
+	def relation_params(self, weight, relation):
+		'''
+        Rows of a per-relation projection parameter (TransH norm vectors, TransR transfer matrices),
+        a single shared row when relation_batches makes the whole batch one relation so the projection is applied once
+        '''
+		if self.args.get('relation_batches', False) and relation.numel() > 1 and bool((relation == relation[0]).all()):
+			return weight[relation[:1]]
+		return torch.index_select(weight, dim=0, index=relation)
+
+	def entity_lookup(self, model, index):
+		'''
+        Rows of the entity embedding table, as sparse-gradient lookups in 'sparse_embedding' mode
+        '''
+		if self.args.get('sparse_embedding', False):
+			return F.embedding(index, model.entity_embedding, sparse=True)
+		return torch.index_select(model.entity_embedding, dim=0, index=index)
 
-		loss.backward()
+	def train_step(self, model, optimizer, train_iterator, args):
+		'''
+        A single train step. Apply back-propation and return the loss,
+        'data_wait' is the time spent waiting for the batch and 'step_time' the time of the whole step (seconds),
+        the data, forward, backward and optimizer phases are timed by the profiler
+        '''
+		step_start = time.perf_counter()
+		profiler = self.profiler
 
-		optimizer.step()
+		model.train()
+
+		optimizer.zero_grad()
+
+		with profiler.phase('data'):
+			positive_sample, negative_sample, subsampling_weight, mode = next(train_iterator)
+			data_wait = time.perf_counter() - step_start
+
+			if args['gpu']:
+				positive_sample = positive_sample.cuda(non_blocking=True)
+				negative_sample = negative_sample.cuda(non_blocking=True)
+				subsampling_weight = subsampling_weight.cuda(non_blocking=True)
+
+		with profiler.phase('forward'):
+			if args.get('neg_chunk_size'):
+				negative_score = self.chunked_forward(model, (positive_sample, negative_sample), mode, args['neg_chunk_size'])
+			else:
+				negative_score = self.forward(model, (positive_sample, negative_sample), mode=mode)
+
+			if args['negative_adversarial_sampling']:
+				# In self-adversarial sampling, we do not apply back-propagation on the sampling weight
+				negative_score = (F.softmax(negative_score * args['adversarial_temperature'], dim=1).detach()
+								  * F.logsigmoid(-negative_score)).sum(dim=1)
+			else:
+				negative_score = F.logsigmoid(-negative_score).mean(dim=1)
+
+			positive_score = self.forward(model, positive_sample)
+
+			positive_score = F.logsigmoid(positive_score).squeeze(dim=1)
+
+			if args['uni_weight']:
+				positive_sample_loss = - positive_score.mean()
+				negative_sample_loss = - negative_score.mean()
+			else:
+				positive_sample_loss = - (subsampling_weight * positive_score).sum() / subsampling_weight.sum()
+				negative_sample_loss = - (subsampling_weight * negative_score).sum() / subsampling_weight.sum()
+
+			loss = (positive_sample_loss + negative_sample_loss) / 2
+
+			if args['regularization'] != 0.0:
+				# Use L3 regularization for ComplEx and DistMult
+				regularization = args.regularization * (
+						model.entity_embedding.norm(p=3) ** 3 +
+						model.relation_embedding.norm(p=3).norm(p=3) ** 3
+				)
+				loss = loss + regularization
+				regularization_log = {'regularization': regularization.item()}
+			else:
+				regularization_log = {}
+
+		with profiler.phase('backward'):
+			loss.backward()
+
+		with profiler.phase('optimizer'):
+			optimizer.step()
 
 		log = {
 			**regularization_log,
 			'positive_sample_loss': positive_sample_loss.item(),
 			'negative_sample_loss': negative_sample_loss.item(),
-			'loss': loss.item()
+			'loss': loss.item(),
+			'data_wait': data_wait,
+			'step_time': time.perf_counter() - step_start
 		}
 
 		return log
@@ -355,214 +911,131 @@ class KGLearn_DyTorch(KGLearnModel):
         And the second part is the entities in the negative samples.
         Because negative samples and positive samples usually share two elements
         in their triple ((head, relation) or (relation, tail)).
+        Models exposing a scripted scoring kernel are scored by it directly, together with the rows of their
+        per-relation projection parameter, others through their forward.
         '''
 
 		if mode == 'single':
 			batch_size, negative_sample_size = sample.size(0), 1
 
-			head = torch.index_select(
-				model.entity_embedding,
-				dim=0,
-				index=sample[:, 0]
-			).unsqueeze(1)
+			head = self.entity_lookup(model, sample[:, 0]).unsqueeze(1)
 
+			relation_index = sample[:, 1]
 			relation = torch.index_select(
 				model.relation_embedding,
 				dim=0,
-				index=sample[:, 1]
+				index=relation_index
 			).unsqueeze(1)
 
-			if self.args['model_name'] == 'TransH':
-				norm_r = torch.index_select(
-					model.norm_vector,
-					dim=0,
-					index=sample[:, 1]
-				).unsqueeze(1)
-			elif self.args['model_name'] == 'TransR':
-				r_transfer = torch.index_select(
-					model.transfer_matrix,
-					dim=0,
-					index=sample[:, 1]
-				).unsqueeze(1)
-
-			tail = torch.index_select(
-				model.entity_embedding,
-				dim=0,
-				index=sample[:, 2]
-			).unsqueeze(1)
+			tail = self.entity_lookup(model, sample[:, 2]).unsqueeze(1)
 
 		elif mode == 'head-batch':
 			tail_part, head_part = sample
 			batch_size, negative_sample_size = head_part.size(0), head_part.size(1)
 
-			head = torch.index_select(
-				model.entity_embedding,
-				dim=0,
-				index=head_part.view(-1)
-			).view(batch_size, negative_sample_size, -1)
+			head = self.entity_lookup(model, head_part.view(-1)).view(batch_size, negative_sample_size, -1)
 
+			relation_index = tail_part[:, 1]
 			relation = torch.index_select(
 				model.relation_embedding,
 				dim=0,
-				index=tail_part[:, 1]
+				index=relation_index
 			).unsqueeze(1)
 
-			if self.args['model_name'] == 'TransH':
-				norm_r = torch.index_select(
-					model.norm_vector,
-					dim=0,
-					index=tail_part[:, 1]
-				).unsqueeze(1)
-			elif self.args['model_name'] == 'TransR':
-				r_transfer = torch.index_select(
-					model.transfer_matrix,
-					dim=0,
-					index=tail_part[:, 1]
-				).unsqueeze(1)
-
-			tail = torch.index_select(
-				model.entity_embedding,
-				dim=0,
-				index=tail_part[:, 2]
-			).unsqueeze(1)
+			tail = self.entity_lookup(model, tail_part[:, 2]).unsqueeze(1)
 
 		elif mode == 'tail-batch':
 			head_part, tail_part = sample
 			batch_size, negative_sample_size = tail_part.size(0), tail_part.size(1)
 
-			head = torch.index_select(
-				model.entity_embedding,
-				dim=0,
-				index=head_part[:, 0]
-			).unsqueeze(1)
+			head = self.entity_lookup(model, head_part[:, 0]).unsqueeze(1)
 
+			relation_index = head_part[:, 1]
 			relation = torch.index_select(
 				model.relation_embedding,
 				dim=0,
-				index=head_part[:, 1]
+				index=relation_index
 			).unsqueeze(1)
 
-			if self.args['model_name'] == 'TransH':
-				norm_r = torch.index_select(
-					model.norm_vector,
-					dim=0,
-					index=head_part[:, 1]
-				).unsqueeze(1)
-			elif self.args['model_name'] == 'TransR':
-				r_transfer = torch.index_select(
-					model.transfer_matrix,
-					dim=0,
-					index=head_part[:, 1]
-				).unsqueeze(1)
-
-			tail = torch.index_select(
-				model.entity_embedding,
-				dim=0,
-				index=tail_part.view(-1)
-			).view(batch_size, negative_sample_size, -1)
+			tail = self.entity_lookup(model, tail_part.view(-1)).view(batch_size, negative_sample_size, -1)
 
 		else:
 			raise ValueError('mode %s not supported' % mode)
 
-		if self.args['model_name'] == 'TransH':
-			score = model(head, relation, tail, norm_r, mode)
-		elif self.args['model_name'] == 'TransR':
-			score = model(head, relation, tail, r_transfer, mode)
-		else:
-			score = model(head, relation, tail, mode)
+		kernel = getattr(model, 'kernel', None)
+		if kernel is None:
+			return model(head, relation, tail, mode)
 
-		return score
+		projection = None
+		if model.projection is not None:
+			projection = self.relation_params(getattr(model, model.projection), relation_index).unsqueeze(1)
 
-	def test_step(self, model, test_triples, all_true_triples, args):
+		return kernel(head, relation, tail, projection, float(model.gamma), model.uniform_range, mode)
+
+	def chunked_forward(self, model, sample, mode, chunk_size):
 		'''
-        Evaluate the model on test or valid datasets
+        Negative scores when negatives are shared within chunks of positives.
+        sample is (positive_sample, negative_sample) with negative_sample of shape (num_chunks, negative_sample_size),
+        every chunk_size consecutive positives form a chunk and a short last chunk is padded.
+        Each negative embedding is gathered once per chunk and scored by the model's score_shared.
         '''
+		positive_sample, negative_sample = sample
+		batch_size = positive_sample.size(0)
+		num_chunks, negative_sample_size = negative_sample.size()
 
-		model.eval()
-
-		# Otherwise use standard (filtered) MRR, MR, HITS@1, HITS@3, and HITS@10 metrics
-		# Prepare dataloader for evaluation
-		test_dataloader_head = data.DataLoader(
-			TestDataset(
-				test_triples,
-				all_true_triples,
-				args['nentity'],
-				args['nrelation'],
-				'head-batch'
-			),
-			batch_size=args['test_batch_size'],
-			num_workers=max(1, args['cpu_num'] // 2),
-			collate_fn=TestDataset.collate_fn
-		)
+		if mode == 'head-batch':
+			anchor = self.entity_lookup(model, positive_sample[:, 2])
+		elif mode == 'tail-batch':
+			anchor = self.entity_lookup(model, positive_sample[:, 0])
+		else:
+			raise ValueError('mode %s not supported' % mode)
 
-		test_dataloader_tail = data.DataLoader(
-			TestDataset(
-				test_triples,
-				all_true_triples,
-				args['nentity'],
-				args['nrelation'],
-				'tail-batch'
-			),
-			batch_size=args['test_batch_size'],
-			num_workers=max(1, args['cpu_num'] // 2),
-			collate_fn=TestDataset.collate_fn
+		relation = torch.index_select(
+			model.relation_embedding,
+			dim=0,
+			index=positive_sample[:, 1]
 		)
 
-		test_dataset_list = [test_dataloader_head, test_dataloader_tail]
-
-		logs = []
-
-		step = 0
-		total_steps = sum([len(dataset) for dataset in test_dataset_list])
-
-		with torch.no_grad():
-			for test_dataset in test_dataset_list:
-				for positive_sample, negative_sample, filter_bias, mode in test_dataset:
-					if args['gpu']:
-						positive_sample = positive_sample.cuda()
-						negative_sample = negative_sample.cuda()
-						filter_bias = filter_bias.cuda()
-
-					batch_size = positive_sample.size(0)
-
-					score = self.forward(model, (positive_sample, negative_sample), mode)
-					score += filter_bias
+		negative = self.entity_lookup(model, negative_sample.view(-1)).view(num_chunks, negative_sample_size, -1)
 
-					# Explicitly sort all the entities to ensure that there is no test exposure bias
-					argsort = torch.argsort(score, dim=1, descending=True)
+		padding = num_chunks * chunk_size - batch_size
+		if padding:
+			anchor = F.pad(anchor, (0, 0, 0, padding))
+			relation = F.pad(relation, (0, 0, 0, padding))
 
-					if mode == 'head-batch':
-						positive_arg = positive_sample[:, 0]
-					elif mode == 'tail-batch':
-						positive_arg = positive_sample[:, 2]
-					else:
-						raise ValueError('mode %s not supported' % mode)
-
-					for i in range(batch_size):
-						# Notice that argsort is not ranking
-						ranking = (argsort[i, :] == positive_arg[i]).nonzero()
-						assert ranking.size(0) == 1
-
-						# ranking + 1 is the true ranking used in evaluation metrics
-						ranking = 1 + ranking.item()
-						logs.append({
-							'MRR': 1.0 / ranking,
-							'MR': float(ranking),
-							'HITS@1': 1.0 if ranking <= 1 else 0.0,
-							'HITS@3': 1.0 if ranking <= 3 else 0.0,
-							'HITS@10': 1.0 if ranking <= 10 else 0.0,
-						})
-
-					if step % args['test_log_steps'] == 0:
-						logging.info('Evaluating the model... (%d/%d)' % (step, total_steps))
+		score = model.score_shared(
+			anchor.view(num_chunks, chunk_size, -1),
+			relation.view(num_chunks, chunk_size, -1),
+			negative,
+			mode
+		)
+		return score.reshape(num_chunks * chunk_size, negative_sample_size)[:batch_size]
 
-					step += 1
+	def test_step(self, model, test_triples, all_true_triples, args):
+		'''
+        Evaluate the model on test or valid datasets with standard (filtered) MRR, MR, HITS@1, HITS@3, and HITS@10 metrics
+        '''
 
-		metrics = {}
-		for metric in logs[0].keys():
-			metrics[metric] = sum([log[metric] for log in logs]) / len(logs)
+		model.eval()
 
-		return metrics
+		with self.profiler.phase('eval'):
+			# the known-answer indexes only depend on all_true_triples, keep them across evaluations
+			if getattr(self, '_evaluator_triples', None) is not all_true_triples:
+				self._evaluator = FilteredRankingEvaluator(
+					all_true_triples,
+					args['nentity'],
+					args['nrelation'],
+					batch_size=args['test_batch_size'],
+					chunk_size=args.get('eval_chunk_size')
+				)
+				self._evaluator_triples = all_true_triples
+
+			return self._evaluator.evaluate(
+				lambda positive_sample, candidates, mode: self.forward(model, (positive_sample, candidates), mode),
+				test_triples,
+				device=next(model.parameters()).device,
+				log_steps=args['test_log_steps']
+			)
 
 @KGLearnModel.register("KGLearn_GCN", "PyTorch")
 class KGLearn_GCNTorch(KGLearnModel):
@@ -668,28 +1141,36 @@ class KGLearn_GCNTorch(KGLearnModel):
 		best_score = 0.0
 		criterion = NCESoftmaxLossNS()
 		criterion = criterion.to(device)
+		profiler = PhaseProfiler(profile_dir(self.args), synchronize=torch.cuda.synchronize if self.args['gpu'] else None)
 		# train iteratively
 		for epoch in range(start_epoch, self.args['epoch'] + 1):
 			print("Starting epoch: ", epoch)
 			run_loss = 0
 			model.train()
 			# train in a batch
-			for idx, batch in enumerate(self.train_loader):
+			for idx, batch in enumerate(profiler.iterate(self.train_loader, name='data')):
 				graph_q, graph_k = batch
-				graph_q.to(device)
-				graph_k.to(device)
-				bsz = graph_q.batch_size
-				feat_q = model(graph_q)
-				feat_k = model(graph_k)
-
-				out = torch.matmul(feat_k, feat_q.t()) / self.args["nce_t"]
-				prob = out[range(graph_q.batch_size), range(graph_q.batch_size)].mean()
-				opt.zero_grad()
-
-				loss = criterion(out)
-				loss.backward()
+				# the copy to the device is timed apart from the batch fetch
+				with profiler.phase('h2d'):
+					graph_q.to(device)
+					graph_k.to(device)
+				with profiler.phase('forward'):
+					bsz = graph_q.batch_size
+					feat_q = model(graph_q)
+					feat_k = model(graph_k)
+
+					out = torch.matmul(feat_k, feat_q.t()) / self.args["nce_t"]
+					prob = out[range(graph_q.batch_size), range(graph_q.batch_size)].mean()
+					opt.zero_grad()
+
+					loss = criterion(out)
+				with profiler.phase('backward'):
+					loss.backward()
 				run_loss += loss.mean().item()
-				opt.step()
+				with profiler.phase('optimizer'):
+					opt.step()
+				profiler.step()
 
 			print("Loss: " + str(run_loss))
+		profiler.export()
 
@@ -6,10 +6,14 @@ import torch
 import torch.nn as nn
 import numpy as np
 from ...model import TorchModel
+from .kernels import rotate_kernel, RotateSharedDistance, MODULUS_EPS, SHARED_SLICE_ELEMENTS
 
 
 @TorchModel.register("RotatE", "PyTorch")
 class RotatE(TorchModel):
+	kernel = rotate_kernel
+	projection = None
+
 	def __init__(self, **kwargs):
 		super(RotatE, self).__init__()
 		self.num_entity = kwargs['num_entity']
@@ -41,12 +45,18 @@ class RotatE(TorchModel):
 
 
 	def forward(self, head, relation, tail, mode):
+		return self.kernel(head, relation, tail, None, float(self.gamma), self.uniform_range, mode)
+
+	def score_shared(self, anchor, relation, negative, mode):
+		"""
+		scores of chunks of positives against the negatives shared by each chunk
+		anchor, relation: (num_chunks, chunk_size, dim) embeddings of the kept entity and relation, negative: (num_chunks, neg, dim)
+		returns (num_chunks, chunk_size, neg), the rotated anchor is computed once per positive instead of once per negative
+		and the moduli are computed slice by slice of chunks
+		"""
 		pi = 3.14159265358979323846
 
-		re_head, im_head = torch.chunk(head, 2, dim=2)
-		re_tail, im_tail = torch.chunk(tail, 2, dim=2)
-
-		# Make phases of relations uniformly distributed in [-pi, pi]
+		re_anchor, im_anchor = torch.chunk(anchor, 2, dim=2)
 
 		phase_relation = relation / (self.uniform_range / pi)
 
@@ -54,18 +64,11 @@ class RotatE(TorchModel):
 		im_relation = torch.sin(phase_relation)
 
 		if mode == 'head-batch':
-			re_score = re_relation * re_tail + im_relation * im_tail
-			im_score = re_relation * im_tail - im_relation * re_tail
-			re_score = re_score - re_head
-			im_score = im_score - im_head
+			re_query = re_relation * re_anchor + im_relation * im_anchor
+			im_query = re_relation * im_anchor - im_relation * re_anchor
 		else:
-			re_score = re_head * re_relation - im_head * im_relation
-			im_score = re_head * im_relation + im_head * re_relation
-			re_score = re_score - re_tail
-			im_score = im_score - im_tail
-
-		score = torch.stack([re_score, im_score], dim=0)
-		score = score.norm(dim=0)
+			re_query = re_anchor * re_relation - im_anchor * im_relation
+			im_query = re_anchor * im_relation + im_anchor * re_relation
 
-		score = self.gamma - score.sum(dim=2)
-		return score
+		query = torch.cat([re_query, im_query], dim=2)
+		return self.gamma - RotateSharedDistance.apply(query, negative, MODULUS_EPS, SHARED_SLICE_ELEMENTS)
@@ -6,10 +6,14 @@ import torch
 import torch.nn as nn
 import numpy as np
 from ...model import TorchModel
+from .kernels import transe_kernel
 
 
 @TorchModel.register("TransE", "PyTorch")
 class TransE(TorchModel):
+	kernel = transe_kernel
+	projection = None
+
 	def __init__(self, **kwargs):
 		super(TransE, self).__init__()
 		self.num_entity = kwargs['num_entity']
@@ -46,13 +50,19 @@ class TransE(TorchModel):
 		'''
 
 	def forward(self, head, relation, tail, mode):
+		return self.kernel(head, relation, tail, None, float(self.gamma), self.uniform_range, mode)
+
+	def score_shared(self, anchor, relation, negative, mode):
+		"""
+		scores of chunks of positives against the negatives shared by each chunk
+		anchor, relation: (num_chunks, chunk_size, dim) embeddings of the kept entity and relation, negative: (num_chunks, neg, dim)
+		returns (num_chunks, chunk_size, neg), distances are computed pairwise with cdist instead of broadcasting
+		"""
 		if mode == 'head-batch':
-			score = head + (relation - tail)
+			query = anchor - relation
 		else:
-			score = (head + relation) - tail
-
-		score = self.gamma - torch.norm(score, p=1, dim=2)
-		return score
+			query = anchor + relation
+		return self.gamma - torch.cdist(query, negative, p=1)
 
 	'''
 	def _algorithm(self, triples):
@@ -7,10 +7,14 @@ import torch.nn as nn
 import torch.nn.functional as F
 import numpy as np
 from ...model import TorchModel
+from .kernels import transh_kernel
 
 
 @TorchModel.register("TransH", "PyTorch")
 class TransH(TorchModel):
+	kernel = transh_kernel
+	projection = 'norm_vector'
+
 	def __init__(self, **kwargs):
 		super(TransH, self).__init__()
 		self.num_entity = kwargs['num_entity']
@@ -57,28 +61,7 @@ class TransH(TorchModel):
 		'''
 
 	def forward(self, head, relation, tail, r_norm, mode):
-		h = self._transfer(head, r_norm)
-		t = self._transfer(tail, r_norm)
-		if mode == 'head-batch':
-			score = h + (relation - t)
-		else:
-			score = (h + relation) - t
-
-		score = self.gamma - torch.norm(score, p=1, dim=2)
-		return score
-
-	def _transfer(self, e, norm):
-		norm = F.normalize(norm, p=2, dim=-1)
-		assert e.shape[0] == norm.shape[0]
-		'''
-		if e.shape[0] != norm.shape[0]:
-			e = e.view(-1, norm.shape[0], e.shape[-1])
-			norm = norm.view(-1, norm.shape[0], norm.shape[-1])
-			e = e - torch.sum(e * norm, -1, True) * norm
-			return e.view(-1, e.shape[-1])
-		else:
-		'''
-		return e - torch.sum(e * norm, -1, True) * norm
+		return self.kernel(head, relation, tail, r_norm, float(self.gamma), self.uniform_range, mode)
 
 	'''
 	def _algorithm(self, triples):
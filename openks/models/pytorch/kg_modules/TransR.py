@@ -7,10 +7,14 @@ import torch.nn as nn
 import torch.nn.functional as F
 import numpy as np
 from ...model import TorchModel
+from .kernels import transr_kernel
 
 
 @TorchModel.register("TransR", "PyTorch")
 class TransR(TorchModel):
+	kernel = transr_kernel
+	projection = 'transfer_matrix'
+
 	def __init__(self, **kwargs):
 		super(TransR, self).__init__()
 		self.num_entity = kwargs['num_entity']
@@ -49,24 +53,11 @@ class TransR(TorchModel):
 		# nn.init.xavier_uniform_(self.entities_emb.weight.data)
 		# nn.init.xavier_uniform_(self.relations_emb.weight.data)
 		
-		identity = torch.zeros(self.entity_dim, self.relation_dim)
-		for i in range(min(self.entity_dim, self.relation_dim)):
-			identity[i][i] = 1
-		identity = identity.view(self.relation_dim * self.entity_dim)
-		for i in range(self.num_relation):
-			self.transfer_matrix.data[i] = identity
+		identity = torch.eye(self.entity_dim, self.relation_dim).view(self.entity_dim * self.relation_dim)
+		self.transfer_matrix.data.copy_(identity.expand(self.num_relation, -1))
 
 	def forward(self, head, relation, tail, r_transfer, mode):
-		r_transfer = r_transfer.view(-1, self.entity_dim, self.relation_dim)
-		h = self._transfer(head, r_transfer)
-		t = self._transfer(tail, r_transfer)
-		if mode == 'head-batch':
-			score = h + (relation - t)
-		else:
-			score = (h + relation) - t
-
-		score = self.gamma - torch.norm(score, p=1, dim=2)
-		return score
+		return self.kernel(head, relation, tail, r_transfer, float(self.gamma), self.uniform_range, mode)
 
 	'''
 	def _algorithm(self, triples):
@@ -82,19 +73,6 @@ class TransR(TorchModel):
 		return score
 	'''
 
-	def _transfer(self, e, r_transfer):
-		assert e.shape[0] == r_transfer.shape[0] and e.ndim == 3
-		return torch.matmul(e, r_transfer)
-		'''
-		if e.shape[0] != r_transfer.shape[0]:
-			e = e.view(-1, r_transfer.shape[0], self.entity_size).permute(1, 0, 2)
-			e = torch.matmul(e, r_transfer).permute(1, 0, 2)
-		else:
-			e = e.view(-1, 1, self.entity_size)
-			e = torch.matmul(e, r_transfer)
-		return e.view(-1, self.relation_size)
-		'''
-
 	'''
 	def loss(self, positive_score, negative_score):
 		"""graph embedding loss function"""
@@ -0,0 +1,136 @@
+# Copyright (c) 2021 OpenKS Authors, DCD Research Lab, Zhejiang University.
+# All Rights Reserved.
+
+"""
+TorchScript scoring kernels of the translational and rotational embedding models.
+All kernels share one signature so the trainer gathers embeddings and calls a kernel without branching on the model:
+kernel(head, relation, tail, projection, gamma, uniform_range, mode) -> (batch, negative_sample_size) scores,
+head / relation / tail broadcast over (batch, negative_sample_size, dim), projection holds the gathered
+per-relation parameters of models that project entities (None otherwise).
+"""
+from typing import Optional
+import torch
+
+# added under the square root of complex moduli, sqrt is not differentiable at 0
+MODULUS_EPS = 1e-12
+# elements of the pairwise differences materialised at once by RotateSharedDistance
+SHARED_SLICE_ELEMENTS = 1 << 24
+
+
+@torch.jit.script
+def transe_kernel(head: torch.Tensor, relation: torch.Tensor, tail: torch.Tensor, projection: Optional[torch.Tensor], gamma: float, uniform_range: float, mode: str) -> torch.Tensor:
+	if mode == 'head-batch':
+		score = head + (relation - tail)
+	else:
+		score = (head + relation) - tail
+	return gamma - score.abs().sum(dim=2)
+
+
+@torch.jit.script
+def transh_kernel(head: torch.Tensor, relation: torch.Tensor, tail: torch.Tensor, projection: Optional[torch.Tensor], gamma: float, uniform_range: float, mode: str) -> torch.Tensor:
+	assert projection is not None
+	norm = torch.nn.functional.normalize(projection, p=2.0, dim=-1)
+	h = head - (head * norm).sum(dim=-1, keepdim=True) * norm
+	t = tail - (tail * norm).sum(dim=-1, keepdim=True) * norm
+	if mode == 'head-batch':
+		score = h + (relation - t)
+	else:
+		score = (h + relation) - t
+	return gamma - score.abs().sum(dim=2)
+
+
+@torch.jit.script
+def transr_kernel(head: torch.Tensor, relation: torch.Tensor, tail: torch.Tensor, projection: Optional[torch.Tensor], gamma: float, uniform_range: float, mode: str) -> torch.Tensor:
+	assert projection is not None
+	matrix = projection.reshape(-1, head.size(-1), relation.size(-1))
+	if matrix.size(0) == 1:
+		# one relation for the whole batch: a single matmul instead of a batch of copies of the matrix
+		h = torch.matmul(head.reshape(-1, head.size(-1)), matrix[0]).view(head.size(0), head.size(1), -1)
+		t = torch.matmul(tail.reshape(-1, tail.size(-1)), matrix[0]).view(tail.size(0), tail.size(1), -1)
+	else:
+		h = torch.matmul(head, matrix)
+		t = torch.matmul(tail, matrix)
+	if mode == 'head-batch':
+		score = h + (relation - t)
+	else:
+		score = (h + relation) - t
+	return gamma - score.abs().sum(dim=2)
+
+
+@torch.jit.script
+def rotate_kernel(head: torch.Tensor, relation: torch.Tensor, tail: torch.Tensor, projection: Optional[torch.Tensor], gamma: float, uniform_range: float, mode: str) -> torch.Tensor:
+	re_head, im_head = torch.chunk(head, 2, dim=2)
+	re_tail, im_tail = torch.chunk(tail, 2, dim=2)
+
+	# phases of relations uniformly distributed in [-pi, pi]
+	phase_relation = relation / (uniform_range / 3.14159265358979323846)
+	re_relation = torch.cos(phase_relation)
+	im_relation = torch.sin(phase_relation)
+
+	if mode == 'head-batch':
+		re_score = re_relation * re_tail + im_relation * im_tail
+		im_score = re_relation * im_tail - im_relation * re_tail
+		re_score = re_score - re_head
+		im_score = im_score - im_head
+	else:
+		re_score = re_head * re_relation - im_head * im_relation
+		im_score = re_head * im_relation + im_head * re_relation
+		re_score = re_score - re_tail
+		im_score = im_score - im_tail
+
+	# modulus of the complex difference without materialising the stacked (2, ...) tensor,
+	# MODULUS_EPS (scripted functions cannot read module globals) keeps the gradient finite where the difference is exactly 0
+	return gamma - torch.sqrt(re_score * re_score + im_score * im_score + 1e-12).sum(dim=2)
+
+
+@torch.jit.script
+def rotate_shared_distance(query: torch.Tensor, negative: torch.Tensor, eps: float) -> torch.Tensor:
+	re_query, im_query = torch.chunk(query, 2, dim=2)
+	re_negative, im_negative = torch.chunk(negative, 2, dim=2)
+	re_score = re_query.unsqueeze(2) - re_negative.unsqueeze(1)
+	im_score = im_query.unsqueeze(2) - im_negative.unsqueeze(1)
+	return torch.sqrt(re_score * re_score + im_score * im_score + eps).sum(dim=3)
+
+
+@torch.jit.script
+def rotate_shared_distance_grad(query: torch.Tensor, negative: torch.Tensor, grad: torch.Tensor, eps: float):
+	re_query, im_query = torch.chunk(query, 2, dim=2)
+	re_negative, im_negative = torch.chunk(negative, 2, dim=2)
+	re_score = re_query.unsqueeze(2) - re_negative.unsqueeze(1)
+	im_score = im_query.unsqueeze(2) - im_negative.unsqueeze(1)
+	weight = grad.unsqueeze(3) / torch.sqrt(re_score * re_score + im_score * im_score + eps)
+	re_score = re_score * weight
+	im_score = im_score * weight
+	grad_query = torch.cat([re_score.sum(dim=2), im_score.sum(dim=2)], dim=2)
+	grad_negative = -torch.cat([re_score.sum(dim=1), im_score.sum(dim=1)], dim=2)
+	return grad_query, grad_negative
+
+
+class RotateSharedDistance(torch.autograd.Function):
+	"""
+	sum over dimensions of the complex moduli between rotated queries (num_chunks, chunk_size, dim) and the negatives
+	shared by each chunk (num_chunks, neg, dim), returns (num_chunks, chunk_size, neg).
+	Chunks are processed max_elements at a time in forward and backward and nothing of size
+	num_chunks x chunk_size x neg x dim is kept for backward, the pairwise differences are recomputed per slice.
+	"""
+	@staticmethod
+	def forward(ctx, query, negative, eps, max_elements):
+		ctx.save_for_backward(query, negative)
+		ctx.eps = eps
+		ctx.step = max(1, max_elements // max(1, query.size(1) * negative.size(1) * query.size(2)))
+		score = query.new_empty(query.size(0), query.size(1), negative.size(1))
+		for i in range(0, query.size(0), ctx.step):
+			score[i:i + ctx.step] = rotate_shared_distance(query[i:i + ctx.step], negative[i:i + ctx.step], eps)
+		return score
+
+	@staticmethod
+	def backward(ctx, grad):
+		query, negative = ctx.saved_tensors
+		grad_query = torch.empty_like(query)
+		grad_negative = torch.empty_like(negative)
+		grad = grad.contiguous()
+		for i in range(0, query.size(0), ctx.step):
+			grad_query[i:i + ctx.step], grad_negative[i:i + ctx.step] = rotate_shared_distance_grad(
+				query[i:i + ctx.step], negative[i:i + ctx.step], grad[i:i + ctx.step], ctx.eps
+			)
+		return grad_query, grad_negative, None, None
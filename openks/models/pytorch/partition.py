@@ -0,0 +1,162 @@
+# Copyright (c) 2021 OpenKS Authors, DCD Research Lab, Zhejiang University.
+# All Rights Reserved.
+
+"""
+Entity partitions on disk for PyTorch-BigGraph style out-of-core embedding training
+"""
+import os
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Tuple
+import numpy as np
+import torch
+from ...abstract.graph_index import CSRIndex
+
+logger = logging.getLogger(__name__)
+
+
+class EntityPartitions(object):
+	"""
+	Entity embeddings split into num_partitions contiguous id ranges.
+	Every partition keeps its embedding rows and one row-wise Adagrad accumulator per entity as .npy files under path,
+	only the partitions being trained are read into memory.
+	"""
+	def __init__(self, path: str, nentity: int, dim: int, num_partitions: int, init_range: float, chunk_rows: int = 1 << 20) -> None:
+		self.path = path
+		self.nentity = nentity
+		self.dim = dim
+		self.num_partitions = num_partitions
+		self.bounds = np.arange(num_partitions + 1, dtype=np.int64) * nentity // num_partitions
+		if not os.path.exists(path):
+			os.makedirs(path)
+		for part in range(num_partitions):
+			size = self.size(part)
+			embedding = np.lib.format.open_memmap(self._file(part, 'embedding'), mode='w+', dtype=np.float32, shape=(size, dim))
+			for start in range(0, size, chunk_rows):
+				rows = min(chunk_rows, size - start)
+				embedding[start:start+rows] = np.random.uniform(-init_range, init_range, (rows, dim))
+			embedding.flush()
+			state = np.lib.format.open_memmap(self._file(part, 'state'), mode='w+', dtype=np.float32, shape=(size,))
+			state.flush()
+			del embedding, state
+
+	def _file(self, part: int, kind: str) -> str:
+		return os.path.join(self.path, '%s_%d.npy' % (kind, part))
+
+	def size(self, part: int) -> int:
+		return int(self.bounds[part + 1] - self.bounds[part])
+
+	def partition_of(self, entity_ids: np.ndarray) -> np.ndarray:
+		return np.searchsorted(self.bounds, entity_ids, side='right') - 1
+
+	def load(self, part: int) -> Tuple[torch.Tensor, torch.Tensor]:
+		""" embedding rows and Adagrad state of a partition, read into memory """
+		return torch.from_numpy(np.load(self._file(part, 'embedding'))), torch.from_numpy(np.load(self._file(part, 'state')))
+
+	def save(self, part: int, embedding: torch.Tensor, state: torch.Tensor) -> None:
+		for kind, value in (('embedding', embedding), ('state', state)):
+			stored = np.load(self._file(part, kind), mmap_mode='r+')
+			stored[:] = value.detach().cpu().numpy()
+			stored.flush()
+			del stored
+
+	def export(self, file: str) -> None:
+		""" write all partitions into one (nentity, dim) .npy file, one partition at a time """
+		out = np.lib.format.open_memmap(file, mode='w+', dtype=np.float32, shape=(self.nentity, self.dim))
+		for part in range(self.num_partitions):
+			out[self.bounds[part]:self.bounds[part+1]] = np.load(self._file(part, 'embedding'), mmap_mode='r')
+		out.flush()
+		del out
+
+
+class EdgeBuckets(object):
+	""" triples grouped by (head partition, tail partition), bucket (i, j) is triples[indptr[k]:indptr[k+1]] for its key k """
+	def __init__(self, triples, partitions: EntityPartitions) -> None:
+		triples = np.asarray(triples, dtype=np.int64).reshape(-1, 3)
+		num_partitions = partitions.num_partitions
+		index = CSRIndex(partitions.partition_of(triples[:, 0]) * num_partitions + partitions.partition_of(triples[:, 2]))
+		self.num_partitions = num_partitions
+		self.triples = triples[index.order]
+		self.keys = index.keys
+		self.indptr = index.indptr
+
+	def bucket(self, head_part: int, tail_part: int) -> np.ndarray:
+		key = head_part * self.num_partitions + tail_part
+		i = int(np.searchsorted(self.keys, key))
+		if i >= len(self.keys) or self.keys[i] != key:
+			return self.triples[:0]
+		return self.triples[self.indptr[i]:self.indptr[i+1]]
+
+
+def bucket_schedule(num_partitions: int) -> List[Tuple[int, int]]:
+	""" all (head partition, tail partition) buckets in snake order, consecutive buckets share at least one partition """
+	order = []
+	for i in range(num_partitions):
+		tails = range(num_partitions) if i % 2 == 0 else reversed(range(num_partitions))
+		order.extend((i, j) for j in tails)
+	return order
+
+
+class PartitionSwapper(object):
+	"""
+	Keeps the partitions of the current bucket in memory.
+	Partitions of the next bucket are read and evicted ones are written back by one background thread,
+	so disk traffic overlaps training and a read always follows the pending write of the same partition.
+	"""
+	def __init__(self, partitions: EntityPartitions) -> None:
+		self.partitions = partitions
+		self.resident = {}
+		self.pending = {}
+		self.executor = ThreadPoolExecutor(max_workers=1)
+
+	def acquire(self, parts) -> None:
+		""" make exactly parts resident, writing back the others """
+		for part in list(self.resident):
+			if part not in parts:
+				self.executor.submit(self.partitions.save, part, *self.resident.pop(part))
+		for part in parts:
+			if part not in self.resident:
+				future = self.pending.pop(part, None)
+				self.resident[part] = future.result() if future is not None else self.executor.submit(self.partitions.load, part).result()
+
+	def prefetch(self, parts) -> None:
+		for part in parts:
+			if part not in self.resident and part not in self.pending:
+				self.pending[part] = self.executor.submit(self.partitions.load, part)
+
+	def close(self) -> None:
+		""" write back all resident partitions and wait for the background thread """
+		self.acquire(())
+		for future in self.pending.values():
+			future.result()
+		self.pending = {}
+		self.executor.shutdown(wait=True)
+
+
+class RowAdagrad(object):
+	"""
+	Adagrad with one accumulator per embedding row as in PyTorch-BigGraph, stepping only the rows with a gradient.
+	Optimizer interface for the entity rows of the resident partitions.
+	"""
+	def __init__(self, param: torch.Tensor, state: torch.Tensor, lr: float, eps: float = 1e-10) -> None:
+		self.param = param
+		self.state = state
+		self.lr = lr
+		self.eps = eps
+
+	def zero_grad(self) -> None:
+		self.param.grad = None
+
+	def step(self) -> None:
+		grad = self.param.grad
+		if grad is None:
+			return
+		if grad.is_sparse:
+			grad = grad.coalesce()
+			rows, values = grad.indices()[0], grad.values()
+		else:
+			rows = grad.abs().sum(dim=1).nonzero().squeeze(1)
+			values = grad[rows]
+		with torch.no_grad():
+			self.state.index_add_(0, rows, values.pow(2).mean(dim=1))
+			self.param.index_add_(0, rows, -self.lr * values / (self.state[rows].sqrt() + self.eps).unsqueeze(1))
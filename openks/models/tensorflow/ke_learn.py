@@ -12,6 +12,7 @@ from .utils import extract_kvpairs_in_bio, cal_f1_score, cal_f1_score_org_pro, l
 from .utils import DataProcessor_LSTM as DataProcessor
 from .utils import DataProcessor_LSTM_for_sentences as DataProcessor_predict
 from ..model import logger
+from ...common.profiler import PhaseProfiler, profile_dir
 
 @KELearnModel.register("KELearn", "TensorFlow")
 class KELearnTorch(KELearnModel):
@@ -211,11 +212,14 @@ class KELearnTorch(KELearnModel):
             batches = 0
             best_f1 = 0
             batch_size = 32
+            # a session run executes forward, backward and optimizer ops together, timed as 'compute'
+            profiler = PhaseProfiler(profile_dir(self.args))
 
             while epoches < 20:
-                (inputs_seq_batch, 
-                inputs_seq_len_batch,
-                outputs_seq_batch) = data_processor_train.get_batch(batch_size)
+                with profiler.phase('data'):
+                    (inputs_seq_batch, 
+                    inputs_seq_len_batch,
+                    outputs_seq_batch) = data_processor_train.get_batch(batch_size)
                 
                 feed_dict = {
                     model.inputs_seq: inputs_seq_batch,
@@ -234,7 +238,8 @@ class KELearnTorch(KELearnModel):
                     logger.info("output_seq: " + " ".join([self.i2w_bio[i] for i in outputs_seq_batch[0]]))
                     logger.info("###############################")
                 
-                loss, _ = sess.run([model.loss, model.train_op], feed_dict)
+                with profiler.phase('compute'):
+                    loss, _ = sess.run([model.loss, model.train_op], feed_dict)
                 losses.append(loss)
                 batches += 1
                 
@@ -298,11 +303,16 @@ class KELearnTorch(KELearnModel):
                     logger.info("Loss: {}".format(sum(losses) / len(losses)))
                     losses = []
                     
-                    p, r, f1 = valid(data_processor_valid, max_batches=10)
+                    with profiler.phase('eval'):
+                        p, r, f1 = valid(data_processor_valid, max_batches=10)
                     if f1 > best_f1:
                         best_f1 = f1
                         ckpt_save_path = self.args["model_dir"] + "model.ckpt".format(batches)
                         logger.info("Path of ckpt: {}".format(ckpt_save_path))
-                        saver.save(sess, ckpt_save_path)
+                        with profiler.phase('checkpoint'):
+                            saver.save(sess, ckpt_save_path)
                         logger.info("############# best performance now here ###############")
+                profiler.step()
+
+            profiler.export()
                     
@@ -10,6 +10,7 @@ import random as rd
 import tensorflow as tf
 import multiprocessing
 from ..model import RecModel
+from ...common.profiler import PhaseProfiler, profile_dir
 
 @RecModel.register("recommendation", "TensorFlow")
 class RecTF(RecModel):
@@ -350,6 +351,8 @@ class RecTF(RecModel):
 		sess = tf.Session(config=config)
 		sess.run(tf.global_variables_initializer())
 		best_res = 0.
+		# a session run executes forward, backward and optimizer ops together, timed as 'compute'
+		profiler = PhaseProfiler(profile_dir(self.args))
 
 
 		for epoch in range(self.args['epoch']):
@@ -357,18 +360,21 @@ class RecTF(RecModel):
 			loss, mf_loss, emb_loss, reg_loss = 0., 0., 0., 0.
 			n_batch = n_train // self.args['batch_size'] + 1
 			for idx in range(n_batch):
-				users, pos_items, neg_items = self.sample(self.args['batch_size'])
-				_, batch_loss, batch_mf_loss, batch_emb_loss, batch_reg_loss = sess.run(
-					[model.opt, model.loss, model.mf_loss, model.emb_loss, model.reg_loss],
-					feed_dict={model.users: users, 
-							model.pos_items: pos_items,
-							model.node_dropout: eval(self.args['node_dropout']), 
-							model.mess_dropout: eval(self.args['mess_dropout']),
-							model.neg_items: neg_items})
+				with profiler.phase('data'):
+					users, pos_items, neg_items = self.sample(self.args['batch_size'])
+				with profiler.phase('compute'):
+					_, batch_loss, batch_mf_loss, batch_emb_loss, batch_reg_loss = sess.run(
+						[model.opt, model.loss, model.mf_loss, model.emb_loss, model.reg_loss],
+						feed_dict={model.users: users, 
+								model.pos_items: pos_items,
+								model.node_dropout: eval(self.args['node_dropout']), 
+								model.mess_dropout: eval(self.args['mess_dropout']),
+								model.neg_items: neg_items})
 				loss += batch_loss
 				mf_loss += batch_mf_loss
 				emb_loss += batch_emb_loss
 				reg_loss += batch_reg_loss
+				profiler.step()
 
 			if np.isnan(loss) == True:
 				print('ERROR: loss is nan.')
@@ -381,7 +387,8 @@ class RecTF(RecModel):
 
 			t2 = time()
 			users_to_test = list(test_set.keys())
-			res = self.evaluate(sess, model, users_to_test, self.args['batch_size'], drop_flag=True)
+			with profiler.phase('eval'):
+				res = self.evaluate(sess, model, users_to_test, self.args['batch_size'], drop_flag=True)
 
 			t3 = time()
 
@@ -399,5 +406,7 @@ class RecTF(RecModel):
 				break
 
 			if res['recall'][0] == best_res and args.save_flag == 1:
-				save_saver.save(sess, self.args['model_dir'] + '/weights', global_step=epoch)
+				with profiler.phase('checkpoint'):
+					save_saver.save(sess, self.args['model_dir'] + '/weights', global_step=epoch)
 				print('save the weights in path: ', self.args['model_dir'])
+		profiler.export()
@@ -0,0 +1,51 @@
+# Copyright (c) 2021 OpenKS Authors, DCD Research Lab, Zhejiang University.
+# All Rights Reserved.
+
+"""
+Recording stand-in for a neo4j connection, checks the bulk import without a database
+"""
+from typing import Dict, List, Tuple
+
+__all__ = ['RecordingGraphDB', 'RecordingTransaction']
+
+
+class RecordedResult(object):
+	""" result of a recorded statement, evaluate() answers whether the database holds nodes """
+	def __init__(self, value=None) -> None:
+		self.value = value
+
+	def evaluate(self):
+		return self.value
+
+
+class RecordingTransaction(object):
+	""" explicit transaction of RecordingGraphDB, its statements are added to the database batches on commit """
+	def __init__(self, graph_db: 'RecordingGraphDB') -> None:
+		self.graph_db = graph_db
+		self.statements = []
+
+	def run(self, query: str, parameters: Dict = None) -> RecordedResult:
+		self.statements.append((query, parameters))
+		return RecordedResult()
+
+	def commit(self) -> None:
+		self.graph_db.batches.append(self.statements)
+
+
+class RecordingGraphDB(object):
+	"""
+	Takes the place of a py2neo Graph in GraphLoader.bulk2neo: statements run outside transactions are kept
+	in statements and every committed transaction in batches, both as (query, parameters) pairs.
+	A database created with populated=True reports that it holds nodes.
+	"""
+	def __init__(self, populated: bool = False) -> None:
+		self.populated = populated
+		self.statements: List[Tuple[str, Dict]] = []
+		self.batches: List[List[Tuple[str, Dict]]] = []
+
+	def run(self, query: str, parameters: Dict = None) -> RecordedResult:
+		self.statements.append((query, parameters))
+		return RecordedResult(self.populated)
+
+	def begin(self) -> RecordingTransaction:
+		return RecordingTransaction(self)
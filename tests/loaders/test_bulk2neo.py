@@ -0,0 +1,39 @@
+# Copyright (c) 2021 OpenKS Authors, DCD Research Lab, Zhejiang University.
+# All Rights Reserved.
+
+from openks.abstract import MTG
+from openks.loaders import GraphLoader
+
+from recording_db import RecordingGraphDB
+
+schema = [
+	{'type': 'entity', 'concept': 'company', 'properties': [{'name': 'name', 'range': 'str'}]},
+	{'type': 'entity', 'concept': 'person', 'properties': [{'name': 'name', 'range': 'str'}]},
+	{'type': 'relation', 'concept': 'invest', 'properties': [{'name': 'name', 'range': 'str'}], 'members': ['person', 'company']}
+]
+entities = [(0, 'company', ('A',)), (1, 'company', ('B',)), (2, 'person', ('C',))]
+# the 'unknown' relation has no schema, so its head and tail labels are unknown and it is skipped
+triples = [((2, 'invest', 0), ('invest',)), ((2, 'invest', 1), ('invest',)), ((0, 'unknown', 1), ())]
+
+
+def make_graph():
+	return MTG(name='dry-run', schema=schema, entities=entities, triples=triples)
+
+
+def test_bulk2neo_statements():
+	graph_db = RecordingGraphDB()
+	GraphLoader.bulk2neo(make_graph(), graph_db, batch_size=1)
+	assert [query for query, _ in graph_db.statements if query.startswith('CREATE INDEX')] == [
+		'CREATE INDEX IF NOT EXISTS FOR (n:`company`) ON (n.gid)',
+		'CREATE INDEX IF NOT EXISTS FOR (n:`person`) ON (n.gid)'
+	]
+	# 2 company nodes, 1 person node and 2 invest edges, one row per batch
+	assert len(graph_db.batches) == 5
+	assert all('unknown' not in query for batch in graph_db.batches for query, _ in batch)
+
+
+def test_bulk2neo_keeps_populated_database():
+	graph_db = RecordingGraphDB(populated=True)
+	GraphLoader.bulk2neo(make_graph(), graph_db, clean=False)
+	assert graph_db.batches == []
+	assert [query for query, _ in graph_db.statements] == ['MATCH (n) RETURN count(n) > 0']